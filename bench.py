@@ -0,0 +1,706 @@
+"""
+Benchmarks for the Software Testing Agent MCP server.
+
+Usage:
+    python bench.py maven --project codebase --iterations 5 --backends cold,mvnd
+    python bench.py git --repo . --iterations 50
+    python bench.py symbols --classes 10000 --methods 20
+    python bench.py suite --classes 1000 --methods 10 --baseline bench-baseline.json
+
+Results are printed as JSON. `suite` builds a synthetic Java project (sources,
+JaCoCo XML, Surefire reports, git history), times the server's hot paths in
+one fresh subprocess per case (wall time + peak RSS) and compares the result
+with the JSON baseline; it exits with status 1 when a case failed or regressed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import server
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, Any]:
+    """
+    First sample = cold start, the rest = warm iterations.
+    """
+    warm = samples[1:]
+    return {
+        "samples": [round(s, 3) for s in samples],
+        "first": round(samples[0], 3) if samples else None,
+        "warm_median": round(statistics.median(warm), 3) if warm else None,
+        "warm_min": round(min(warm), 3) if warm else None,
+    }
+
+
+def bench_maven(project: Path, backends: List[str], iterations: int, goal: str, tests: List[str]) -> Dict[str, Any]:
+    """
+    Cold vs. warm iteration latency of each Maven execution backend.
+    """
+    args = server._maven_test_args(goal, tests)
+    results: Dict[str, Any] = {"project": str(project), "maven_args": args, "backends": {}}
+
+    for name in backends:
+        backend, error = server._get_maven_backend(name)
+        if backend is None:
+            results["backends"][name] = {"error": error}
+            continue
+
+        samples: List[float] = []
+        exit_codes: List[int] = []
+        for _ in range(iterations):
+            exit_codes.append(backend.run(project, args))
+            samples.append(backend.last_seconds or 0.0)
+
+        results["backends"][name] = dict(_latency_summary(samples), exit_codes=exit_codes, restarts=backend.restarts)
+
+    return results
+
+
+def bench_git(repo: Path, backends: List[str], iterations: int) -> Dict[str, Any]:
+    """
+    Per-tool latency of the git tools under each git backend. Only read-only
+    paths are exercised: git_commit is timed up to its "nothing staged" check
+    and git_push up to its upstream lookup.
+    """
+    staged = server._run_git(repo, ["diff", "--cached", "--quiet"]).returncode != 0
+    cases: Dict[str, Callable[[], Any]] = {
+        "branch_lookup": lambda: server._run_git(repo, ["rev-parse", "--abbrev-ref", "HEAD"]),
+        "head_commit": lambda: server._run_git(repo, ["rev-parse", "HEAD"]),
+        "push_preflight": lambda: (
+            server._run_git(repo, ["rev-parse", "--abbrev-ref", "HEAD"]),
+            server._run_git(repo, ["rev-parse", "--abbrev-ref", "@{u}"]),
+        ),
+        "git_status": lambda: server._git_status_internal(repo),
+    }
+    if not staged:
+        cases["git_commit_nothing_staged"] = lambda: server._git_commit_internal(repo, "bench")
+
+    results: Dict[str, Any] = {"repo": str(repo), "iterations": iterations, "backends": {}}
+    previous = server._GIT_BACKEND
+    try:
+        for name in backends:
+            backend = server._GIT_BACKENDS.get(name)
+            if backend is None:
+                results["backends"][name] = {"error": f"unknown git backend '{name}'"}
+                continue
+            server._GIT_BACKEND = backend
+            timings: Dict[str, Any] = {}
+            for case, fn in cases.items():
+                samples = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    fn()
+                    samples.append((time.perf_counter() - start) * 1000)
+                timings[case] = {
+                    "median_ms": round(statistics.median(samples), 3),
+                    "min_ms": round(min(samples), 3),
+                }
+            results["backends"][name] = dict(timings, calls=backend.info())
+    finally:
+        server._GIT_BACKEND = previous
+
+    return results
+
+
+@dataclass
+class _LegacyMethodInfo:
+    """MethodInfo as it was before the slotted symbol index."""
+
+    name: str
+    return_type: Any
+    parameters: List[Dict[str, str]]
+    modifiers: List[str]
+    is_static: bool
+    is_constructor: bool
+
+
+@dataclass
+class _LegacyClassInfo:
+    package: str
+    class_name: str
+    file_path: str
+    methods: List[_LegacyMethodInfo]
+
+
+def _legacy_from_dict(cdict: Dict[str, Any]) -> _LegacyClassInfo:
+    return _LegacyClassInfo(
+        package=cdict["package"],
+        class_name=cdict["class_name"],
+        file_path=cdict["file_path"],
+        methods=[_LegacyMethodInfo(**m) for m in cdict["methods"]],
+    )
+
+
+def _synthetic_class_dicts(classes: int, methods: int) -> List[Dict[str, Any]]:
+    """
+    Parse-cache shaped class dicts with a realistic amount of repetition in
+    type names and modifiers.
+    """
+    types = ["int", "long", "String", "boolean", "double", "List", "Map", "Object", "char[]", "byte[]"]
+    modifier_sets = [["public"], ["public", "static"], ["private"], ["protected"], ["public", "final"]]
+    out = []
+    for c in range(classes):
+        pkg = f"com.example.module{c % 50}.sub{c % 7}"
+        out.append(
+            {
+                "package": pkg,
+                "class_name": f"Class{c}",
+                "file_path": f"/src/main/java/{pkg.replace('.', '/')}/Class{c}.java",
+                "methods": [
+                    {
+                        "name": f"method{m % 40}",
+                        "return_type": types[(c + m) % len(types)] if m % 5 else None,
+                        "parameters": [
+                            {"name": f"arg{p}", "type": types[(c + m + p) % len(types)]} for p in range(m % 4)
+                        ],
+                        "modifiers": list(modifier_sets[(c + m) % len(modifier_sets)]),
+                        "is_static": "static" in modifier_sets[(c + m) % len(modifier_sets)],
+                        "is_constructor": m == 0,
+                    }
+                    for m in range(methods)
+                ],
+            }
+        )
+    return out
+
+
+def _measure(build: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    Wall time of build() and, in a second traced run, the memory still held
+    by its result.
+    """
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    del result
+
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"seconds": round(seconds, 3), "retained_mb": round(current / 2**20, 1), "peak_mb": round(peak / 2**20, 1)}
+
+
+def bench_symbols(classes: int, methods: int) -> Dict[str, Any]:
+    """
+    Cost of materializing the symbol index from parse-cache JSON, as a tool
+    like generate_junit_tests needs it: the old dict round-trip (load ->
+    asdict -> rebuild) vs. the slotted, interned index.
+    """
+    payload = json.dumps(_synthetic_class_dicts(classes, methods))
+
+    def legacy() -> List[_LegacyClassInfo]:
+        loaded = [_legacy_from_dict(c) for c in json.loads(payload)]
+        dicts = [asdict(c) for c in loaded]
+        return [_legacy_from_dict(c) for c in dicts]
+
+    def slotted() -> List[Any]:
+        return [server._class_info_from_dict(c) for c in json.loads(payload)]
+
+    return {
+        "classes": classes,
+        "methods_per_class": methods,
+        "legacy_dict_round_trip": _measure(legacy),
+        "slotted_index": _measure(slotted),
+    }
+
+
+############### Synthetic project suite ###############
+
+_FIXTURE_MARKER = ".bench-fixture.json"
+_FIXTURE_VERSION = 2
+_PARAM_TYPES = ["int", "long", "String", "boolean", "double", "Object"]
+_METHOD_LINES = 6  # lines per generated method, signature included
+
+def _fixture_packages(classes: int) -> List[Tuple[str, str]]:
+    """
+    (package, class name) for every synthetic class; about 50 classes per package.
+    """
+    packages = max(1, classes // 50)
+    return [(f"com.example.bench.p{c % packages}", f"Class{c}") for c in range(classes)]
+
+def _write_java_tree(root: Path, classes: int, methods: int) -> None:
+    """
+    src/main/java with one public class per file: a constructor plus
+    `methods` methods with 0-3 parameters and a branch each.
+    """
+    for c, (pkg, name) in enumerate(_fixture_packages(classes)):
+        lines = [f"package {pkg};", "", f"public class {name} {{", f"    public {name}() {{", "    }"]
+        for m in range(methods):
+            params = ", ".join(f"{_PARAM_TYPES[(c + m + p) % len(_PARAM_TYPES)]} a{p}" for p in range(m % 4))
+            static = "static " if m % 3 == 0 else ""
+            lines += [
+                f"    public {static}int method{m}({params}) {{",
+                f"        int r = {m};",
+                f"        if (r > {c % 7}) {{",
+                "            r++;",
+                "        }",
+                "        return r;",
+            ]
+            lines.append("    }")
+        lines.append("}")
+        path = root / "src" / "main" / "java" / pkg.replace(".", "/") / f"{name}.java"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+def _method_line(m: int) -> int:
+    # Line 4 is the constructor; method m starts after it, _METHOD_LINES + 1 lines apart
+    return 6 + m * (_METHOD_LINES + 1)
+
+def _write_jacoco_xml(path: Path, classes: int, methods: int, rng: random.Random) -> None:
+    """
+    A JaCoCo XML report for the synthetic tree, written in one streaming pass.
+    Method counters are derived from the per-line data of the source file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    by_package: Dict[str, List[Tuple[int, str]]] = {}
+    for c, (pkg, name) in enumerate(_fixture_packages(classes)):
+        by_package.setdefault(pkg, []).append((c, name))
+
+    def counters(totals: Dict[str, List[int]]) -> str:
+        return "".join(
+            f'<counter type="{kind}" missed="{mc[0]}" covered="{mc[1]}"/>'
+            for kind, mc in totals.items()
+            if mc[0] or mc[1]
+        )
+
+    def add(into: Dict[str, List[int]], kind: str, missed: int, covered: int) -> None:
+        slot = into.setdefault(kind, [0, 0])
+        slot[0] += missed
+        slot[1] += covered
+
+    report: Dict[str, List[int]] = {}
+    with path.open("w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><report name="bench">')
+        for pkg, members in by_package.items():
+            pkg_slash = pkg.replace(".", "/")
+            package_totals: Dict[str, List[int]] = {}
+            sourcefiles: List[str] = []
+            f.write(f'<package name="{pkg_slash}">')
+            for _, name in members:
+                class_totals: Dict[str, List[int]] = {}
+                method_xml: List[str] = []
+                line_xml: List[str] = []
+                # (method name, descriptor, first line, body lines)
+                entries = [("&lt;init&gt;", "()V", 4, 1)] + [
+                    (f"method{m}", "()I", _method_line(m), 4) for m in range(methods)
+                ]
+                for mname, desc, first, body in entries:
+                    totals: Dict[str, List[int]] = {}
+                    hit = rng.random() < 0.7
+                    for nr in range(first, first + body):
+                        covered = hit and rng.random() < 0.8
+                        instr = rng.randint(2, 6)
+                        mi, ci = (0, instr) if covered else (instr, 0)
+                        mb, cb = (0, 0)
+                        if nr == first + 1 and body > 1:
+                            mb = 0 if covered else 2
+                            cb = 2 - mb if covered else 0
+                            if covered and rng.random() < 0.5:
+                                mb, cb = 1, 1
+                        line_xml.append(f'<line nr="{nr}" mi="{mi}" ci="{ci}" mb="{mb}" cb="{cb}"/>')
+                        add(totals, "INSTRUCTION", mi, ci)
+                        add(totals, "BRANCH", mb, cb)
+                        add(totals, "LINE", 1 if mi and not ci else 0, 1 if ci else 0)
+                    add(totals, "METHOD", 0 if hit else 1, 1 if hit else 0)
+                    method_xml.append(f'<method name="{mname}" desc="{desc}" line="{first}">{counters(totals)}</method>')
+                    for kind, (missed, covered) in totals.items():
+                        add(class_totals, kind, missed, covered)
+                add(class_totals, "CLASS", 0 if class_totals["METHOD"][1] else 1, 1 if class_totals["METHOD"][1] else 0)
+                f.write(
+                    f'<class name="{pkg_slash}/{name}" sourcefilename="{name}.java">'
+                    + "".join(method_xml)
+                    + counters(class_totals)
+                    + "</class>"
+                )
+                sourcefiles.append(f'<sourcefile name="{name}.java">' + "".join(line_xml) + counters(class_totals) + "</sourcefile>")
+                for kind, (missed, covered) in class_totals.items():
+                    add(package_totals, kind, missed, covered)
+            f.write("".join(sourcefiles) + counters(package_totals) + "</package>")
+            for kind, (missed, covered) in package_totals.items():
+                add(report, kind, missed, covered)
+        f.write(counters(report) + "</report>")
+
+def _write_surefire_reports(reports_dir: Path, classes: int, methods: int, rng: random.Random) -> None:
+    """
+    One TEST-<fqn>Test.xml per class with a test case per method; about 3%
+    failures, 1% errors and 2% skipped.
+    """
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    for pkg, name in _fixture_packages(classes):
+        suite = f"{pkg}.{name}Test"
+        cases: List[str] = []
+        counts = {"failures": 0, "errors": 0, "skipped": 0}
+        for m in range(max(1, methods)):
+            r = rng.random()
+            body = ""
+            if r < 0.03:
+                counts["failures"] += 1
+                body = (
+                    f'<failure message="expected:&lt;{m}&gt; but was:&lt;{m + 1}&gt;" type="java.lang.AssertionError">'
+                    f"java.lang.AssertionError\n\tat {suite}.testMethod{m}({name}Test.java:{10 + m})</failure>"
+                )
+            elif r < 0.04:
+                counts["errors"] += 1
+                body = f'<error message="boom" type="java.lang.IllegalStateException">java.lang.IllegalStateException: boom</error>'
+            elif r < 0.06:
+                counts["skipped"] += 1
+                body = "<skipped/>"
+            cases.append(f'<testcase name="testMethod{m}" classname="{suite}" time="{rng.random() / 10:.3f}">{body}</testcase>')
+        (reports_dir / f"TEST-{suite}.xml").write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<testsuite name="{suite}" time="1.0" tests="{len(cases)}" failures="{counts["failures"]}" '
+            f'errors="{counts["errors"]}" skipped="{counts["skipped"]}">'
+            '<properties><property name="java.version" value="17"/></properties>'
+            + "".join(cases)
+            + "</testsuite>",
+            encoding="utf-8",
+        )
+
+def _git(root: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", *args],
+        cwd=root,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+def build_fixture(workdir: Path, classes: int, methods: int, seed: int = 0) -> Path:
+    """
+    Create (or reuse, when the parameters match) the synthetic project
+    `<workdir>/project-<classes>x<methods>`: pom.xml, Java sources, JaCoCo and
+    Surefire reports, and a git repository with the sources committed.
+    """
+    root = workdir / f"project-{classes}x{methods}"
+    params = {"version": _FIXTURE_VERSION, "classes": classes, "methods": methods, "seed": seed}
+    marker = root / _FIXTURE_MARKER
+    if marker.exists() and json.loads(marker.read_text(encoding="utf-8")) == params:
+        return root
+    if root.exists():
+        shutil.rmtree(root)
+    root.mkdir(parents=True)
+
+    rng = random.Random(seed)
+    (root / "pom.xml").write_text(
+        '<project xmlns="http://maven.apache.org/POM/4.0.0"><modelVersion>4.0.0</modelVersion>'
+        "<groupId>com.example</groupId><artifactId>bench</artifactId><version>1.0</version></project>\n",
+        encoding="utf-8",
+    )
+    (root / ".gitignore").write_text(f"target/\n{_FIXTURE_MARKER}\n", encoding="utf-8")
+    _write_java_tree(root, classes, methods)
+    _write_jacoco_xml(root / "target" / "site" / "jacoco" / "jacoco.xml", classes, methods, rng)
+    _write_surefire_reports(root / "target" / "surefire-reports", classes, methods, rng)
+    _git(root, "init", "-q")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "bench fixture")
+
+    marker.write_text(json.dumps(params), encoding="utf-8")
+    return root
+
+def _combination_param_sets() -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        f"p{i}": [{"label": f"v{j}", "kind": "equivalence", "value": str(j)} for j in range(6)]
+        for i in range(8)
+    }
+
+def _reset_worktree(root: Path) -> None:
+    _git(root, "reset", "-q")
+    _git(root, "checkout", "-q", "--", ".")
+    _git(root, "clean", "-q", "-fd", "--", "src")
+
+def _touch_sources(root: Path, every: int = 100) -> None:
+    for i, path in enumerate(sorted(server._find_java_sources(root))):
+        if i % every == 0:
+            with path.open("a", encoding="utf-8") as f:
+                f.write("// bench\n")
+
+# name -> (setup, timed call, teardown). Each case runs in its own process, in
+# this order: analyze_project_cold writes the parse cache analyze_project_cached reads.
+_SuiteCase = Tuple[Callable[[Path], Any], Callable[[Path], Any], Callable[[Path], Any]]
+
+def _noop(root: Path) -> None:
+    return None
+
+def _drop_parse_cache(root: Path) -> None:
+    (server._state_dir(root) / server._PARSE_CACHE_FILE).unlink(missing_ok=True)
+
+def _drop_generated_tests(root: Path) -> None:
+    shutil.rmtree(root / "src" / "test", ignore_errors=True)
+    (server._state_dir(root) / server._JUNIT_FINGERPRINT_FILE).unlink(missing_ok=True)
+
+def _jacoco(root: Path) -> Path:
+    return root / "target" / "site" / "jacoco" / "jacoco.xml"
+
+# Per-class result lines as printed by Surefire 2.x and 3.x; the collector
+# must attribute failures to the class with either format
+_MAVEN_OUTPUT_SAMPLE = [
+    "[INFO] Running p.OkTest",
+    "[INFO] Tests run: 4, Failures: 0, Errors: 0, Skipped: 0, Time elapsed: 0.12 s - in p.OkTest",
+    "[ERROR] Tests run: 3, Failures: 1, Errors: 0, Skipped: 0, Time elapsed: 0.05 s <<< FAILURE! - in p.LegacyTest",
+    "[INFO] Tests run: 2, Failures: 0, Errors: 0, Skipped: 0, Time elapsed: 0.031 s -- in p.ModernOkTest",
+    "[ERROR] Tests run: 5, Failures: 0, Errors: 2, Skipped: 1, Time elapsed: 0.4 s <<< FAILURE! -- in p.ModernTest",
+]
+
+def _collect_maven_output(root: Path) -> None:
+    log_dir = root / "target" / "bench-logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    collector = server.MavenOutputCollector(log_dir / "maven.log")
+    for _ in range(2000):
+        for line in _MAVEN_OUTPUT_SAMPLE:
+            collector.feed(line)
+    collector.close()
+    suites = {e["suite"] for e in collector.events if e["type"] == "suite_failed"}
+    if suites != {"p.LegacyTest", "p.ModernTest"}:
+        raise AssertionError(f"Surefire result lines attributed to {sorted(map(str, suites))}")
+
+_SUITE_CASES: Dict[str, _SuiteCase] = {
+    "startup": (_noop, _noop, _noop),
+    "analyze_project_cold": (_drop_parse_cache, lambda r: server._analyze_project_internal(r), _noop),
+    "analyze_project_cached": (_noop, lambda r: server._analyze_project_internal(r), _noop),
+    "analyze_coverage": (_noop, lambda r: server._analyze_coverage_internal(_jacoco(r)), _noop),
+    "plan_next_targets": (_noop, lambda r: server._plan_next_targets_internal(_jacoco(r)), _noop),
+    "parse_surefire_reports": (
+        _noop,
+        lambda r: server._parse_surefire_reports(r / "target" / "surefire-reports"),
+        _noop,
+    ),
+    "maven_output_collector": (_noop, _collect_maven_output, _noop),
+    "generate_tests": (_drop_generated_tests, lambda r: server._generate_tests_internal(r, overwrite=False), _drop_generated_tests),
+    "cartesian_combinations": (
+        _noop,
+        lambda r: [server._cartesian_combinations(_combination_param_sets(), max_cases=20) for _ in range(1000)],
+        _noop,
+    ),
+    "nwise_combinations": (
+        _noop,
+        lambda r: [server._nwise_combinations(_combination_param_sets(), strength=2, max_cases=100) for _ in range(10)],
+        _noop,
+    ),
+    "git_status": (_noop, lambda r: server._git_status_internal(r), _noop),
+    "git_add_all": (_touch_sources, lambda r: server._git_add_all_internal(r), _reset_worktree),
+}
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS. Child processes (git) are not
+    # counted: forked children report the parent's RSS from before exec.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def run_case(name: str, root: Path) -> Dict[str, Any]:
+    """
+    Run one suite case in this process (called in a fresh child by run_suite).
+    """
+    setup, call, teardown = _SUITE_CASES[name]
+    setup(root)
+    start = time.perf_counter()
+    call(root)
+    seconds = time.perf_counter() - start
+    teardown(root)
+    return {"seconds": round(seconds, 4), "peak_rss_mb": _peak_rss_mb()}
+
+def run_suite(root: Path, cases: List[str], repeat: int) -> Dict[str, Any]:
+    """
+    Every case `repeat` times, each run in a new interpreter so peak RSS and
+    in-process caches start from scratch. Reports the median wall time and the
+    largest peak RSS.
+    """
+    results: Dict[str, Any] = {}
+    for name in cases:
+        runs: List[Dict[str, Any]] = []
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "case", name, "--project", str(root)],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                runs = []
+                results[name] = {"error": proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]}
+                break
+            runs.append(json.loads(proc.stdout))
+        if runs:
+            results[name] = {
+                "seconds": statistics.median(r["seconds"] for r in runs),
+                "seconds_min": min(r["seconds"] for r in runs),
+                "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            }
+    return results
+
+def compare_with_baseline(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    min_seconds: float = 0.05,
+    min_rss_mb: float = 5.0,
+) -> List[Dict[str, Any]]:
+    """
+    Cases that got slower or bigger than the baseline by more than `threshold`
+    (relative) and the absolute noise floor.
+    """
+    regressions: List[Dict[str, Any]] = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before or "error" in before or "error" in now:
+            continue
+        for metric, floor in (("seconds", min_seconds), ("peak_rss_mb", min_rss_mb)):
+            old, new = before[metric], now[metric]
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(
+                    {"case": name, "metric": metric, "baseline": old, "current": new, "ratio": round(new / old, 2) if old else None}
+                )
+    return regressions
+
+def bench_suite(
+    workdir: Path,
+    classes: int,
+    methods: int,
+    cases: List[str],
+    repeat: int,
+    baseline_path: Optional[Path],
+    update: bool,
+    threshold: float,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Build the fixture, run the cases and compare with (or record) the baseline.
+    Returns the report and the process exit code.
+    """
+    fixture_start = time.perf_counter()
+    root = build_fixture(workdir, classes, methods)
+    fixture_seconds = time.perf_counter() - fixture_start
+
+    meta = {
+        "classes": classes,
+        "methods_per_class": methods,
+        "repeat": repeat,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpus": os.cpu_count(),
+    }
+    current = run_suite(root, cases, repeat)
+    report: Dict[str, Any] = {
+        "project": str(root),
+        "fixture_seconds": round(fixture_seconds, 2),
+        "meta": meta,
+        "cases": current,
+    }
+
+    # A case that raised (e.g. a failed sanity check) fails the run
+    exit_code = 1 if any("error" in r for r in current.values()) else 0
+    if baseline_path is not None:
+        previous = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else None
+        comparable = previous is not None and all(
+            previous.get("meta", {}).get(k) == meta[k] for k in ("classes", "methods_per_class")
+        )
+        if comparable and not update:
+            regressions = compare_with_baseline(previous["cases"], current, threshold)
+            report["baseline"] = {"file": str(baseline_path), "threshold": threshold, "regressions": regressions}
+            exit_code = 1 if regressions else exit_code
+        else:
+            baseline_path.write_text(json.dumps({"meta": meta, "cases": current}, indent=2) + "\n", encoding="utf-8")
+            report["baseline"] = {
+                "file": str(baseline_path),
+                "written": True,
+                "reason": "update requested" if update else ("no baseline" if previous is None else "fixture size changed"),
+            }
+    return report, exit_code
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_maven = sub.add_parser("maven", help="cold vs. warm Maven execution backends")
+    p_maven.add_argument("--project", type=Path, default=Path("codebase"))
+    p_maven.add_argument("--backends", default="cold,mvnd")
+    p_maven.add_argument("--iterations", type=int, default=5)
+    p_maven.add_argument("--goal", default="test")
+    p_maven.add_argument("--tests", default="", help="comma-separated -Dtest selection")
+
+    p_git = sub.add_parser("git", help="per-tool latency of the git backends")
+    p_git.add_argument("--repo", type=Path, default=Path("."))
+    p_git.add_argument("--backends", default="subprocess,files")
+    p_git.add_argument("--iterations", type=int, default=50)
+
+    p_sym = sub.add_parser("symbols", help="symbol index build time and memory")
+    p_sym.add_argument("--classes", type=int, default=10000)
+    p_sym.add_argument("--methods", type=int, default=20)
+
+    p_suite = sub.add_parser("suite", help="synthetic project: wall time + peak RSS per case, with baseline")
+    p_suite.add_argument("--workdir", type=Path, default=Path(".bench"))
+    p_suite.add_argument("--classes", type=int, default=1000)
+    p_suite.add_argument("--methods", type=int, default=10)
+    p_suite.add_argument("--cases", default=",".join(_SUITE_CASES), help="comma-separated subset of cases")
+    p_suite.add_argument("--repeat", type=int, default=3)
+    p_suite.add_argument("--baseline", type=Path, default=Path("bench-baseline.json"))
+    p_suite.add_argument("--update", action="store_true", help="overwrite the baseline with this run")
+    p_suite.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown/growth")
+
+    p_gen = sub.add_parser("generate", help="only build the synthetic project")
+    p_gen.add_argument("--workdir", type=Path, default=Path(".bench"))
+    p_gen.add_argument("--classes", type=int, default=1000)
+    p_gen.add_argument("--methods", type=int, default=10)
+
+    p_case = sub.add_parser("case", help=argparse.SUPPRESS)
+    p_case.add_argument("name", choices=list(_SUITE_CASES))
+    p_case.add_argument("--project", type=Path, required=True)
+
+    args = parser.parse_args()
+    exit_code = 0
+
+    if args.command == "maven":
+        result = bench_maven(
+            args.project.expanduser().resolve(),
+            [b for b in args.backends.split(",") if b],
+            args.iterations,
+            args.goal,
+            [t for t in args.tests.split(",") if t],
+        )
+    elif args.command == "symbols":
+        result = bench_symbols(args.classes, args.methods)
+    elif args.command == "git":
+        result = bench_git(
+            args.repo.expanduser().resolve(),
+            [b for b in args.backends.split(",") if b],
+            args.iterations,
+        )
+    elif args.command == "suite":
+        unknown = [c for c in args.cases.split(",") if c and c not in _SUITE_CASES]
+        if unknown:
+            parser.error(f"unknown case(s): {', '.join(unknown)}")
+        result, exit_code = bench_suite(
+            args.workdir.expanduser().resolve(),
+            args.classes,
+            args.methods,
+            [c for c in args.cases.split(",") if c],
+            args.repeat,
+            args.baseline.expanduser().resolve() if args.baseline else None,
+            args.update,
+            args.threshold,
+        )
+    elif args.command == "generate":
+        start = time.perf_counter()
+        root = build_fixture(args.workdir.expanduser().resolve(), args.classes, args.methods)
+        result = {"project": str(root), "seconds": round(time.perf_counter() - start, 2)}
+    elif args.command == "case":
+        result = run_case(args.name, args.project.expanduser().resolve())
+
+    print(json.dumps(result, indent=2))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
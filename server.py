@@ -1,12 +1,30 @@
 from __future__ import annotations
 from fastmcp import FastMCP
+import asyncio
 import subprocess
+import uuid
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Awaitable, Callable, Deque, Dict, Generator, Iterator, List, Optional, Set, Tuple, Union, cast
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+import fnmatch
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import os
+import random
+import re
 import shutil
+import sqlite3
+import sys
+import threading
+import time
 
 import javalang
 from javalang.tree import CompilationUnit
@@ -16,31 +34,164 @@ import datetime
 
 ############### DATA STRUCTS ##################
 
-@dataclass
+# The symbol index is slotted and its identifier/type/modifier strings are
+# interned, so large projects hold one copy of each; it is converted to dicts
+# (_class_info_to_dict) only where results leave the server or hit disk.
+
+@dataclass(slots=True)
+class ParamInfo:
+    name: str
+    type: str
+
+@dataclass(slots=True)
 class MethodInfo:
     name: str
     return_type: Optional[str]
-    parameters: List[Dict[str, str]]
-    modifiers: List[str]
+    parameters: List[ParamInfo]
+    modifiers: Tuple[str, ...]
     is_static: bool
     is_constructor: bool
-@dataclass 
+
+@dataclass(slots=True)
 class ClassInfo:
     package: str
     class_name: str
     file_path: str
     methods: List[MethodInfo]
 
+_MODIFIER_SETS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+def _make_method_info(
+    name: str,
+    return_type: Optional[str],
+    parameters: List[Tuple[str, str]],
+    modifiers: List[str],
+    is_constructor: bool,
+) -> MethodInfo:
+    """
+    Build a MethodInfo with interned strings and a shared modifiers tuple.
+    """
+    mods = tuple(sorted(sys.intern(m) for m in modifiers))
+    mods = _MODIFIER_SETS.setdefault(mods, mods)
+    return MethodInfo(
+        name=sys.intern(name),
+        return_type=sys.intern(return_type) if return_type is not None else None,
+        parameters=[ParamInfo(sys.intern(pname), sys.intern(ptype)) for pname, ptype in parameters],
+        modifiers=mods,
+        is_static="static" in mods,
+        is_constructor=is_constructor,
+    )
+
+def _class_info_to_dict(c: ClassInfo) -> Dict[str, Any]:
+    return {
+        "package": c.package,
+        "class_name": c.class_name,
+        "file_path": c.file_path,
+        "methods": [
+            {
+                "name": m.name,
+                "return_type": m.return_type,
+                "parameters": [{"name": p.name, "type": p.type} for p in m.parameters],
+                "modifiers": list(m.modifiers),
+                "is_static": m.is_static,
+                "is_constructor": m.is_constructor,
+            }
+            for m in c.methods
+        ],
+    }
+
 ########## HELPERS ###############
 
-def _find_java_sources(project_root: Path) -> List[Path]:
+def _pom_modules(pom: Path) -> List[str]:
+    """
+    <module> entries of a pom.xml, including the ones declared in profiles.
+    Namespace-agnostic: POMs with and without the Maven 4.0.0 xmlns both work.
+    """
+    try:
+        root = ET.parse(pom).getroot()
+    except (OSError, ET.ParseError):
+        return []
+
+    modules: List[str] = []
+    for elem in root.iter():
+        if elem.tag.rsplit("}", 1)[-1] != "module" or not elem.text:
+            continue
+        name = elem.text.strip()
+        if name and name not in modules:
+            modules.append(name)
+    return modules
+
+def _reactor_modules(project_root: Path) -> List[Path]:
+    """
+    Module directories of the Maven reactor rooted at project_root, following
+    nested aggregators depth first. Empty for a single-module project. Modules
+    outside project_root (e.g. "../shared") are left out.
+    """
+    root = Path(os.path.normpath(project_root))
+    modules: List[Path] = []
+    seen = {root}
+
+    def visit(module_dir: Path) -> None:
+        for name in _pom_modules(module_dir / "pom.xml"):
+            module = Path(os.path.normpath(module_dir / name))
+            if module.suffix == ".xml":  # <module>child/pom-alt.xml</module>
+                module = module.parent
+            if module in seen or root not in module.parents or not (module / "pom.xml").exists():
+                continue
+            seen.add(module)
+            modules.append(module)
+            visit(module)
+
+    visit(root)
+    return modules
+
+def _main_source_roots(project_root: Path, modules: Optional[List[Path]] = None) -> List[Path]:
+    """
+    Directories holding the analyzed sources: src/main/java of every reactor
+    module (never test sources or build output), else the project's
+    src/main/java, else the project root itself. Callers that already hold
+    _reactor_modules() pass it as `modules` (it parses the pom tree).
+    """
+    if modules is None:
+        modules = _reactor_modules(project_root)
+    if modules:
+        return [
+            module / "src" / "main" / "java"
+            for module in [project_root, *modules]
+            if (module / "src" / "main" / "java").exists()
+        ]
     main_java = project_root / "src" / "main" / "java"
-    if main_java.exists():
-        return list(main_java.rglob("*.java"))
-    return list(project_root.rglob("*.java"))
+    return [main_java if main_java.exists() else project_root]
+
+def _test_source_roots(project_root: Path, modules: Optional[List[Path]] = None) -> List[Path]:
+    """
+    src/test/java of the project and of every reactor module, where present.
+    """
+    if modules is None:
+        modules = _reactor_modules(project_root)
+    return [
+        module / "src" / "test" / "java"
+        for module in [project_root, *modules]
+        if (module / "src" / "test" / "java").exists()
+    ]
+
+def _test_root_for(project_root: Path, source_file: Path, main_roots: List[Path]) -> Path:
+    """
+    src/test/java of the module whose src/main/java (one of `main_roots`,
+    from _main_source_roots) holds source_file; the project's own
+    src/test/java otherwise.
+    """
+    for root in main_roots:
+        if root.parts[-3:] == ("src", "main", "java") and source_file.is_relative_to(root):
+            return root.parent.parent / "test" / "java"
+    return project_root / "src" / "test" / "java"
+
+def _find_java_sources(project_root: Path, modules: Optional[List[Path]] = None) -> List[Path]:
+    return [src for root in _main_source_roots(project_root, modules) for src in root.rglob("*.java")]
 
-def _extract_package_and_classes(java_path: Path) -> Optional[ClassInfo]:
-    code = java_path.read_text(encoding="utf-8", errors="ignore")
+def _extract_package_and_classes(java_path: Path, code: Optional[str] = None) -> Optional[ClassInfo]:
+    if code is None:
+        code = java_path.read_text(encoding="utf-8", errors="ignore")
 
     try:
         cu = cast(CompilationUnit, javalang.parse.parse(code))
@@ -55,71 +206,302 @@ def _extract_package_and_classes(java_path: Path) -> Optional[ClassInfo]:
 
         # methods
         for m in class_node.methods: # pyright: ignore[reportAttributeAccessIssue]
-            modifiers = list(m.modifiers or [])
-            is_static = "static" in modifiers
-
-            params: List[Dict[str, str]] = []
+            params: List[Tuple[str, str]] = []
             for p in m.parameters:
                 param_type = p.type.name
                 if p.type.dimensions:
                     param_type += "[]" * len(p.type.dimensions)
-                params.append({"name": p.name, "type": param_type})
+                params.append((p.name, param_type))
             
             return_type = m.return_type.name if m.return_type is not None else None
 
-            methods.append(
-                MethodInfo(
-                    name=m.name,
-                    return_type=return_type,
-                    parameters=params,
-                    modifiers=modifiers,
-                    is_static=is_static,
-                    is_constructor=False,
-                )
-            )
+            methods.append(_make_method_info(m.name, return_type, params, list(m.modifiers or []), False))
         # constructors
         for c in class_node.constructors: # pyright: ignore[reportAttributeAccessIssue]
-            modifiers = list(c.modifiers or [])
-            is_static = "static" in modifiers
-
-            params: List[Dict[str, str]] = []
+            params = []
             for p in c.parameters:
                 param_type = p.type.name
                 if p.type.dimensions:
                     param_type += "[]" * len(p.type.dimensions)
-                params.append({"name": p.name, "type": param_type})
-
-            methods.append(
-                MethodInfo(
-                    name=c.name,
-                    return_type=None,
-                    parameters=params,
-                    modifiers=modifiers,
-                    is_static=is_static,
-                    is_constructor=True,
-                )
-            )
+                params.append((p.name, param_type))
+
+            methods.append(_make_method_info(c.name, None, params, list(c.modifiers or []), True))
         
         return ClassInfo(
-            package=pkg,
-            class_name=class_node.name, # pyright: ignore[reportAttributeAccessIssue]
+            package=sys.intern(pkg),
+            class_name=sys.intern(class_node.name), # pyright: ignore[reportAttributeAccessIssue]
             file_path=str(java_path),
             methods=methods,
         )
     
     return None
 
-def _analyze_project_internal(project_root: Path) -> Dict[str, Any]:
-    sources = _find_java_sources(project_root)
-    classes: List[ClassInfo] = []
+def _class_info_from_dict(cdict: Dict[str, Any]) -> ClassInfo:
+    """
+    Rebuild a ClassInfo (and its MethodInfo list) from its _class_info_to_dict() form.
+    """
+    return ClassInfo(
+        package=sys.intern(cdict["package"]),
+        class_name=sys.intern(cdict["class_name"]),
+        file_path=cdict["file_path"],
+        methods=[
+            _make_method_info(
+                m["name"],
+                m["return_type"],
+                [(p["name"], p["type"]) for p in m["parameters"]],
+                m["modifiers"],
+                m["is_constructor"],
+            )
+            for m in cdict["methods"]
+        ],
+    )
 
-    for src in sources:
-        info = _extract_package_and_classes(src)
-        if info is not None:
-            classes.append(info)
+############### Agent state / parse cache ###################
+
+_STATE_DIR_NAME = ".test-agent"
+_PARSE_CACHE_FILE = "parse-cache.json"
+_PARSE_CACHE_VERSION = 2
+# Reactor modules get their own cache file: <state>/parse-cache/<module>.json
+_PARSE_CACHE_MODULES_DIR = "parse-cache"
+
+def _state_dir(project_root: Path) -> Path:
+    """
+    Directory holding the agent's on-disk caches for a project.
+    A '*' .gitignore keeps it out of commits made by the git tools.
+    """
+    state = project_root / _STATE_DIR_NAME
+    state.mkdir(parents=True, exist_ok=True)
+    ignore = state / ".gitignore"
+    if not ignore.exists():
+        ignore.write_text("*\n", encoding="utf-8")
+    return state
+
+def _parse_cache_file(project_root: Path, module: str = "") -> Path:
+    """
+    Cache file of one reactor module ("" = the project itself).
+    """
+    state = project_root / _STATE_DIR_NAME
+    if not module:
+        return state / _PARSE_CACHE_FILE
+    return state / _PARSE_CACHE_MODULES_DIR / (module.replace("/", "__") + ".json")
+
+def _read_parse_cache_file(cache_file: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != _PARSE_CACHE_VERSION:
+        return {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+def _load_parse_cache(project_root: Path) -> Dict[str, Any]:
+    """
+    Load the per-file parse cache of the project and all of its reactor
+    modules. Entries are keyed by the source path relative to project_root:
+      { "mtime_ns": int, "size": int, "sha1": str, "class": Optional[dict] }
+    """
+    entries = _read_parse_cache_file(_parse_cache_file(project_root))
+    modules_dir = project_root / _STATE_DIR_NAME / _PARSE_CACHE_MODULES_DIR
+    if modules_dir.is_dir():
+        for cache_file in sorted(modules_dir.glob("*.json")):
+            entries.update(_read_parse_cache_file(cache_file))
+    return entries
+
+def _save_parse_cache(project_root: Path, entries: Dict[str, Any], module: str = "") -> None:
+    cache_file = _parse_cache_file(project_root, module)
+    _state_dir(project_root)
+    if not entries and module:
+        cache_file.unlink(missing_ok=True)
+        return
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"version": _PARSE_CACHE_VERSION, "entries": entries}, separators=(",", ":")),
+        encoding="utf-8",
+    )
+    os.replace(tmp, cache_file)
+
+def _module_of(key: str, modules: Set[str]) -> str:
+    """
+    Innermost reactor module containing the project-relative path `key`
+    ("" = the project itself). `modules` holds module paths relative to the
+    project root ("a", "a/b", ...).
+    """
+    path = key
+    while "/" in path:
+        path = path.rsplit("/", 1)[0]
+        if path in modules:
+            return path
+    return ""
+
+def _split_by_module(entries: Dict[str, Any], modules: Set[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Group cache entries by the reactor module containing them.
+    """
+    shards: Dict[str, Dict[str, Any]] = {}
+    for key, entry in entries.items():
+        shards.setdefault(_module_of(key, modules), {})[key] = entry
+    return shards
+
+def _check_parse_cache(
+    java_path: Path,
+    entry: Optional[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Compare java_path against its cache entry and return (entry, hit).
+
+    A matching (mtime, size) is trusted as-is; otherwise the content hash
+    decides, so touched-but-identical files are not re-parsed either. On a miss
+    the returned entry carries the current stat/hash and its "class" still has
+    to be filled in by the caller.
+    """
+    st = java_path.stat()
+    if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return entry, True
+
+    digest = hashlib.sha1(java_path.read_bytes()).hexdigest()
+    fresh: Dict[str, Any] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": digest, "class": None}
+    if entry is not None and entry["sha1"] == digest:
+        fresh["class"] = entry["class"]
+        return fresh, True
+    return fresh, False
+
+def _parse_java_batch(paths: List[str]) -> Tuple[int, float, List[Optional[ClassInfo]]]:
+    """
+    Worker entry point: parse one chunk of files inside a pool process.
+    Returns (pid, seconds spent, results in input order).
+    """
+    start = time.perf_counter()
+    results = [_extract_package_and_classes(Path(p)) for p in paths]
+    return os.getpid(), time.perf_counter() - start, results
+
+def _parse_java_files(
+    paths: List[Path],
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> Tuple[List[Optional[ClassInfo]], Dict[str, Any]]:
+    """
+    Parse paths with javalang, optionally spread over a ProcessPoolExecutor.
+
+    workers == 1 parses in-process, workers <= 0 uses one worker per CPU.
+    Results are returned in the order of `paths` regardless of which worker
+    finished first, together with a per-worker timing breakdown.
+    """
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    chunk_size = max(1, chunk_size)
+    batches = [[str(p) for p in paths[i:i + chunk_size]] for i in range(0, len(paths), chunk_size)]
+
+    wall_start = time.perf_counter()
+    if workers == 1 or len(batches) <= 1:
+        mode = "serial"
+        outputs = [_parse_java_batch(batch) for batch in batches]
+    else:
+        mode = "process_pool"
+        workers = min(workers, len(batches))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields in submission order, which keeps results deterministic
+            outputs = list(pool.map(_parse_java_batch, batches))
+    wall = time.perf_counter() - wall_start
+
+    results: List[Optional[ClassInfo]] = []
+    per_worker: Dict[int, Dict[str, Any]] = {}
+    for (pid, seconds, batch_results), batch in zip(outputs, batches):
+        results.extend(batch_results)
+        w = per_worker.setdefault(pid, {"pid": pid, "batches": 0, "files": 0, "seconds": 0.0})
+        w["batches"] += 1
+        w["files"] += len(batch)
+        w["seconds"] += seconds
+
+    timing = {
+        "mode": mode,
+        "workers": workers if mode == "process_pool" else 1,
+        "chunk_size": chunk_size,
+        "files_parsed": len(paths),
+        "wall_seconds": round(wall, 4),
+        "per_worker": [
+            dict(w, seconds=round(w["seconds"], 4))
+            for w in sorted(per_worker.values(), key=lambda w: w["pid"])
+        ],
+    }
+    return results, timing
+
+def _load_classes(
+    project_root: Path,
+    sources: List[Path],
+    use_cache: bool = True,
+    workers: int = 1,
+    chunk_size: int = 64,
+    prune: bool = True,
+    modules: Optional[List[Path]] = None,
+) -> Tuple[List[Optional[ClassInfo]], Dict[str, Any]]:
+    """
+    Return the ClassInfo (or None) for each of `sources`, in order.
 
-    classes_dicts = [asdict(c) for c in classes]
+    With prune=True `sources` is the whole tree and cache entries for files
+    not listed are dropped; with prune=False only the listed entries are
+    refreshed and the rest of the cache is kept. `modules` is the project's
+    _reactor_modules(), when the caller has it.
+    """
+    old_entries = _load_parse_cache(project_root) if use_cache else {}
+    entries: Dict[str, Any] = {} if prune else dict(old_entries)
+    keys = [src.relative_to(project_root).as_posix() for src in sources]
+
+    # 1) Serve unchanged files from the cache, collect the rest for parsing
+    found: List[Optional[ClassInfo]] = [None] * len(sources)
+    pending: List[int] = []
+    hits = 0
+    for i, (src, key) in enumerate(zip(sources, keys)):
+        if not use_cache:
+            pending.append(i)
+            continue
+        entry, hit = _check_parse_cache(src, old_entries.get(key))
+        entries[key] = entry
+        if not hit:
+            pending.append(i)
+            continue
+        hits += 1
+        if entry["class"] is not None:
+            info = _class_info_from_dict(entry["class"])
+            # The project may have moved since the entry was written
+            info.file_path = str(src)
+            found[i] = info
+
+    # 2) Parse cache misses, possibly in parallel
+    parsed, timing = _parse_java_files([sources[i] for i in pending], workers, chunk_size)
+    for i, info in zip(pending, parsed):
+        found[i] = info
+        if use_cache:
+            entries[keys[i]]["class"] = _class_info_to_dict(info) if info is not None else None
+
+    # 3) Persist each module's cache when anything in it changed, including
+    #    files deleted since the last run
+    modules_written = 0
+    if use_cache:
+        if modules is None:
+            modules = _reactor_modules(project_root)
+        module_names = {m.relative_to(project_root).as_posix() for m in modules}
+        new_shards = _split_by_module(entries, module_names)
+        old_shards = _split_by_module(old_entries, module_names)
+        for module in sorted(set(new_shards) | set(old_shards)):
+            new, old = new_shards.get(module, {}), old_shards.get(module, {})
+            if len(new) != len(old) or any(entry is not old.get(key) for key, entry in new.items()):
+                _save_parse_cache(project_root, new, module)
+                modules_written += 1
+
+    stats = {
+        "parse_cache": {
+            "enabled": use_cache,
+            "hits": hits,
+            "misses": len(pending),
+            "files_written": modules_written,
+        },
+        "parsing": timing,
+    }
+    return found, stats
 
+def _summarize_analysis(project_root: Path, num_java_files: int, classes: List[ClassInfo]) -> Dict[str, Any]:
     total_methods = sum(len(c.methods) for c in classes)
     public_methods = sum(
         sum(1 for m in c.methods if "public" in m.modifiers)
@@ -128,12 +510,312 @@ def _analyze_project_internal(project_root: Path) -> Dict[str, Any]:
 
     return {
         "project_root": str(project_root),
-        "num_java_files": len(sources),
+        "num_java_files": num_java_files,
         "num_classes": len(classes),
         "num_methods": total_methods,
         "num_public_methods": public_methods,
-        "classes": classes_dicts
+        "classes": [_class_info_to_dict(c) for c in classes],
+    }
+
+def _project_classes(project_root: Path, modules: Optional[List[Path]] = None) -> List[ClassInfo]:
+    """
+    The project's parsed classes as symbol objects (through the parse cache).
+    """
+    if modules is None:
+        modules = _reactor_modules(project_root)
+    sources = sorted(_find_java_sources(project_root, modules))
+    found, _ = _load_classes(project_root, sources, modules=modules)
+    return [c for c in found if c is not None]
+
+def _analyze_project_internal(
+    project_root: Path,
+    use_cache: bool = True,
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> Dict[str, Any]:
+    modules = _reactor_modules(project_root)
+    sources = sorted(_find_java_sources(project_root, modules))
+    found, stats = _load_classes(project_root, sources, use_cache, workers, chunk_size, modules=modules)
+    classes = [c for c in found if c is not None]
+
+    # Serialized here, for the MCP response
+    result = _summarize_analysis(project_root, len(sources), classes)
+    result.update(stats)
+
+    if modules:
+        names = [m.relative_to(project_root).as_posix() for m in modules]
+        per_module: Dict[str, Dict[str, Any]] = {
+            name: {"module": name, "num_java_files": 0, "num_classes": 0} for name in ["", *names]
+        }
+        name_set = set(names)
+        for src, info in zip(sources, found):
+            module = per_module[_module_of(src.relative_to(project_root).as_posix(), name_set)]
+            module["num_java_files"] += 1
+            module["num_classes"] += info is not None
+        result["modules"] = [m for m in per_module.values() if m["module"] or m["num_java_files"]]
+    return result
+
+############### Incremental analysis (git diff driven) ###################
+
+_ANALYSIS_SNAPSHOT_FILE = "analysis-snapshot.json"
+
+def _class_fqn(package: str, class_name: str) -> str:
+    return f"{package}.{class_name}" if package else class_name
+
+def _method_signature(m: MethodInfo) -> str:
+    return f"{m.name}({', '.join(p.type for p in m.parameters)})"
+
+def _git_changed_paths(project_root: Path, base: Optional[str]) -> Optional[Tuple[Path, List[str]]]:
+    """
+    Paths (relative to the git top-level) that differ between `base` and the
+    working tree, plus staged and untracked files. None if git cannot answer.
+    """
+    top = _run_git(project_root, ["rev-parse", "--show-toplevel"])
+    if top.returncode != 0:
+        return None
+    toplevel = Path(top.stdout.strip())
+
+    changed: set[str] = set()
+    if base:
+        diff = _run_git(project_root, ["diff", "--name-only", "--no-renames", "-z", base, "--"])
+        if diff.returncode != 0:
+            return None
+        changed.update(p for p in diff.stdout.split("\0") if p)
+
+    status = _run_git(project_root, ["status", "--porcelain=v1", "-z", "--untracked-files=all"])
+    if status.returncode != 0:
+        return None
+    fields = status.stdout.split("\0")
+    i = 0
+    while i < len(fields):
+        entry = fields[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        changed.add(entry[3:])
+        # Renames/copies are followed by their source path
+        if entry[0] in {"R", "C"}:
+            changed.add(fields[i])
+            i += 1
+
+    return toplevel, sorted(changed)
+
+def _java_changes_under(
+    project_root: Path,
+    toplevel: Path,
+    paths: List[str],
+    source_roots: Optional[List[Path]] = None,
+) -> List[str]:
+    """
+    Keep the .java files that live in the analyzed source trees (every
+    module's src/main/java in a reactor, or `source_roots` from
+    _main_source_roots), as paths relative to project_root.
+    """
+    if source_roots is None:
+        source_roots = _main_source_roots(project_root)
+    keep: List[str] = []
+    for p in paths:
+        if not p.endswith(".java"):
+            continue
+        abs_path = toplevel / p
+        if any(abs_path.is_relative_to(root) for root in source_roots):
+            keep.append(abs_path.relative_to(project_root).as_posix())
+    return keep
+
+def _load_analysis_snapshot(project_root: Path) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads((project_root / _STATE_DIR_NAME / _ANALYSIS_SNAPSHOT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and isinstance(data.get("files"), dict) else None
+
+def _save_analysis_snapshot(
+    project_root: Path,
+    commit: Optional[str],
+    dirty_files: List[str],
+    files: Dict[str, Optional[ClassInfo]],
+) -> None:
+    snap_file = _state_dir(project_root) / _ANALYSIS_SNAPSHOT_FILE
+    tmp = snap_file.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps(
+            {
+                "commit": commit,
+                "dirty_files": dirty_files,
+                "files": {k: _class_info_to_dict(v) if v is not None else None for k, v in files.items()},
+            },
+            separators=(",", ":"),
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp, snap_file)
+
+def _method_delta(
+    old: Dict[str, Optional[ClassInfo]],
+    new: Dict[str, Optional[ClassInfo]],
+    files: List[str],
+) -> Dict[str, Any]:
+    """
+    Compare two versions of the given files and list added, removed and
+    changed classes/methods. Methods are matched by name + parameter types.
+    """
+    delta: Dict[str, List[Any]] = {
+        "classes_added": [],
+        "classes_removed": [],
+        "methods_added": [],
+        "methods_removed": [],
+        "methods_changed": [],
+    }
+    for f in files:
+        before = old.get(f)
+        after = new.get(f)
+        before_fqn = _class_fqn(before.package, before.class_name) if before is not None else None
+        after_fqn = _class_fqn(after.package, after.class_name) if after is not None else None
+        if before_fqn != after_fqn:
+            if before_fqn is not None:
+                delta["classes_removed"].append(before_fqn)
+            if after_fqn is not None:
+                delta["classes_added"].append(after_fqn)
+
+        before_methods = {_method_signature(m): m for m in before.methods} if before is not None else {}
+        after_methods = {_method_signature(m): m for m in after.methods} if after is not None else {}
+
+        for sig in before_methods:
+            if sig not in after_methods:
+                delta["methods_removed"].append({"class_fqn": before_fqn, "signature": sig})
+        for sig, m in after_methods.items():
+            prev = before_methods.get(sig)
+            if prev is None:
+                delta["methods_added"].append({"class_fqn": after_fqn, "signature": sig})
+            elif (prev.return_type, prev.modifiers, prev.is_static) != (m.return_type, m.modifiers, m.is_static):
+                delta["methods_changed"].append(
+                    {
+                        "class_fqn": after_fqn,
+                        "signature": sig,
+                        "before": {"return_type": prev.return_type, "modifiers": list(prev.modifiers)},
+                        "after": {"return_type": m.return_type, "modifiers": list(m.modifiers)},
+                    }
+                )
+    return delta
+
+def _analyze_project_incremental(
+    project_root: Path,
+    base_ref: str = "",
+    workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Re-parse only the .java files git reports as changed and merge them into
+    the last analysis snapshot (a full, cached analysis seeds it on first use).
+
+    The delta is computed against `base_ref` when given (old file versions come
+    from `git show`), otherwise against the previous snapshot. A snapshot whose
+    commit no longer exists (rebase, amend, gc) is replaced by a full analysis.
+    """
+    snapshot = _load_analysis_snapshot(project_root)
+    head = _run_git(project_root, ["rev-parse", "HEAD"])
+    head_commit = head.stdout.strip() if head.returncode == 0 else None
+
+    modules = _reactor_modules(project_root)
+    source_roots = _main_source_roots(project_root, modules)
+
+    changed: Optional[Tuple[Path, List[str]]] = None
+    lost_commit: Optional[str] = None
+    if snapshot is not None:
+        changed = _git_changed_paths(project_root, snapshot.get("commit"))
+        commit = snapshot.get("commit")
+        if changed is None and commit:
+            in_repo = _run_git(project_root, ["rev-parse", "--git-dir"]).returncode == 0
+            exists = _run_git(project_root, ["cat-file", "-e", f"{commit}^{{commit}}"]).returncode == 0
+            if in_repo and not exists:
+                # Diff base rewritten or collected: start over from a full analysis
+                lost_commit, snapshot = commit, None
+
+    # 1) Bring the index up to date
+    if snapshot is None:
+        sources = sorted(_find_java_sources(project_root, modules))
+        found, stats = _load_classes(project_root, sources, workers=workers, modules=modules)
+        index: Dict[str, Optional[ClassInfo]] = {
+            src.relative_to(project_root).as_posix(): info for src, info in zip(sources, found)
+        }
+        previous: Dict[str, Optional[ClassInfo]] = {}
+        reparsed: List[str] = []
+        mode = "full"
+    else:
+        index = {}
+        for key, cdict in snapshot["files"].items():
+            info = _class_info_from_dict(cdict) if cdict is not None else None
+            if info is not None:
+                info.file_path = str(project_root / key)
+            index[key] = info
+        previous = dict(index)
+
+        if changed is None:
+            return {"error": f"Could not determine changed files with git under {project_root}."}
+        toplevel, paths = changed
+        reparsed = sorted(
+            set(_java_changes_under(project_root, toplevel, paths, source_roots)) | set(snapshot.get("dirty_files", []))
+        )
+
+        existing = [k for k in reparsed if (project_root / k).exists()]
+        found, stats = _load_classes(
+            project_root, [project_root / k for k in existing], workers=workers, prune=False, modules=modules
+        )
+        for k in reparsed:
+            index.pop(k, None)
+        index.update(zip(existing, found))
+        mode = "incremental"
+
+    # 2) Work out what changed relative to the requested base
+    status = _git_changed_paths(project_root, None)
+    dirty_files = _java_changes_under(project_root, *status, source_roots) if status is not None else []
+
+    if base_ref:
+        changed = _git_changed_paths(project_root, base_ref)
+        if changed is None:
+            return {"error": f"Could not diff against '{base_ref}' under {project_root}."}
+        toplevel, paths = changed
+        delta_files = _java_changes_under(project_root, toplevel, paths, source_roots)
+        old_versions: Dict[str, Optional[ClassInfo]] = {}
+        for k in delta_files:
+            rel_top = (project_root / k).relative_to(toplevel).as_posix()
+            shown = _run_git(project_root, ["show", f"{base_ref}:{rel_top}"])
+            old_versions[k] = (
+                _extract_package_and_classes(project_root / k, code=shown.stdout)
+                if shown.returncode == 0
+                else None
+            )
+        delta = _method_delta(old_versions, index, delta_files)
+        delta_base = base_ref
+    elif snapshot is not None:
+        delta_files = reparsed
+        delta = _method_delta(previous, index, delta_files)
+        delta_base = snapshot.get("commit")
+    else:
+        delta_files = []
+        delta = None
+        delta_base = None
+
+    _save_analysis_snapshot(project_root, head_commit, dirty_files, index)
+
+    classes: List[ClassInfo] = []
+    for key in sorted(index, key=Path):
+        info = index[key]
+        if info is not None:
+            classes.append(info)
+    result = _summarize_analysis(project_root, len(index), classes)
+    result.update(stats)
+    result["incremental"] = {
+        "mode": mode,
+        "base": delta_base,
+        "head": head_commit,
+        "reparsed_files": reparsed,
+        "changed_files": delta_files,
+        "delta": delta,
     }
+    if lost_commit is not None:
+        result["incremental"]["missing_snapshot_commit"] = lost_commit
+    return result
+
 ################## Coverage Analysis ########################
 
 from typing import Tuple
@@ -149,150 +831,552 @@ def _find_jacoco_xml(project_root: Path) -> Optional[Path]:
     
     return None
 
-def _coverage_from_counters(elem: ET.Element, counter_type: str = "INSTRUCTION") -> Tuple[int, int, float]:
+def _find_jacoco_reports(project_root: Path) -> List[Path]:
+    """
+    JaCoCo reports describing the project: one target/site/jacoco/jacoco.xml
+    per reactor module that has one, else the single report _find_jacoco_xml finds.
+    """
+    modules = _reactor_modules(project_root)
+    if modules:
+        reports = [
+            m / "target" / "site" / "jacoco" / "jacoco.xml"
+            for m in [project_root, *modules]
+            if (m / "target" / "site" / "jacoco" / "jacoco.xml").exists()
+        ]
+        if reports:
+            return reports
+
+    single = _find_jacoco_xml(project_root)
+    return [single] if single is not None else []
+
+def _iter_jacoco_report(jacoco_xml: Path) -> Iterator[Tuple[str, str, ET.Element]]:
+    """
+    Stream a JaCoCo XML report with iterparse instead of building the whole DOM.
+
+    Yields ("class", package, elem) and ("sourcefile", package, elem) for each
+    completed element, then ("package", package, elem) holding only the package
+    counters, and finally ("report", "", elem) holding the report counters.
+    Package names are dotted ("main/price" -> "main.price"). Every element is
+    detached from its parent once yielded, so memory stays flat regardless of
+    the report size; callers must not keep references to yielded elements.
+    """
+    stack: List[ET.Element] = []
+    pkg_name = ""
+
+    for event, elem in ET.iterparse(str(jacoco_xml), events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "package":
+                pkg_name = elem.attrib.get("name", "").replace("/", ".").strip(".")
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        tag = elem.tag
+
+        if tag in ("class", "sourcefile") and parent is not None and parent.tag == "package":
+            yield tag, pkg_name, elem
+            parent.remove(elem)
+        elif tag == "package":
+            yield "package", pkg_name, elem
+            if parent is not None:
+                parent.remove(elem)
+            pkg_name = ""
+        elif tag == "report" and parent is None:
+            yield "report", "", elem
+
+def _read_counters(elem: ET.Element) -> Dict[str, Tuple[int, int]]:
     """
-    Read JaCoCo <counter type="INSTRUCTION" missed="X" covered="Y"> and
-    return (missed, covered, ratio).
+    Read the JaCoCo <counter type="..." missed="X" covered="Y"> children of elem
+    into { type: (missed, covered) }.
     """
-    missed = covered = 0
+    counters: Dict[str, Tuple[int, int]] = {}
     for c in elem.findall("counter"):
-        if c.attrib.get("type") == counter_type:
-            missed = int(c.attrib.get("missed", "0"))
-            covered = int(c.attrib.get("covered", "0"))
-            break
+        ctype = c.attrib.get("type", "")
+        if ctype not in counters:
+            counters[ctype] = (int(c.attrib.get("missed", "0")), int(c.attrib.get("covered", "0")))
+    return counters
 
+def _coverage_from_counters(counters: Dict[str, Tuple[int, int]], counter_type: str = "INSTRUCTION") -> Tuple[int, int, float]:
+    """
+    Return (missed, covered, ratio) for one counter type (0/0 when absent).
+    """
+    missed, covered = counters.get(counter_type, (0, 0))
     total = missed + covered
     ratio = 0.0 if total == 0 else covered / total
     return missed, covered, ratio
 
-def _find_uncovered_lines(method_elem: ET.Element) -> List[int]:
-    uncovered: List[int] = []
-
-    for line_elem in method_elem.findall("line"):
-        nr = int(line_elem.attrib.get("nr", "0"))
-        mi = int(line_elem.attrib.get("mi", "0"))
-        ci = int(line_elem.attrib.get("ci", "0"))
-        if nr > 0 and mi > 0 and ci == 0:
-            uncovered.append(nr)
-    return uncovered
+@dataclass
+class LineColumns:
+    """
+    Line coverage of one source file stored column-wise in compact int arrays
+    (~20 bytes per line instead of a tuple of five int objects). Rows are kept
+    sorted by line number so method windows can be located by bisection.
+    """
+    nr: array
+    mi: array
+    ci: array
+    mb: array
+    cb: array
+
+    @classmethod
+    def empty(cls) -> "LineColumns":
+        return cls(array("i"), array("i"), array("i"), array("i"), array("i"))
+
+    def append(self, nr: int, mi: int, ci: int, mb: int, cb: int) -> None:
+        self.nr.append(nr)
+        self.mi.append(mi)
+        self.ci.append(ci)
+        self.mb.append(mb)
+        self.cb.append(cb)
+
+    def sort(self) -> None:
+        if all(a < b for a, b in zip(self.nr, self.nr[1:])):
+            return
+        rows = sorted(set(zip(self.nr, self.mi, self.ci, self.mb, self.cb)))
+        for col, values in zip((self.nr, self.mi, self.ci, self.mb, self.cb), zip(*rows)):
+            col[:] = array("i", values)
+
+    def window(self, start: int, end: int) -> Tuple[int, int]:
+        """Row slice [lo, hi) holding the lines numbered start..end."""
+        return bisect_left(self.nr, start), bisect_right(self.nr, end)
+
+_NO_LINES = LineColumns.empty()
+
+def _uncovered_ranges(
+    cols: LineColumns,
+    start: int,
+    end: int,
+    limit: int,
+) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Collapse the uncovered lines (missed and no covered instructions) numbered
+    start..end into consecutive (first, last) ranges, stopping after `limit`
+    lines. Returns (ranges, number of uncovered lines).
 
-def _group_into_ranges(lines: List[int]) -> List[Tuple[int, int]]:
-    if not lines:
-        return []
-    lines = sorted(set(lines))
+    Rows are already sorted and unique, so this is a single pass over the
+    bisected window with no intermediate per-line lists.
+    """
+    lo, hi = cols.window(max(start, 1), end)
+    nr, mi, ci = cols.nr, cols.mi, cols.ci
     ranges: List[Tuple[int, int]] = []
-    start = prev = lines[0]
-    for n in lines[1:]:
+    count = 0
+    first = prev = -1
+
+    for i in range(lo, hi):
+        if count >= limit:
+            break
+        if mi[i] == 0 or ci[i] != 0:
+            continue
+        n = nr[i]
+        count += 1
         if n == prev + 1:
             prev = n
             continue
-        ranges.append((start, prev))
-        start = prev = n
-    ranges.append((start, prev))
-    return ranges
+        if first != -1:
+            ranges.append((first, prev))
+        first = prev = n
+
+    if first != -1:
+        ranges.append((first, prev))
+    return ranges, count
+
+@dataclass
+class MethodCoverage:
+    name: str
+    descriptor: str
+    line: int
+    counters: Dict[str, Tuple[int, int]]
+    # Source line window attributed to this method (inclusive)
+    first_line: int = 0
+    last_line: int = 0
+
+@dataclass
+class ClassCoverage:
+    package: str
+    class_name: str
+    fqn: str
+    source_file: str
+    counters: Dict[str, Tuple[int, int]]
+    methods: List[MethodCoverage]
+    # Reactor module of the report the class came from ("" for a single report)
+    module: str = ""
 
-def _analyze_coverage_internal(jacoco_xml: Path, min_coverage: float = 0.8) -> Dict[str, Any]:
+@dataclass
+class CoverageModel:
+    report_file: str
+    counters: Dict[str, Tuple[int, int]]
+    packages: Dict[str, Dict[str, Tuple[int, int]]]
+    classes: List[ClassCoverage]
+    # (module, package, source file) -> line columns; two modules may hold
+    # a file of the same name in the same package
+    source_lines: Dict[Tuple[str, str, str], LineColumns]
+    # reports an aggregated (multi-module) model was merged from
+    module_reports: List[str] = field(default_factory=list)
+
+    def lines_for(self, cls: ClassCoverage) -> LineColumns:
+        return self.source_lines.get((cls.module, cls.package, cls.source_file), _NO_LINES)
+
+# report path -> (mtime_ns, size, model)
+_COVERAGE_MODELS: Dict[str, Tuple[int, int, CoverageModel]] = {}
+
+def _assign_method_line_windows(classes: List[ClassCoverage]) -> None:
     """
-    Parse a JaCoCo XML report, identify under-covered classes/methods,
-    and generate improvement recommendations.
+    JaCoCo reports line data per source file, not per method. Attribute lines
+    to methods by their first line: a method owns every line up to the next
+    method (of any class in the same source file) that starts later.
     """
-    tree = ET.parse(jacoco_xml)
-    root = tree.getroot()  # <report>
-
-    classes_summary: List[Dict[str, Any]] = []
+    by_source: Dict[Tuple[str, str], List[MethodCoverage]] = {}
+    for cls in classes:
+        by_source.setdefault((cls.package, cls.source_file), []).extend(
+            m for m in cls.methods if m.line > 0
+        )
 
-    # JaCoCo structure: <report><package><class><method><line>...
-    for pkg_elem in root.findall("package"):
-        pkg_name_raw = pkg_elem.attrib.get("name", "")  # e.g. "main/price"
-        pkg_name = pkg_name_raw.replace("/", ".").strip(".")
+    for methods in by_source.values():
+        starts = sorted({m.line for m in methods})
+        next_start = {line: nxt for line, nxt in zip(starts, starts[1:])}
+        for m in methods:
+            m.first_line = m.line
+            m.last_line = next_start[m.line] - 1 if m.line in next_start else 2**31 - 1
 
-        for class_elem in pkg_elem.findall("class"):
-            class_name_raw = class_elem.attrib.get("name", "")  # e.g. "main/price/Price"
-            sourcefile = class_elem.attrib.get("sourcefilename", "")
+def _build_coverage_model(jacoco_xml: Path) -> CoverageModel:
+    """
+    Summarize a JaCoCo report in a single streaming pass.
+    """
+    classes: List[ClassCoverage] = []
+    packages: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    source_lines: Dict[Tuple[str, str, str], LineColumns] = {}
+    report_counters: Dict[str, Tuple[int, int]] = {}
+
+    for kind, pkg_name, elem in _iter_jacoco_report(jacoco_xml):
+        if kind == "class":
+            class_name_raw = elem.attrib.get("name", "")  # e.g. "main/price/Price"
+            sourcefile = elem.attrib.get("sourcefilename", "")
             # Best-effort FQN
             simple_name = class_name_raw.split("/")[-1] if class_name_raw else sourcefile.replace(".java", "")
             fqn = f"{pkg_name}.{simple_name}" if pkg_name else simple_name
-
-            missed_instr, covered_instr, instr_ratio = _coverage_from_counters(class_elem, "INSTRUCTION")
-            _, _, branch_ratio = _coverage_from_counters(class_elem, "BRANCH")
-
-            methods_info: List[Dict[str, Any]] = []
-            total_uncovered_lines = 0
-
-            for method_elem in class_elem.findall("method"):
-                m_name = method_elem.attrib.get("name", "")
-                desc = method_elem.attrib.get("desc", "")
-                line = int(method_elem.attrib.get("line", "0"))
-
-                # Method-level coverage (optional; if missing, defaults to 0/0)
-                m_missed_instr, m_covered_instr, m_ratio = _coverage_from_counters(method_elem, "INSTRUCTION")
-                uncovered_lines = _find_uncovered_lines(method_elem)
-                total_uncovered_lines += len(uncovered_lines)
-                ranges = _group_into_ranges(uncovered_lines)
-
-                # Heuristic recommendation
-                recs: List[str] = []
-                if m_ratio < min_coverage and uncovered_lines:
-                    # Very simple heuristics just to give the agent something meaningful to say
-                    if m_name.startswith("get") or m_name.startswith("set"):
-                        recs.append("Add tests exercising this accessor/mutator with representative field values.")
-                    elif "equals" in m_name.lower():
-                        recs.append("Add tests for equals() covering same-object, equal-object, and non-equal cases.")
-                    elif "toString" in m_name:
-                        recs.append("Add tests verifying the toString() output for key object states.")
-                    else:
-                        recs.append("Add tests that execute all branches and edge cases for this method.")
-
-                    if any("null" in d.lower() for d in [desc]):
-                        recs.append("Include tests with null or missing inputs if allowed by the API.")
-
-                methods_info.append(
-                    {
-                        "name": m_name,
-                        "descriptor": desc,
-                        "line": line,
-                        "instruction_coverage": m_ratio,
-                        "uncovered_line_ranges": ranges,
-                        "recommendations": recs,
-                    }
-                )
-
-            class_rec: List[str] = []
-            if instr_ratio < min_coverage:
-                class_rec.append(
-                    f"Increase instruction coverage for {fqn} "
-                    f"(current ~{instr_ratio:.0%}); focus on methods with uncovered lines."
+            methods = [
+                MethodCoverage(
+                    name=m.attrib.get("name", ""),
+                    descriptor=m.attrib.get("desc", ""),
+                    line=int(m.attrib.get("line", "0")),
+                    counters=_read_counters(m),
                 )
-            if branch_ratio < min_coverage:
-                class_rec.append(
-                    f"Add tests to exercise alternate branches in {fqn} (branch coverage ~{branch_ratio:.0%})."
+                for m in elem.findall("method")
+            ]
+            classes.append(
+                ClassCoverage(
+                    package=pkg_name,
+                    class_name=simple_name,
+                    fqn=fqn,
+                    source_file=sourcefile,
+                    counters=_read_counters(elem),
+                    methods=methods,
                 )
-            if total_uncovered_lines == 0 and instr_ratio < 1.0:
-                class_rec.append(
-                    "JaCoCo reports partial coverage; confirm that helper methods and early returns are tested."
+            )
+        elif kind == "sourcefile":
+            cols = source_lines.setdefault(("", pkg_name, elem.attrib.get("name", "")), LineColumns.empty())
+            for line_elem in elem.findall("line"):
+                a = line_elem.attrib
+                cols.append(
+                    int(a.get("nr", "0")),
+                    int(a.get("mi", "0")),
+                    int(a.get("ci", "0")),
+                    int(a.get("mb", "0")),
+                    int(a.get("cb", "0")),
                 )
+        elif kind == "package":
+            packages[pkg_name] = _read_counters(elem)
+        elif kind == "report":
+            report_counters = _read_counters(elem)
+
+    for cols in source_lines.values():
+        cols.sort()
+    _assign_method_line_windows(classes)
+
+    return CoverageModel(
+        report_file=str(jacoco_xml),
+        counters=report_counters,
+        packages=packages,
+        classes=classes,
+        source_lines=source_lines,
+    )
+
+def _load_coverage_model(jacoco_xml: Path) -> CoverageModel:
+    """
+    Return the coverage model for jacoco_xml, parsing the report only when it
+    changed (by mtime/size) since the last call.
+    """
+    st = jacoco_xml.stat()
+    key = str(jacoco_xml.resolve())
+    cached = _COVERAGE_MODELS.get(key)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    model = _build_coverage_model(jacoco_xml)
+    _COVERAGE_MODELS[key] = (st.st_mtime_ns, st.st_size, model)
+    return model
+
+def _add_counters(into: Dict[str, Tuple[int, int]], counters: Dict[str, Tuple[int, int]]) -> None:
+    for kind, (missed, covered) in counters.items():
+        m, c = into.get(kind, (0, 0))
+        into[kind] = (m + missed, c + covered)
+
+def _report_module(report_file: str, common: str) -> str:
+    """
+    Module of a JaCoCo report, as the path of its module directory
+    (<module>/target/site/jacoco/jacoco.xml) relative to `common`.
+    """
+    path = Path(report_file)
+    module_dir = path.parents[3] if path.parent.parts[-3:] == ("target", "site", "jacoco") else path.parent
+    rel = os.path.relpath(module_dir, common)
+    return "" if rel == "." else Path(rel).as_posix()
+
+def _merge_coverage_models(models: List[CoverageModel]) -> CoverageModel:
+    """
+    One coverage view over several module reports. Counters of a package
+    split across modules are summed; classes and line data are tagged with
+    their module, so same-named files of different modules stay apart.
+    """
+    common = os.path.commonpath([m.report_file for m in models])
+    counters: Dict[str, Tuple[int, int]] = {}
+    packages: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    classes: List[ClassCoverage] = []
+    source_lines: Dict[Tuple[str, str, str], LineColumns] = {}
+    for model in models:
+        module = _report_module(model.report_file, common)
+        _add_counters(counters, model.counters)
+        for pkg, pkg_counters in model.packages.items():
+            _add_counters(packages.setdefault(pkg, {}), pkg_counters)
+        # Copies: the per-report models are cached and shared
+        classes.extend(replace(cls, module=module) for cls in model.classes)
+        for (_, pkg, source), cols in model.source_lines.items():
+            source_lines[(module, pkg, source)] = cols
+
+    return CoverageModel(
+        report_file=common,
+        counters=counters,
+        packages=packages,
+        classes=classes,
+        source_lines=source_lines,
+        module_reports=[m.report_file for m in models],
+    )
+
+# report paths -> (per-report models it was merged from, merged model)
+_MERGED_COVERAGE_MODELS: Dict[Tuple[str, ...], Tuple[List[CoverageModel], CoverageModel]] = {}
+
+def _load_coverage_reports(jacoco_xml: Union[Path, List[Path]]) -> CoverageModel:
+    """
+    Coverage model of one report, or the aggregate of several (one per
+    reactor module). Each report is only re-parsed when it changed, and the
+    aggregate is only rebuilt when one of its module models was.
+    """
+    reports = [jacoco_xml] if isinstance(jacoco_xml, Path) else list(jacoco_xml)
+    if len(reports) == 1:
+        return _load_coverage_model(reports[0])
+
+    models = [_load_coverage_model(r) for r in reports]
+    key = tuple(str(r) for r in reports)
+    cached = _MERGED_COVERAGE_MODELS.get(key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], models)):
+        return cached[1]
+
+    merged = _merge_coverage_models(models)
+    _MERGED_COVERAGE_MODELS[key] = (models, merged)
+    return merged
+
+def _analyze_coverage_internal(jacoco_xml: Union[Path, List[Path]], min_coverage: float = 0.8) -> Dict[str, Any]:
+    """
+    Summarize a JaCoCo XML report (or the per-module reports of a reactor),
+    identify under-covered classes/methods, and generate improvement
+    recommendations.
+    """
+    model = _load_coverage_reports(jacoco_xml)
+    classes_summary: List[Dict[str, Any]] = []
+
+    for cls in model.classes:
+        fqn = cls.fqn
+        source_cols = model.lines_for(cls)
+
+        missed_instr, covered_instr, instr_ratio = _coverage_from_counters(cls.counters, "INSTRUCTION")
+        _, _, branch_ratio = _coverage_from_counters(cls.counters, "BRANCH")
 
-            classes_summary.append(
+        methods_info: List[Dict[str, Any]] = []
+        total_uncovered_lines = 0
+
+        for method in cls.methods:
+            m_name = method.name
+            desc = method.descriptor
+            line = method.line
+
+            # Method-level coverage (optional; if missing, defaults to 0/0)
+            m_missed_instr, m_covered_instr, m_ratio = _coverage_from_counters(method.counters, "INSTRUCTION")
+            # The LINE counter bounds how many of the window's lines really belong to this method
+            line_missed = method.counters.get("LINE", (0, 0))[0]
+            if method.first_line:
+                ranges, num_uncovered = _uncovered_ranges(source_cols, method.first_line, method.last_line, line_missed)
+            else:
+                ranges, num_uncovered = [], 0
+            total_uncovered_lines += num_uncovered
+
+            # Heuristic recommendation
+            recs: List[str] = []
+            if m_ratio < min_coverage and num_uncovered:
+                # Very simple heuristics just to give the agent something meaningful to say
+                if m_name.startswith("get") or m_name.startswith("set"):
+                    recs.append("Add tests exercising this accessor/mutator with representative field values.")
+                elif "equals" in m_name.lower():
+                    recs.append("Add tests for equals() covering same-object, equal-object, and non-equal cases.")
+                elif "toString" in m_name:
+                    recs.append("Add tests verifying the toString() output for key object states.")
+                else:
+                    recs.append("Add tests that execute all branches and edge cases for this method.")
+
+                if any("null" in d.lower() for d in [desc]):
+                    recs.append("Include tests with null or missing inputs if allowed by the API.")
+
+            methods_info.append(
                 {
-                    "package": pkg_name,
-                    "class_name": simple_name,
-                    "fqn": fqn,
-                    "source_file": sourcefile,
-                    "instruction_coverage": instr_ratio,
-                    "branch_coverage": branch_ratio,
-                    "uncovered_lines_total": total_uncovered_lines,
-                    "methods": methods_info,
-                    "recommendations": class_rec,
+                    "name": m_name,
+                    "descriptor": desc,
+                    "line": line,
+                    "instruction_coverage": m_ratio,
+                    "uncovered_line_ranges": ranges,
+                    "recommendations": recs,
                 }
             )
 
+        class_rec: List[str] = []
+        if instr_ratio < min_coverage:
+            class_rec.append(
+                f"Increase instruction coverage for {fqn} "
+                f"(current ~{instr_ratio:.0%}); focus on methods with uncovered lines."
+            )
+        if branch_ratio < min_coverage:
+            class_rec.append(
+                f"Add tests to exercise alternate branches in {fqn} (branch coverage ~{branch_ratio:.0%})."
+            )
+        if total_uncovered_lines == 0 and instr_ratio < 1.0:
+            class_rec.append(
+                "JaCoCo reports partial coverage; confirm that helper methods and early returns are tested."
+            )
+
+        classes_summary.append(
+            {
+                "package": cls.package,
+                "class_name": cls.class_name,
+                "fqn": fqn,
+                "source_file": cls.source_file,
+                "instruction_coverage": instr_ratio,
+                "branch_coverage": branch_ratio,
+                "uncovered_lines_total": total_uncovered_lines,
+                "methods": methods_info,
+                "recommendations": class_rec,
+            }
+        )
+
     # Sort by instruction coverage ascending (worst first)
     classes_summary.sort(key=lambda c: c["instruction_coverage"])
 
-    return {
-        "report_file": str(jacoco_xml),
+    result: Dict[str, Any] = {
+        "report_file": model.report_file,
         "classes": classes_summary,
     }
+    if model.module_reports:
+        result["module_reports"] = model.module_reports
+    return result
+
+# Bytecode-only methods JaCoCo reports that have no source counterpart
+_SYNTHETIC_METHOD_PREFIXES = ("<clinit>", "lambda$", "access$", "$")
+
+# Coverage-gain scheduling: a missed branch is worth two instructions; each
+# uncovered line range needs its own input setup, and bigger methods take
+# longer to understand
+_BRANCH_GAIN_WEIGHT = 2.0
+_RANGE_COST = 0.5
+_SIZE_COST = 0.25
+
+def _plan_next_targets_internal(
+    jacoco_xml: Union[Path, List[Path]],
+    top_k: int = 10,
+    budget: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Rank methods by expected coverage gain per unit of test-writing effort.
+
+      gain  = missed instructions + 2 * missed branches
+      cost  = 1 + 0.5 * uncovered line ranges + 0.25 * log2(1 + instructions)
+      score = gain / cost
+
+    Targets are taken greedily by score until top_k targets are chosen or
+    their summed cost would exceed `budget` (0 = no budget). Nested and
+    anonymous classes are left out, as spec_target cannot resolve them.
+    """
+    model = _load_coverage_reports(jacoco_xml)
+    candidates: List[Dict[str, Any]] = []
+    total_gain = 0.0
+
+    for cls in model.classes:
+        if "$" in cls.class_name:
+            continue  # nested/anonymous classes are not in the source symbol index
+        source_cols = model.lines_for(cls)
+        for method in cls.methods:
+            if method.name.startswith(_SYNTHETIC_METHOD_PREFIXES):
+                continue
+            missed_instr, covered_instr, instr_ratio = _coverage_from_counters(method.counters, "INSTRUCTION")
+            missed_branch, _, _ = _coverage_from_counters(method.counters, "BRANCH")
+            gain = missed_instr + _BRANCH_GAIN_WEIGHT * missed_branch
+            if gain <= 0:
+                continue
+            total_gain += gain
+
+            line_missed = method.counters.get("LINE", (0, 0))[0]
+            if method.first_line:
+                ranges, _ = _uncovered_ranges(source_cols, method.first_line, method.last_line, line_missed)
+            else:
+                ranges = []
+            cost = 1.0 + _RANGE_COST * len(ranges) + _SIZE_COST * math.log2(1 + missed_instr + covered_instr)
+            name = cls.class_name if method.name == "<init>" else method.name
+            candidates.append(
+                {
+                    "class_fqn": cls.fqn,
+                    "method_name": name,
+                    "descriptor": method.descriptor,
+                    "line": method.line,
+                    "spec_target": f"{cls.fqn}#{name}",
+                    "instruction_coverage": instr_ratio,
+                    "missed_instructions": missed_instr,
+                    "missed_branches": missed_branch,
+                    "uncovered_line_ranges": ranges,
+                    "gain": gain,
+                    "cost": round(cost, 3),
+                    "score": round(gain / cost, 3),
+                }
+            )
+
+    candidates.sort(key=lambda c: (-c["score"], -c["gain"], c["class_fqn"], c["line"]))
+
+    selected: List[Dict[str, Any]] = []
+    spent = 0.0
+    for c in candidates:
+        if len(selected) >= top_k:
+            break
+        if budget > 0 and spent + c["cost"] > budget:
+            continue  # a cheaper target further down may still fit
+        selected.append(c)
+        spent += c["cost"]
+
+    planned_gain = sum(c["gain"] for c in selected)
+    return {
+        "report_file": model.report_file,
+        "targets": selected,
+        "planned_gain": planned_gain,
+        "planned_cost": round(spent, 3),
+        "total_missed_gain": total_gain,
+        "gain_share": planned_gain / total_gain if total_gain else 0.0,
+        "num_candidates": len(candidates),
+    }
+
 
 ################## JUnit Test Generation ###################
 
@@ -340,7 +1424,7 @@ def _build_test_class_content(class_info: ClassInfo) -> str:
         # Parameter TODOs
         for p in m.parameters:
             lines.append(
-                f"        // TODO: initialize parameter '{p['name']}' of type '{p['type']}'"
+                f"        // TODO: initialize parameter '{p.name}' of type '{p.type}'"
             )
 
         lines.append("")
@@ -353,7 +1437,7 @@ def _build_test_class_content(class_info: ClassInfo) -> str:
             call_prefix = f"{class_info.class_name}."
         # Constructors: keep generic stub
         call = f"{call_prefix}{m.name}("
-        call += ", ".join(p["name"] for p in m.parameters)
+        call += ", ".join(p.name for p in m.parameters)
         call += ")"
 
         if m.return_type and m.return_type.lower() != "void":
@@ -371,189 +1455,2011 @@ def _build_test_class_content(class_info: ClassInfo) -> str:
     lines.append("}")
     return pkg_line + imports + "\n".join(lines)
 
-def _generate_tests_internal(project_root: Path, overwrite: bool) -> Dict[str, Any]:
-    analysis = _analyze_project_internal(project_root)
-    class_dicts = analysis["classes"]
-
-    generated_files: List[str] = []
-    skipped_files: List[str] = []
-
-    for cdict in class_dicts:
-        # cdict is something like:
-        # {"package": ..., "class_name": ..., "file_path": ..., "methods": [ { ... }, ... ]}
-        # Rebuild MethodInfo objects from the method dicts:
-        method_infos = [
-            MethodInfo(
-                name=m["name"],
-                return_type=m["return_type"],
-                parameters=m["parameters"],
-                modifiers=m["modifiers"],
-                is_static=m["is_static"],
-                is_constructor=m["is_constructor"],
-            )
-            for m in cdict["methods"]
-        ]
+_JUNIT_FINGERPRINT_FILE = "junit-fingerprints.json"
+# Bump when _build_test_class_content changes so every skeleton is refreshed
+_JUNIT_TEMPLATE_VERSION = 1
 
-        class_info = ClassInfo(
-            package=cdict["package"],
-            class_name=cdict["class_name"],
-            file_path=cdict["file_path"],
-            methods=method_infos,
-        )
+def _class_test_fingerprint(class_info: ClassInfo) -> str:
+    """
+    Hash of everything _build_test_class_content reads: the class name,
+    package and public method signatures.
+    """
+    public = [
+        [m.name, m.return_type, [[p.name, p.type] for p in m.parameters], m.is_static, m.is_constructor]
+        for m in class_info.methods
+        if "public" in m.modifiers
+    ]
+    payload = json.dumps([_JUNIT_TEMPLATE_VERSION, class_info.package, class_info.class_name, public])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _load_junit_fingerprints(project_root: Path) -> Dict[str, Any]:
+    """
+    Fingerprints of previously handled test files, keyed by the test path
+    relative to project_root:
+      { "class": fqn, "fingerprint": str, "owned": bool, "mtime_ns": int, "size": int }
+    "owned" marks files this tool wrote; mtime/size tell whether they were
+    edited since.
+    """
+    try:
+        data = json.loads((project_root / _STATE_DIR_NAME / _JUNIT_FINGERPRINT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    entries = data.get("entries") if isinstance(data, dict) else None
+    return entries if isinstance(entries, dict) else {}
+
+def _save_junit_fingerprints(project_root: Path, entries: Dict[str, Any]) -> None:
+    fp_file = _state_dir(project_root) / _JUNIT_FINGERPRINT_FILE
+    tmp = fp_file.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"version": 1, "entries": entries}, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, fp_file)
+
+def _write_test_skeleton(test_file: Path, content: str) -> Tuple[bool, int, int]:
+    """
+    Write content unless the file already holds exactly that.
+    Returns (written, mtime_ns, size).
+    """
+    try:
+        same = test_file.read_text(encoding="utf-8") == content
+    except (OSError, UnicodeDecodeError):
+        same = False
+    if not same:
+        test_file.parent.mkdir(parents=True, exist_ok=True)
+        test_file.write_text(content, encoding="utf-8")
+    st = test_file.stat()
+    return not same, st.st_mtime_ns, st.st_size
 
+def _generate_tests_internal(project_root: Path, overwrite: bool) -> Dict[str, Any]:
+    """
+    Generate skeletons for classes whose public signatures changed since the
+    last call. Per class status:
+      generated   - new test file written
+      regenerated - signatures changed; the tool's own, unedited file was rewritten
+      unchanged   - same signatures as last time and the file still exists
+                    (one exists() check, no reads or writes)
+      stale       - signatures changed (or the class is gone) but the test file
+                    was written or edited by hand, so it was left alone
+      skipped     - a hand-written test file already exists (one exists() check once seen)
+    overwrite=True replaces hand-written or edited files as well.
+    """
+    modules = _reactor_modules(project_root)
+    main_roots = _main_source_roots(project_root, modules)
+    classes = _project_classes(project_root, modules)
+
+    previous = _load_junit_fingerprints(project_root)
+    entries: Dict[str, Any] = {}
+    results: List[Dict[str, Any]] = []
+
+    for class_info in classes:
         # Only create tests for classes that have at least one public method
-        if not any("public" in m["modifiers"] for m in cdict["methods"]):
+        if not any("public" in m.modifiers for m in class_info.methods):
             continue
 
-        src_path = Path(class_info.file_path)
+        # Next to the class: src/test/java of the module that owns it
+        test_root = _test_root_for(project_root, Path(class_info.file_path), main_roots)
+        test_file = test_root / _package_to_dir(class_info.package) / f"{class_info.class_name}Test.java"
+        key = test_file.relative_to(project_root).as_posix()
+        fqn = _class_fqn(class_info.package, class_info.class_name)
+        fingerprint = _class_test_fingerprint(class_info)
+        prev = previous.get(key)
+
+        # A deleted test file falls through and is generated again
+        if prev is not None and prev["fingerprint"] == fingerprint and not overwrite and test_file.exists():
+            entries[key] = prev
+            status = "unchanged" if prev["owned"] else "skipped"
+            results.append({"class": fqn, "test_file": str(test_file), "status": status})
+            continue
 
-        # Map src/main/java/... to src/test/java/... (or general best effort)
         try:
-            _ = src_path.relative_to(project_root / "src" / "main" / "java")
-            test_root = project_root / "src" / "test" / "java"
-        except ValueError:
-            # Fallback: project_root as base
-            test_root = project_root / "src" / "test" / "java"
+            st = test_file.stat()
+        except FileNotFoundError:
+            st = None
+
+        if st is not None:
+            ours = (
+                prev is not None
+                and prev["owned"]
+                and prev["mtime_ns"] == st.st_mtime_ns
+                and prev["size"] == st.st_size
+            )
+            if not ours and not overwrite:
+                # Hand-written or edited: remember the signatures it was seen with
+                entries[key] = {"class": fqn, "fingerprint": fingerprint, "owned": False, "mtime_ns": 0, "size": 0}
+                status = "skipped" if prev is None else "stale"
+                results.append({"class": fqn, "test_file": str(test_file), "status": status})
+                continue
+            if ours and prev["fingerprint"] == fingerprint:
+                # overwrite=True on a file that is already up to date
+                entries[key] = prev
+                results.append({"class": fqn, "test_file": str(test_file), "status": "unchanged"})
+                continue
 
-        pkg_dir = _package_to_dir(class_info.package)
-        dest_dir = test_root / pkg_dir
-        dest_dir.mkdir(parents=True, exist_ok=True)
+        content = _build_test_class_content(class_info)
+        written, mtime_ns, size = _write_test_skeleton(test_file, content)
+        entries[key] = {"class": fqn, "fingerprint": fingerprint, "owned": True, "mtime_ns": mtime_ns, "size": size}
+        if st is None:
+            status = "generated"
+        else:
+            status = "regenerated" if written else "unchanged"
+        results.append({"class": fqn, "test_file": str(test_file), "status": status})
 
-        test_file = dest_dir / f"{class_info.class_name}Test.java"
+    # Generated tests of classes that disappeared or lost their public methods
+    for key, prev in previous.items():
+        if key not in entries and prev["owned"] and (project_root / key).exists():
+            entries[key] = prev
+            results.append({"class": prev["class"], "test_file": str(project_root / key), "status": "stale"})
 
-        if test_file.exists() and not overwrite:
-            skipped_files.append(str(test_file))
-            continue
+    if entries != previous:
+        _save_junit_fingerprints(project_root, entries)
 
-        content = _build_test_class_content(class_info)
-        test_file.write_text(content, encoding="utf-8")
-        generated_files.append(str(test_file))
+    counts = {s: 0 for s in ("generated", "regenerated", "unchanged", "stale", "skipped")}
+    for r in results:
+        counts[r["status"]] += 1
 
     return {
         "project_root": str(project_root),
-        "generated_files": generated_files,
-        "skipped_files": skipped_files,
+        "generated_files": [r["test_file"] for r in results if r["status"] in ("generated", "regenerated")],
+        "skipped_files": [r["test_file"] for r in results if r["status"] in ("skipped", "stale")],
+        "classes": results,
+        "status_counts": counts,
         "analysis_summary": {
-            "num_classes": analysis["num_classes"],
-            "num_public_methods": analysis["num_public_methods"],
+            "num_classes": len(classes),
+            "num_public_methods": sum(sum(1 for m in c.methods if "public" in m.modifiers) for c in classes),
         },
     }
 
 ############### Maven test execution & parsing of results ######################
-def _parse_surefire_reports(reports_dir: Path) -> Dict[str, Any]:
+# Reports at least this big are streamed; smaller ones are parsed from the
+# bytes read for hashing. Streamed reports go to worker processes once there
+# is enough of them to pay for the pool start-up.
+_SUREFIRE_STREAM_BYTES = 1 << 20
+_SUREFIRE_PARALLEL_BYTES = 32 << 20
+
+# report path -> (mtime_ns, size, sha1, suite). Reports are parsed from
+# asyncio.to_thread workers too, so every access holds the lock.
+_SUREFIRE_SUITES: Dict[str, Tuple[int, int, str, Dict[str, Any]]] = {}
+_SUREFIRE_SUITES_LOCK = threading.Lock()
+
+def _parse_surefire_case(case: ET.Element) -> Dict[str, Any]:
+    status = "passed"
+    failure_message = None
+    failure_type = None
+    failure_text = None
+
+    failure_elem = case.find("failure")
+    error_elem = case.find("error")
+    skipped_elem = case.find("skipped")
+
+    if failure_elem is not None:
+        status = "failure"
+        failure_message = failure_elem.attrib.get("message")
+        failure_type = failure_elem.attrib.get("type")
+        failure_text = (failure_elem.text or "").strip()
+    elif error_elem is not None:
+        status = "error"
+        failure_message = error_elem.attrib.get("message")
+        failure_type = error_elem.attrib.get("type")
+        failure_text = (error_elem.text or "").strip()
+    elif skipped_elem is not None:
+        status = "skipped"
+
+    return {
+        "class_name": case.attrib.get("classname", ""),
+        "test_name": case.attrib.get("name", ""),
+        "time": case.attrib.get("time", "0"),
+        "status": status,
+        "message": failure_message,
+        "type": failure_type,
+        "details": failure_text,
+    }
+
+def _surefire_seconds(value: str) -> float:
+    # Older Surefire versions write locale-formatted times ("1,234.5")
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return 0.0
+
+def _surefire_suite(xml_file: Path, attrib: Dict[str, str], cases: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "suite_name": attrib.get("name", xml_file.name),
+        "file": str(xml_file),
+        "time": _surefire_seconds(attrib.get("time", "0")),
+        "tests": int(attrib.get("tests", "0")),
+        "failures": int(attrib.get("failures", "0")),
+        "errors": int(attrib.get("errors", "0")),
+        "skipped": int(attrib.get("skipped", "0")),
+        "cases": cases,
+    }
+
+def _parse_surefire_file(xml_file: Path) -> Dict[str, Any]:
+    """
+    Stream one TEST-*.xml report. Each <testcase> (with its captured output)
+    is dropped as soon as it has been summarized.
+    """
+    cases = []
+    root: Optional[ET.Element] = None
+    for _, elem in ET.iterparse(xml_file):
+        if elem.tag == "testcase":
+            cases.append(_parse_surefire_case(elem))
+            elem.clear()
+        root = elem  # the last element closed is <testsuite>
+    return _surefire_suite(xml_file, dict(root.attrib) if root is not None else {}, cases)
+
+def _parse_surefire_bytes(xml_file: Path, data: bytes) -> Dict[str, Any]:
+    root = ET.fromstring(data)  # <testsuite ...>
+    return _surefire_suite(xml_file, dict(root.attrib), [_parse_surefire_case(c) for c in root.iter("testcase")])
+
+def _surefire_report_stats(reports_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    (mtime_ns, size) of every report in reports_dir. Taken before a run, this
+    tells which reports the run wrote.
+    """
     if not reports_dir.exists():
-        return {"suites": [], "summary": {"total_tests": 0, "failures": 0, "errors": 0, "skipped": 0}}
-
-    suites = []
-    total_tests = total_failures = total_errors = total_skipped = 0
-
-    for xml_file in reports_dir.glob("TEST-*.xml"):
-        tree = ET.parse(xml_file)
-        root = tree.getroot()  # <testsuite ...>
-
-        tests = int(root.attrib.get("tests", "0"))
-        failures = int(root.attrib.get("failures", "0"))
-        errors = int(root.attrib.get("errors", "0"))
-        skipped = int(root.attrib.get("skipped", "0"))
-
-        total_tests += tests
-        total_failures += failures
-        total_errors += errors
-        total_skipped += skipped
-
-        cases = []
-        for case in root.findall("testcase"):
-            cname = case.attrib.get("classname", "")
-            name = case.attrib.get("name", "")
-            time = case.attrib.get("time", "0")
-
-            status = "passed"
-            failure_message = None
-            failure_type = None
-            failure_text = None
-
-            failure_elem = case.find("failure")
-            error_elem = case.find("error")
-            skipped_elem = case.find("skipped")
-
-            if failure_elem is not None:
-                status = "failure"
-                failure_message = failure_elem.attrib.get("message")
-                failure_type = failure_elem.attrib.get("type")
-                failure_text = (failure_elem.text or "").strip()
-            elif error_elem is not None:
-                status = "error"
-                failure_message = error_elem.attrib.get("message")
-                failure_type = error_elem.attrib.get("type")
-                failure_text = (error_elem.text or "").strip()
-            elif skipped_elem is not None:
-                status = "skipped"
-
-            cases.append(
+        return {}
+    stats = {}
+    for entry in os.scandir(reports_dir):
+        if entry.name.startswith("TEST-") and entry.name.endswith(".xml") and entry.is_file():
+            st = entry.stat()
+            stats[entry.path] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+def _parse_surefire_reports(
+    reports_dir: Path,
+    before_run: Optional[Dict[str, Tuple[int, int]]] = None,
+    workers: int = 0,
+) -> Dict[str, Any]:
+    """
+    Collect Surefire results from reports_dir.
+
+    With `before_run` (report stats taken before Maven started), only reports
+    the run created or rewrote are included; stale reports from earlier runs
+    are ignored. Reports are only re-parsed when their mtime/size and content
+    hash changed since they were last read; big reports are parsed in worker
+    processes (`workers` <= 0 means one per CPU).
+    """
+    empty_summary = {"total_tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    if not reports_dir.exists():
+        return {"suites": [], "summary": empty_summary}
+
+    start = time.perf_counter()
+    current = _surefire_report_stats(reports_dir)
+    in_scope = sorted(
+        path for path, stat in current.items() if before_run is None or before_run.get(path) != stat
+    )
+
+    suites_by_path: Dict[str, Dict[str, Any]] = {}
+    big: List[Tuple[str, str]] = []
+    parsed = 0
+
+    def remember(path: str, digest: str, suite: Dict[str, Any]) -> None:
+        mtime_ns, size = current[path]
+        with _SUREFIRE_SUITES_LOCK:
+            _SUREFIRE_SUITES[path] = (mtime_ns, size, digest, suite)
+        suites_by_path[path] = suite
+
+    for path in in_scope:
+        mtime_ns, size = current[path]
+        with _SUREFIRE_SUITES_LOCK:
+            cached = _SUREFIRE_SUITES.get(path)
+        if cached is not None and cached[0] == mtime_ns and cached[1] == size:
+            suites_by_path[path] = cached[3]
+            continue
+        if size >= _SUREFIRE_STREAM_BYTES:
+            with open(path, "rb") as fh:
+                digest = hashlib.file_digest(fh, "sha1").hexdigest()
+            data = None
+        else:
+            data = Path(path).read_bytes()
+            digest = hashlib.sha1(data).hexdigest()
+        if cached is not None and cached[2] == digest:
+            # Rewritten with identical content
+            remember(path, digest, cached[3])
+        elif data is None:
+            big.append((path, digest))
+        else:
+            remember(path, digest, _parse_surefire_bytes(Path(path), data))
+            parsed += 1
+
+    use_pool = len(big) > 1 and sum(current[p][1] for p, _ in big) >= _SUREFIRE_PARALLEL_BYTES
+    if use_pool:
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(big))) as pool:
+            for (path, digest), suite in zip(big, pool.map(_parse_surefire_file, [Path(p) for p, _ in big])):
+                remember(path, digest, suite)
+    else:
+        for path, digest in big:
+            remember(path, digest, _parse_surefire_file(Path(path)))
+    parsed += len(big)
+
+    # Forget reports that were deleted (e.g. by mvn clean)
+    prefix = os.path.join(str(reports_dir), "")
+    with _SUREFIRE_SUITES_LOCK:
+        for path in [p for p in _SUREFIRE_SUITES if p.startswith(prefix) and p not in current]:
+            del _SUREFIRE_SUITES[path]
+
+    suites = [suites_by_path[path] for path in in_scope]
+    summary = {
+        "total_tests": sum(s["tests"] for s in suites),
+        "failures": sum(s["failures"] for s in suites),
+        "errors": sum(s["errors"] for s in suites),
+        "skipped": sum(s["skipped"] for s in suites),
+    }
+
+    return {
+        "suites": suites,
+        "summary": summary,
+        "ingestion": {
+            "reports_found": len(current),
+            "reports_in_run": len(in_scope),
+            "stale_ignored": len(current) - len(in_scope),
+            "parsed": parsed,
+            "parsed_in_workers": len(big) if use_pool else 0,
+            "cached": len(in_scope) - parsed,
+            "seconds": round(time.perf_counter() - start, 4),
+        },
+    }
+
+def _surefire_report_dirs(project_root: Path) -> List[Path]:
+    """
+    target/surefire-reports of the project and of every reactor module.
+    """
+    return [m / "target" / "surefire-reports" for m in [project_root, *_reactor_modules(project_root)]]
+
+def _surefire_report_stats_all(report_dirs: List[Path]) -> Dict[str, Tuple[int, int]]:
+    stats: Dict[str, Tuple[int, int]] = {}
+    for d in report_dirs:
+        stats.update(_surefire_report_stats(d))
+    return stats
+
+def _parse_surefire_report_dirs(
+    report_dirs: List[Path],
+    before_run: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> Dict[str, Any]:
+    """
+    _parse_surefire_reports over several report directories (a reactor's
+    modules), merged into one result of the same shape.
+    """
+    parts = [_parse_surefire_reports(d, before_run) for d in report_dirs if d.exists()]
+    if len(parts) == 1:
+        return parts[0]
+    return _merge_surefire_reports(parts or [_parse_surefire_reports(report_dirs[0], before_run)])
+
+def _find_test_sources(project_root: Path) -> List[Path]:
+    test_java = project_root / "src" / "test" / "java"
+    if not test_java.exists():
+        return []
+    return sorted(test_java.rglob("*.java"))
+
+def _test_names_for(class_name: str) -> Tuple[str, ...]:
+    """
+    Conventional names of the test classes of `class_name`.
+    """
+    return (
+        f"{class_name}Test",
+        f"{class_name}Tests",
+        f"{class_name}TestCase",
+        f"{class_name}IT",
+        f"Test{class_name}",
+    )
+
+def _affected_test_classes(project_root: Path, base_ref: str = "") -> Optional[List[str]]:
+    """
+    Pick the test classes touched by the changes since base_ref (default HEAD,
+    i.e. uncommitted work): changed test sources themselves, plus the tests
+    named after a changed main class by the usual conventions (Foo ->
+    FooTest, FooTests, FooTestCase, FooIT, TestFoo; not FooBarTest).
+    In a reactor every module's main and test sources are considered.
+    Returns simple class names usable in -Dtest, or None if git cannot answer.
+    """
+    changed = _git_changed_paths(project_root, base_ref or "HEAD")
+    if changed is None:
+        return None
+    toplevel, paths = changed
+
+    modules = _reactor_modules(project_root)
+    main_roots = _main_source_roots(project_root, modules)
+    test_roots = _test_source_roots(project_root, modules)
+    test_names = {p.stem for root in test_roots for p in root.rglob("*.java")}
+
+    selected: set[str] = set()
+    for p in paths:
+        if not p.endswith(".java"):
+            continue
+        abs_path = toplevel / p
+        stem = abs_path.stem
+        if any(abs_path.is_relative_to(root) for root in test_roots):
+            if abs_path.exists():
+                selected.add(stem)
+        elif any(abs_path.is_relative_to(root) for root in main_roots):
+            selected.update(test_names.intersection(_test_names_for(stem)))
+    return sorted(selected)
+
+def _maven_test_args(
+    goal: str,
+    tests: Optional[List[str]] = None,
+    modules: Optional[List[str]] = None,
+    fail_fast: bool = False,
+) -> List[str]:
+    args = [goal]
+    if modules:
+        args += ["-pl", ",".join(modules)]
+    if tests:
+        # Modules/filters that match nothing must not fail the build
+        args += [
+            "-Dtest=" + ",".join(tests),
+            "-Dsurefire.failIfNoSpecifiedTests=false",
+            "-DfailIfNoTests=false",
+        ]
+    if fail_fast:
+        # Surefire skips the remaining tests after the first failure
+        args.append("-Dsurefire.skipAfterFailureCount=1")
+    return args
+
+############### Maven output streaming ###################
+
+_MAVEN_BUFFER_LINES = 2000
+_MAVEN_TAIL_LINES = 60
+_MAVEN_MAX_EVENTS = 500
+_MAVEN_KEPT_LOGS = 20
+
+# "Building core 1.0-SNAPSHOT [1/3]": the version is dropped so the name
+# matches the reactor summary line
+_RE_MODULE_START = re.compile(r"^\[INFO\] Building (.+?)(?: \d[^\s]*)?(?: \[\d+/\d+\])?$")
+_RE_MODULE_END = re.compile(r"^\[INFO\] (.+?) \.{2,} ?(SUCCESS|FAILURE|SKIPPED)(?: \[\s*(.+?)\])?$")
+_RE_TESTS_RUN = re.compile(
+    r"Tests run: (\d+), Failures: (\d+), Errors: (\d+), Skipped: (\d+)(?:, Time elapsed: ([\d.,]+) ?s(?:ec)?)?"
+    r"(?:.*? --? in (\S+))?"  # Surefire 2.x "- in <class>", 3.x "-- in <class>"
+)
+_RE_TEST_FAILURE = re.compile(r"<<< (FAILURE|ERROR)!")
+_RE_COMPILE_ERROR = re.compile(r"^\[ERROR\] (\S+\.java):\[(\d+),(\d+)\] (.*)$")
+_RE_TOTAL_TIME = re.compile(r"^\[INFO\] Total time:\s+(.+)$")
+
+class MavenOutputCollector:
+    """
+    Consumes Maven output one line at a time. Every line goes to a log file
+    on disk; only a bounded ring buffer of recent lines and the structured
+    events extracted on the fly (module start/end, test failures, compile
+    errors, BUILD SUCCESS/FAILURE) are kept in memory.
+    """
+
+    def __init__(self, log_path: Path, buffer_lines: int = _MAVEN_BUFFER_LINES):
+        self.log_path = log_path
+        self._log = log_path.open("w", encoding="utf-8")
+        self._buffer: Deque[str] = deque(maxlen=buffer_lines)
+        self.lines_seen = 0
+        self.events: List[Dict[str, Any]] = []
+        self.events_dropped = 0
+        self.build_result: Optional[str] = None
+        self.total_time: Optional[str] = None
+        self.tests_totals: Optional[Dict[str, int]] = None
+        self.modules: Dict[str, Dict[str, Any]] = {}
+        self._current_module: Optional[str] = None
+
+    def _event(self, event: Dict[str, Any]) -> None:
+        if len(self.events) < _MAVEN_MAX_EVENTS:
+            self.events.append(event)
+        else:
+            self.events_dropped += 1
+
+    def feed(self, line: str) -> None:
+        self._log.write(line + "\n")
+        self._buffer.append(line)
+        self.lines_seen += 1
+
+        stripped = line.strip()
+        if stripped in ("[INFO] BUILD SUCCESS", "[INFO] BUILD FAILURE", "BUILD SUCCESS", "BUILD FAILURE"):
+            self.build_result = stripped.rsplit(" ", 1)[-1]
+            self._event({"type": "build_result", "result": self.build_result, "line": self.lines_seen})
+            return
+
+        m = _RE_MODULE_START.match(stripped)
+        if m and not stripped.startswith("[INFO] Building jar") and not stripped.startswith("[INFO] Building war"):
+            self._current_module = m.group(1)
+            self.modules.setdefault(self._current_module, {"module": self._current_module, "result": None, "time": None})
+            self._event({"type": "module_start", "module": self._current_module, "line": self.lines_seen})
+            return
+
+        m = _RE_MODULE_END.match(stripped)
+        if m:
+            entry = self.modules.setdefault(m.group(1), {"module": m.group(1)})
+            entry.update(result=m.group(2), time=m.group(3))
+            self._event({"type": "module_end", "module": m.group(1), "result": m.group(2), "time": m.group(3)})
+            return
+
+        m = _RE_TESTS_RUN.search(stripped)
+        if m:
+            counts = {
+                "tests": int(m.group(1)),
+                "failures": int(m.group(2)),
+                "errors": int(m.group(3)),
+                "skipped": int(m.group(4)),
+            }
+            if m.group(5) is None and m.group(6) is None:
+                # Per-module totals line ("Results:" section)
+                totals = self.tests_totals or {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+                self.tests_totals = {k: totals[k] + v for k, v in counts.items()}
+            elif counts["failures"] or counts["errors"]:
+                self._event({"type": "suite_failed", "suite": m.group(6), "module": self._current_module, **counts})
+            if not _RE_TEST_FAILURE.search(stripped):
+                return
+
+        m = _RE_TEST_FAILURE.search(stripped)
+        if m:
+            self._event({"type": "test_failure", "kind": m.group(1).lower(), "text": stripped, "module": self._current_module})
+            return
+
+        m = _RE_COMPILE_ERROR.match(stripped)
+        if m:
+            self._event(
                 {
-                    "class_name": cname,
-                    "test_name": name,
-                    "time": time,
-                    "status": status,
-                    "message": failure_message,
-                    "type": failure_type,
-                    "details": failure_text,
+                    "type": "compile_error",
+                    "file": m.group(1),
+                    "line": int(m.group(2)),
+                    "column": int(m.group(3)),
+                    "message": m.group(4),
                 }
             )
+            return
+
+        m = _RE_TOTAL_TIME.match(stripped)
+        if m:
+            self.total_time = m.group(1)
+
+    def lines_since(self, offset: int, max_lines: int) -> Tuple[List[str], int, bool]:
+        """
+        Lines from absolute index `offset` that are still buffered.
+        Returns (lines, next offset, whether older lines were already dropped).
+        """
+        first = self.lines_seen - len(self._buffer)
+        truncated = offset < first
+        start = max(offset, first)
+        buffered = list(self._buffer)[start - first:start - first + max(1, max_lines)]
+        return buffered, start + len(buffered), truncated
+
+    def tail(self, n: int = _MAVEN_TAIL_LINES) -> List[str]:
+        return list(self._buffer)[-n:] if n > 0 else []
+
+    def close(self) -> None:
+        if not self._log.closed:
+            self._log.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "build_result": self.build_result,
+            "total_time": self.total_time,
+            "tests": self.tests_totals,
+            "modules": list(self.modules.values()),
+            "events": self.events,
+            "events_dropped": self.events_dropped,
+            "output_lines": self.lines_seen,
+        }
+
+def _new_maven_log(project_root: Path) -> Path:
+    """
+    Allocate a log file under .test-agent/logs, keeping the most recent ones.
+    """
+    log_dir = _state_dir(project_root) / "logs"
+    log_dir.mkdir(exist_ok=True)
+    old_logs = sorted(log_dir.glob("maven-*.log"))
+    for stale in old_logs[:max(0, len(old_logs) - _MAVEN_KEPT_LOGS + 1)]:
+        stale.unlink(missing_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return log_dir / f"maven-{stamp}-{uuid.uuid4().hex[:6]}.log"
+
+############### Maven execution backends ###################
+
+@dataclass
+class MavenBackend:
+    """
+    Executes Maven invocations. The base backend launches a cold `mvn` JVM
+    for every call; subclasses may keep a warm build process alive between
+    calls and restart it when it breaks.
+    """
+    name: str = "cold"
+    executable: str = "mvn"
+    runs: int = 0
+    restarts: int = 0
+    last_seconds: Optional[float] = None
+    # Runs in flight; guards restarts and the counters across threads
+    _active: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def available(self) -> bool:
+        return shutil.which(self.executable) is not None
+
+    def command(self, args: List[str]) -> List[str]:
+        return [self.executable] + args
+
+    def needs_restart(self, exit_code: int, recent_output: List[str]) -> bool:
+        return False
+
+    def restart(self, project_root: Path) -> None:
+        pass
+
+    def _execute(
+        self,
+        project_root: Path,
+        args: List[str],
+        on_line: Callable[[str], None],
+    ) -> Tuple[int, List[str]]:
+        recent: Deque[str] = deque(maxlen=50)
+        with subprocess.Popen(
+            self.command(args),
+            cwd=project_root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+        ) as proc:
+            assert proc.stdout is not None
+            for raw in proc.stdout:
+                line = raw.rstrip("\n")
+                recent.append(line)
+                on_line(line)
+        return proc.returncode, list(recent)
+
+    async def _execute_async(
+        self,
+        project_root: Path,
+        args: List[str],
+        on_line: Callable[[str], None],
+        on_start: Callable[[Optional[asyncio.subprocess.Process]], None],
+    ) -> Tuple[int, List[str]]:
+        recent: Deque[str] = deque(maxlen=50)
+        proc = await asyncio.create_subprocess_exec(
+            *self.command(args),
+            cwd=project_root,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        on_start(proc)
+        assert proc.stdout is not None
+        async for raw in proc.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            recent.append(line)
+            on_line(line)
+        exit_code = await proc.wait()
+        on_start(None)
+        return exit_code, list(recent)
+
+    def _begin_run(self) -> None:
+        with self._lock:
+            self._active += 1
+
+    def _record_run(self, start: float) -> None:
+        with self._lock:
+            self._active -= 1
+            self.runs += 1
+            self.last_seconds = time.perf_counter() - start
+
+    def _restart_if_alone(self, project_root: Path) -> bool:
+        """
+        Restart the build process, unless other runs (sharded tests,
+        background jobs) are using it: stopping a daemon fails them too.
+        New runs wait for the restart. Returns whether it restarted.
+        """
+        with self._lock:
+            if self._active > 1:
+                return False
+            self.restart(project_root)
+            self.restarts += 1
+            return True
+
+    def run(
+        self,
+        project_root: Path,
+        args: List[str],
+        on_line: Optional[Callable[[str], None]] = None,
+    ) -> int:
+        """
+        Run Maven, streaming merged stdout/stderr lines to on_line.
+        Returns the exit code.
+        """
+        sink = on_line if on_line is not None else (lambda _line: None)
+        start = time.perf_counter()
+        self._begin_run()
+        try:
+            exit_code, recent = self._execute(project_root, args, sink)
+            if self.needs_restart(exit_code, recent) and self._restart_if_alone(project_root):
+                # One retry on a fresh build process
+                exit_code, _ = self._execute(project_root, args, sink)
+        finally:
+            self._record_run(start)
+        return exit_code
+
+    async def run_async(
+        self,
+        project_root: Path,
+        args: List[str],
+        on_line: Optional[Callable[[str], None]] = None,
+        on_process: Optional[Callable[[Optional[asyncio.subprocess.Process]], None]] = None,
+    ) -> int:
+        """
+        run() as an asyncio subprocess, with the same restart handling and
+        bookkeeping. on_process receives the live process (None once it has
+        exited), so callers can kill it on cancellation.
+        """
+        sink = on_line if on_line is not None else (lambda _line: None)
+        track = on_process if on_process is not None else (lambda _proc: None)
+        start = time.perf_counter()
+        self._begin_run()
+        try:
+            exit_code, recent = await self._execute_async(project_root, args, sink, track)
+            if self.needs_restart(exit_code, recent) and await asyncio.to_thread(self._restart_if_alone, project_root):
+                exit_code, _ = await self._execute_async(project_root, args, sink, track)
+        finally:
+            self._record_run(start)
+        return exit_code
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "executable": self.executable,
+            "runs": self.runs,
+            "restarts": self.restarts,
+            "last_seconds": self.last_seconds,
+        }
+
+
+_MVND_DAEMON_FAILURES = (
+    "DaemonException",
+    "Could not connect to daemon",
+    "Lost connection to the daemon",
+    "daemon has stopped",
+)
+
+@dataclass
+class MvndBackend(MavenBackend):
+    """
+    Runs builds through the Maven Daemon (mvnd), which keeps a warm JVM with
+    loaded plugins between calls. A daemon that crashed or became unreachable
+    is stopped and the build retried once on a fresh daemon.
+    """
+    name: str = "mvnd"
+    executable: str = "mvnd"
+
+    def needs_restart(self, exit_code: int, recent_output: List[str]) -> bool:
+        if exit_code == 0:
+            return False
+        return any(marker in line for line in recent_output for marker in _MVND_DAEMON_FAILURES)
+
+    def restart(self, project_root: Path) -> None:
+        subprocess.run([self.executable, "--stop"], cwd=project_root, capture_output=True, text=True)
+
+
+_MAVEN_BACKENDS: Dict[str, MavenBackend] = {
+    "cold": MavenBackend(),
+    "mvnd": MvndBackend(),
+}
+
+_DEFAULT_MAVEN_BACKEND = os.environ.get("TEST_AGENT_MAVEN_BACKEND", "cold")
+
+def _get_maven_backend(name: str = "") -> Tuple[Optional[MavenBackend], Optional[str]]:
+    """
+    Return (backend, error). An empty name selects the default backend
+    (TEST_AGENT_MAVEN_BACKEND, else "cold").
+    """
+    name = name or _DEFAULT_MAVEN_BACKEND
+    backend = _MAVEN_BACKENDS.get(name)
+    if backend is None:
+        return None, f"Unknown Maven backend '{name}'. Available: {', '.join(sorted(_MAVEN_BACKENDS))}."
+    if not backend.available():
+        return None, f"Maven backend '{name}' needs `{backend.executable}` on PATH."
+    return backend, None
+
+def _plan_maven_run(
+    project_root: Path,
+    goal: str = "test",
+    tests: Optional[List[str]] = None,
+    modules: Optional[List[str]] = None,
+    affected_only: bool = False,
+    base_ref: str = "",
+    backend: str = "",
+    fail_fast: bool = False,
+) -> Tuple[Optional[MavenBackend], List[str], List[str], Optional[Dict[str, Any]]]:
+    """
+    Resolve backend and test selection for a Maven run.
+
+    Returns (backend, maven args, selected tests, early result); when the
+    early result is not None there is nothing to execute and it is the answer.
+    """
+    runner, backend_error = _get_maven_backend(backend)
+    if runner is None:
+        return None, [], [], {
+            "project_root": str(project_root),
+            "maven_goal": goal,
+            "exit_code": 1,
+            "stdout": "",
+            "stderr": backend_error,
+            "reports": None,
+            "selected_tests": [],
+        }
+
+    selected = list(tests or [])
+    if affected_only:
+        affected = _affected_test_classes(project_root, base_ref)
+        if affected is None:
+            return runner, [], [], {
+                "project_root": str(project_root),
+                "maven_goal": goal,
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": "Could not determine changed files with git; run without affected_only.",
+                "reports": None,
+                "selected_tests": [],
+            }
+        selected = sorted(set(selected) | set(affected))
+        if not selected:
+            return runner, [], [], {
+                "project_root": str(project_root),
+                "maven_goal": goal,
+                "exit_code": 0,
+                "stdout": "",
+                "stderr": "",
+                "reports": {"suites": [], "summary": {"total_tests": 0, "failures": 0, "errors": 0, "skipped": 0}},
+                "selected_tests": [],
+                "message": "No tests are affected by the current changes; nothing was run.",
+            }
+
+    return runner, _maven_test_args(goal, selected, modules, fail_fast), selected, None
+
+def _maven_run_result(
+    project_root: Path,
+    goal: str,
+    args: List[str],
+    selected: List[str],
+    runner: MavenBackend,
+    exit_code: int,
+    collector: MavenOutputCollector,
+    include_output: bool = False,
+    reports_before: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> Dict[str, Any]:
+    """
+    Assemble the tool result: the build summary, the output tail and the log
+    path. The complete output is only read back when include_output is set.
+    Only Surefire reports that changed since `reports_before` (stats of all
+    the reactor's report directories) are ingested.
+    """
+    collector.close()
+    report_data = _parse_surefire_report_dirs(_surefire_report_dirs(project_root), reports_before)
+
+    result = {
+        "project_root": str(project_root),
+        "maven_goal": goal,
+        "maven_args": args,
+        "selected_tests": selected,
+        "backend": runner.info(),
+        "exit_code": exit_code,
+        "build": collector.summary(),
+        "output_tail": collector.tail(),
+        "log_file": str(collector.log_path),
+        "reports": report_data,
+        "history": _record_test_history(project_root, goal, exit_code, report_data),
+    }
+    if include_output:
+        result["stdout"] = collector.log_path.read_text(encoding="utf-8", errors="replace")
+    return result
+
+def _run_maven_and_parse(
+    project_root: Path,
+    goal: str = "test",
+    tests: Optional[List[str]] = None,
+    modules: Optional[List[str]] = None,
+    affected_only: bool = False,
+    base_ref: str = "",
+    backend: str = "",
+    include_output: bool = False,
+    shards: int = 0,
+    fail_fast: bool = False,
+) -> Dict[str, Any]:
+    runner, args, selected, early = _plan_maven_run(
+        project_root, goal, tests, modules, affected_only, base_ref, backend, fail_fast
+    )
+    if early is not None or runner is None:
+        return cast(Dict[str, Any], early)
+
+    if shards > 1:
+        if goal != "test":
+            return {
+                "project_root": str(project_root),
+                "maven_goal": goal,
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": f"Sharded runs execute the test phase; goal '{goal}' is not supported with shards > 1.",
+                "reports": None,
+                "selected_tests": selected,
+            }
+        return _run_sharded_tests(project_root, runner, selected, modules, shards, include_output)
+
+    reports_before = _surefire_report_stats_all(_surefire_report_dirs(project_root))
+    collector = MavenOutputCollector(_new_maven_log(project_root))
+    try:
+        exit_code = runner.run(project_root, args, collector.feed)
+    finally:
+        collector.close()
+    return _maven_run_result(
+        project_root, goal, args, selected, runner, exit_code, collector, include_output, reports_before
+    )
+
+############### Sharded test execution ###################
+
+_SHARD_REPORTS_DIR = "surefire-shards"
+# Surefire's default <includes>
+_RE_SUREFIRE_TEST_CLASS = re.compile(r"^(Test\w*|\w*Test|\w*Tests|\w*TestCase)$")
+
+def _pom_surefire_patterns(pom: Path) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    (includes, excludes) configured for maven-surefire-plugin in a pom.xml
+    (plugins, pluginManagement or executions), None if it configures neither.
+    """
+    try:
+        root = ET.parse(pom).getroot()
+    except (OSError, ET.ParseError):
+        return None
+
+    def local(elem: ET.Element) -> str:
+        return elem.tag.rsplit("}", 1)[-1]
+
+    includes: List[str] = []
+    excludes: List[str] = []
+    for plugin in root.iter():
+        if local(plugin) != "plugin":
+            continue
+        artifact = next((c.text for c in plugin if local(c) == "artifactId"), None)
+        if (artifact or "").strip() != "maven-surefire-plugin":
+            continue
+        for elem in plugin.iter():
+            if local(elem) in ("include", "exclude") and elem.text and elem.text.strip():
+                (includes if local(elem) == "include" else excludes).append(elem.text.strip())
+    return (includes, excludes) if includes or excludes else None
+
+def _surefire_patterns(module_dir: Path, project_root: Path) -> Tuple[List[str], List[str]]:
+    """
+    Surefire includes/excludes in effect for a module: its own pom.xml, else
+    the nearest enclosing pom up to project_root (where parents usually live).
+    """
+    d = module_dir
+    while True:
+        found = _pom_surefire_patterns(d / "pom.xml")
+        if found is not None:
+            return found
+        if d == project_root or project_root not in d.parents:
+            return [], []
+        d = d.parent
+
+def _surefire_pattern_matches(rel_path: str, pattern: str) -> bool:
+    """
+    Match a test source path relative to src/test/java ("p/FooTest.java")
+    against a Surefire include/exclude pattern.
+    """
+    if pattern.startswith("%regex[") and pattern.endswith("]"):
+        return re.fullmatch(pattern[7:-1], rel_path[:-len(".java")] + ".class") is not None
+    pattern = pattern.replace(".class", ".java")
+    if not pattern.endswith(".java") and not pattern.endswith("*"):
+        pattern += ".java"
+    return fnmatch.fnmatchcase(rel_path, pattern) or (
+        pattern.startswith("**/") and fnmatch.fnmatchcase(rel_path, pattern[3:])
+    )
+
+def _discover_test_classes(project_root: Path, modules: Optional[List[str]] = None) -> List[str]:
+    """
+    Simple names of the test classes Surefire would run, across all reactor
+    modules (or only `modules`, when they name module directories). The
+    includes/excludes of each module's Surefire configuration are honoured,
+    since a -Dtest list replaces them; without includes Surefire's defaults apply.
+    """
+    module_dirs = [project_root, *_reactor_modules(project_root)]
+    if modules:
+        wanted = {m.strip("/") for m in modules}
+        picked = [d for d in module_dirs if d.relative_to(project_root).as_posix() in wanted]
+        module_dirs = picked or module_dirs
+
+    names: Set[str] = set()
+    for module in module_dirs:
+        test_java = module / "src" / "test" / "java"
+        includes, excludes = _surefire_patterns(module, project_root)
+        for src in _find_test_sources(module):
+            rel = src.relative_to(test_java).as_posix()
+            if includes:
+                included = any(_surefire_pattern_matches(rel, p) for p in includes)
+            else:
+                included = bool(_RE_SUREFIRE_TEST_CLASS.match(src.stem)) and not src.stem.startswith("Abstract")
+            if included and not any(_surefire_pattern_matches(rel, p) for p in excludes):
+                names.add(src.stem)
+    return sorted(names)
+
+def _test_class_durations(reports_dir: Path) -> Dict[str, float]:
+    """
+    Last recorded duration in seconds per test class (simple name), from the
+    Surefire reports earlier runs left in reports_dir.
+    """
+    durations: Dict[str, float] = {}
+    for suite in _parse_surefire_reports(reports_dir)["suites"]:
+        seconds = suite["time"] or sum(_surefire_seconds(c["time"]) for c in suite["cases"])
+        durations[suite["suite_name"].rsplit(".", 1)[-1]] = seconds
+    return durations
+
+def _shard_tests(
+    tests: List[str],
+    durations: Dict[str, float],
+    shards: int,
+) -> List[Tuple[float, List[str]]]:
+    """
+    Split -Dtest entries into at most `shards` groups of similar total
+    duration: classes are handed out slowest first, each to the currently
+    lightest shard (LPT). Entries of one class ("Foo#a", "Foo#b") stay
+    together; classes without history count as the median known duration.
+    Returns (expected seconds, tests) per non-empty shard.
+    """
+    by_class: Dict[str, List[str]] = {}
+    for test in tests:
+        by_class.setdefault(test.split("#", 1)[0], []).append(test)
+
+    known = sorted(durations[c] for c in by_class if c in durations)
+    default = known[len(known) // 2] if known else 1.0
+    order = sorted(by_class, key=lambda c: (-durations.get(c, default), c))
+
+    loads = [(0.0, i) for i in range(max(1, shards))]
+    buckets: List[List[str]] = [[] for _ in loads]
+    for cls in order:
+        load, i = heapq.heappop(loads)
+        buckets[i].extend(by_class[cls])
+        heapq.heappush(loads, (load + durations.get(cls, default), i))
+
+    expected = {i: load for load, i in loads}
+    return [(round(expected[i], 3), sorted(b)) for i, b in enumerate(buckets) if b]
+
+def _merge_surefire_reports(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine _parse_surefire_reports results into one of the same shape.
+    """
+    suites = [suite for part in parts for suite in part["suites"]]
+    ingestion: Dict[str, Any] = {}
+    for part in parts:
+        for key, value in part.get("ingestion", {}).items():
+            ingestion[key] = ingestion.get(key, 0) + value
+    if "seconds" in ingestion:
+        ingestion["seconds"] = round(ingestion["seconds"], 4)
+    return {
+        "suites": suites,
+        "summary": {
+            key: sum(part["summary"][key] for part in parts)
+            for key in ("total_tests", "failures", "errors", "skipped")
+        },
+        "ingestion": ingestion,
+    }
+
+# TEST-<class>-shard<i>.xml, <class>-shard<i>.txt, <class>-shard<i>-output.txt
+_RE_SHARD_REPORT_FILE = re.compile(r"-shard(\d+)(?:-output)?\.(?:xml|txt)$")
+# Surefire appends "(<reportNameSuffix>)" to suite and test class names
+_RE_SHARD_NAME_SUFFIX = re.compile(r"\(shard\d+\)$")
+
+def _shard_test_args(index: int, tests: List[str], modules: Optional[List[str]]) -> List[str]:
+    """
+    Maven arguments of one shard. The test phase keeps the POM's Surefire
+    executions, argLine, JaCoCo agent and reactor resolution, but nothing the
+    shared test-compile produced is written again while other shards load it:
+    main compilation and resources are skipped, and non-incremental
+    compilation only recompiles stale sources (none). Reports and coverage
+    data go to files of the shard's own.
+    """
+    return _maven_test_args("test", tests, modules) + [
+        "-Dmaven.main.skip=true",
+        "-Dmaven.resources.skip=true",
+        "-Dmaven.compiler.useIncrementalCompilation=false",
+        f"-Dsurefire.reportNameSuffix=shard{index}",
+        f"-Djacoco.destFile=target/jacoco-shard{index}.exec",
+    ]
+
+def _shard_reports(report: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A shard's parsed reports with the report name suffix dropped from suite
+    and test class names (copies; the parsed suites are cached).
+    """
+    def plain(name: str) -> str:
+        return _RE_SHARD_NAME_SUFFIX.sub("", name)
+
+    suites = [
+        dict(
+            suite,
+            suite_name=plain(suite["suite_name"]),
+            cases=[dict(case, class_name=plain(case["class_name"])) for case in suite["cases"]],
+        )
+        for suite in report["suites"]
+    ]
+    return dict(report, suites=suites)
+
+def _run_sharded_tests(
+    project_root: Path,
+    runner: MavenBackend,
+    selected: List[str],
+    modules: Optional[List[str]],
+    shards: int,
+    include_output: bool = False,
+) -> Dict[str, Any]:
+    """
+    Compile once (test-compile), then run the test classes as `shards`
+    concurrent `mvn test -Dtest=<shard>` invocations, one JVM each, balanced
+    by the durations of the previous run. Going through the test phase keeps
+    the POM's Surefire executions, argLine and JaCoCo prepare-agent and
+    resolves reactor siblings (see _shard_test_args). Each shard's reports
+    end up in target/surefire-shards/shard-<i>/ and are merged; its coverage
+    data in target/jacoco-shard<i>.exec of every module (combine them with
+    jacoco:merge before jacoco:report).
+    """
+    report_dirs = _surefire_report_dirs(project_root)
+    tests = selected or _discover_test_classes(project_root, modules)
+    # Latest reports first; the history store covers classes they lack
+    durations: Dict[str, float] = _history_class_durations(project_root)
+    for d in report_dirs:
+        durations.update(_test_class_durations(d))
+    plan = _shard_tests(tests, durations, shards)
+    wall_start = time.perf_counter()
+
+    # 1) Compile main and test sources once; shards only run tests
+    compile_args = ["test-compile"] + (["-pl", ",".join(modules)] if modules else [])
+    collector = MavenOutputCollector(_new_maven_log(project_root))
+    try:
+        exit_code = runner.run(project_root, compile_args, collector.feed)
+    finally:
+        collector.close()
+    if exit_code != 0 or not plan:
+        result = _maven_run_result(
+            project_root, "test", compile_args, selected, runner, exit_code, collector, include_output,
+            _surefire_report_stats_all(report_dirs),
+        )
+        result["shards"] = []
+        return result
+
+    # 2) One Maven process per shard, all at once. Leftovers of an aborted
+    # sharded run would be taken for this run's reports
+    for d in report_dirs:
+        for entry in os.scandir(d) if d.exists() else []:
+            if _RE_SHARD_REPORT_FILE.search(entry.name):
+                os.unlink(entry.path)
+    shard_args = [_shard_test_args(i, shard_tests, modules) for i, (_, shard_tests) in enumerate(plan)]
+    shard_collectors = [MavenOutputCollector(_new_maven_log(project_root)) for _ in plan]
+
+    def run_shard(i: int) -> Tuple[int, float]:
+        start = time.perf_counter()
+        try:
+            code = runner.run(project_root, shard_args[i], shard_collectors[i].feed)
+        finally:
+            shard_collectors[i].close()
+        return code, time.perf_counter() - start
+
+    restarts_before = runner.restarts
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        outcomes = list(pool.map(run_shard, range(len(plan))))
+
+    # Shards never restart a build process that other shards still use; once
+    # all have finished, a broken one is restarted (unless the last shard
+    # running already did) and its shards run again
+    broken = [i for i, (code, _) in enumerate(outcomes) if runner.needs_restart(code, shard_collectors[i].tail())]
+    if broken and (runner.restarts > restarts_before or runner._restart_if_alone(project_root)):
+        for i in broken:
+            shard_collectors[i] = MavenOutputCollector(_new_maven_log(project_root))
+        with ThreadPoolExecutor(max_workers=len(broken)) as pool:
+            for i, outcome in zip(broken, pool.map(run_shard, broken)):
+                outcomes[i] = outcome
+
+    # 3) Move each shard's reports (tagged by surefire.reportNameSuffix) out
+    # of the shared report directories, then merge
+    shard_root = project_root / "target" / _SHARD_REPORTS_DIR
+    shutil.rmtree(shard_root, ignore_errors=True)
+    shard_dirs = [shard_root / f"shard-{i}" for i in range(len(plan))]
+    for d in shard_dirs:
+        d.mkdir(parents=True)
+    for d in report_dirs:
+        for entry in os.scandir(d) if d.exists() else []:
+            m = _RE_SHARD_REPORT_FILE.search(entry.name)
+            if m and int(m.group(1)) < len(plan):
+                # Suite files are named by FQN, so reports of different modules do not collide
+                os.replace(entry.path, shard_dirs[int(m.group(1))] / entry.name)
+
+    parts = [_shard_reports(_parse_surefire_reports(d)) for d in shard_dirs]
+    owner = {t.split("#", 1)[0]: i for i, (_, shard_tests) in enumerate(plan) for t in shard_tests}
+
+    shard_results: List[Dict[str, Any]] = []
+    for i, ((expected, shard_tests), (code, seconds)) in enumerate(zip(plan, outcomes)):
+        entry: Dict[str, Any] = {
+            "index": i,
+            "tests": shard_tests,
+            "expected_seconds": expected,
+            "maven_args": shard_args[i],
+            "exit_code": code,
+            "seconds": round(seconds, 3),
+            "build": shard_collectors[i].summary(),
+            "log_file": str(shard_collectors[i].log_path),
+            "reports_dir": str(shard_dirs[i]),
+            "summary": parts[i]["summary"],
+        }
+        if code != 0:
+            entry["output_tail"] = shard_collectors[i].tail()
+        shard_results.append(entry)
+
+    failed = [r for r in shard_results if r["exit_code"] != 0]
+    result: Dict[str, Any] = {
+        "project_root": str(project_root),
+        "maven_goal": "test",
+        "maven_args": compile_args,
+        "selected_tests": selected,
+        "backend": runner.info(),
+        "exit_code": failed[0]["exit_code"] if failed else 0,
+        "build": collector.summary(),
+        "output_tail": failed[0]["output_tail"] if failed else collector.tail(),
+        "log_file": str(collector.log_path),
+        "reports": _merge_surefire_reports(parts),
+        "sharding": {
+            "shards": len(plan),
+            "test_classes": len(owner),
+            "classes_with_history": sum(1 for c in owner if c in durations),
+            "expected_makespan_seconds": max(expected for expected, _ in plan),
+            "expected_serial_seconds": round(sum(expected for expected, _ in plan), 3),
+            "wall_seconds": round(time.perf_counter() - wall_start, 3),
+        },
+        "shards": shard_results,
+    }
+    result["history"] = _record_test_history(project_root, "test", result["exit_code"], result["reports"])
+    if include_output:
+        result["stdout"] = "\n".join(
+            c.log_path.read_text(encoding="utf-8", errors="replace") for c in [collector, *shard_collectors]
+        )
+    return result
+
+############### Test history (SQLite) ###################
+
+_TEST_HISTORY_DB = "test-history.sqlite"
+_TEST_HISTORY_SCHEMA_VERSION = 3
+_RE_STACK_FRAME = re.compile(r"^\s*at\s+([\w$.<>]+)\(")
+
+_TEST_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    git_commit TEXT,
+    goal TEXT NOT NULL,
+    exit_code INTEGER NOT NULL,
+    total_tests INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    skipped INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    failure_signature TEXT,
+    PRIMARY KEY (class_name, test_name, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_run ON results (run_id, class_name);
+CREATE INDEX IF NOT EXISTS results_failed ON results (status, run_id) WHERE status IN ('failure', 'error');
+CREATE TABLE IF NOT EXISTS coverage_snapshots (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    git_commit TEXT,
+    run_id INTEGER,
+    report_signature TEXT NOT NULL,
+    instructions_missed INTEGER NOT NULL,
+    instructions_covered INTEGER NOT NULL,
+    branches_missed INTEGER NOT NULL,
+    branches_covered INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_snapshots_by_commit ON coverage_snapshots (git_commit);
+CREATE TABLE IF NOT EXISTS coverage_methods (
+    snapshot INTEGER NOT NULL REFERENCES coverage_snapshots(seq) ON DELETE CASCADE,
+    class_fqn TEXT NOT NULL,
+    method TEXT NOT NULL,
+    descriptor TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    instructions_missed INTEGER NOT NULL,
+    instructions_covered INTEGER NOT NULL,
+    branches_missed INTEGER NOT NULL,
+    branches_covered INTEGER NOT NULL,
+    lines_missed INTEGER NOT NULL,
+    lines_covered INTEGER NOT NULL,
+    PRIMARY KEY (snapshot, class_fqn, method, descriptor)
+) WITHOUT ROWID;
+-- Bit n of a bitmap is source line n: instrumented lines, and lines with covered instructions
+CREATE TABLE IF NOT EXISTS coverage_lines (
+    snapshot INTEGER NOT NULL REFERENCES coverage_snapshots(seq) ON DELETE CASCADE,
+    module TEXT NOT NULL,
+    package TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    instrumented BLOB NOT NULL,
+    covered BLOB NOT NULL,
+    PRIMARY KEY (snapshot, module, package, source_file)
+) WITHOUT ROWID;
+"""
+
+def _history_connect(project_root: Path) -> sqlite3.Connection:
+    """
+    Open (creating if needed) the test-history database of a project.
+    """
+    conn = sqlite3.connect(_state_dir(project_root) / _TEST_HISTORY_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != _TEST_HISTORY_SCHEMA_VERSION:
+        if version == 2:
+            # coverage_lines gained a module column, part of its key
+            conn.executescript(
+                "ALTER TABLE coverage_lines RENAME TO coverage_lines_v2;"
+                + _TEST_HISTORY_SCHEMA
+                + "INSERT INTO coverage_lines SELECT snapshot, '', package, source_file, instrumented, covered"
+                " FROM coverage_lines_v2; DROP TABLE coverage_lines_v2;"
+            )
+        conn.executescript(_TEST_HISTORY_SCHEMA)
+        conn.execute(f"PRAGMA user_version={_TEST_HISTORY_SCHEMA_VERSION}")
+    return conn
+
+def _failure_signature(case: Dict[str, Any]) -> Optional[str]:
+    """
+    Stable identity of a failure across runs: exception type plus the first
+    stack frame's method (line numbers and messages left out, they churn).
+    """
+    if case["status"] not in ("failure", "error"):
+        return None
+    frame = ""
+    for line in (case.get("details") or "").splitlines():
+        m = _RE_STACK_FRAME.match(line)
+        if m:
+            frame = m.group(1)
+            break
+    return f"{case.get('type') or 'unknown'}@{frame}" if frame else (case.get("type") or "unknown")
 
-        suites.append(
+def _record_test_history(
+    project_root: Path,
+    goal: str,
+    exit_code: int,
+    reports: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Store one run's per-test outcomes. Runs that produced no reports are not
+    recorded. Never fails the caller: database errors are reported instead.
+    """
+    if not reports or not reports.get("suites"):
+        return {"recorded": False}
+
+    head = _run_git(project_root, ["rev-parse", "HEAD"])
+    commit = head.stdout.strip() if head.returncode == 0 else None
+    summary = reports["summary"]
+    rows = [
+        (case["class_name"] or suite["suite_name"], case["test_name"], case["status"],
+         _surefire_seconds(case["time"] or "0"), _failure_signature(case))
+        for suite in reports["suites"]
+        for case in suite["cases"]
+    ]
+    try:
+        conn = _history_connect(project_root)
+        try:
+            with conn:
+                run_id = conn.execute(
+                    "INSERT INTO runs (started_at, git_commit, goal, exit_code, total_tests, failures, errors, skipped)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                        commit, goal, exit_code,
+                        summary["total_tests"], summary["failures"], summary["errors"], summary["skipped"],
+                    ),
+                ).lastrowid
+                # A test reported twice in one run (re-runs) keeps its last outcome
+                conn.executemany(
+                    "INSERT OR REPLACE INTO results (run_id, class_name, test_name, status, seconds, failure_signature)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id, *row) for row in rows],
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return {"recorded": False, "error": str(e)}
+    return {"recorded": True, "run_id": run_id, "tests": len(rows)}
+
+def _history_query(project_root: Path, sql: str, params: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+    if not (project_root / _STATE_DIR_NAME / _TEST_HISTORY_DB).exists():
+        return []
+    conn = _history_connect(project_root)
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+# The last N recorded runs; bound as the first parameter of every query
+_RECENT_RUNS_SQL = "(SELECT id FROM runs ORDER BY id DESC LIMIT ?)"
+
+def _slowest_tests_internal(project_root: Path, limit: int = 20, last_runs: int = 10) -> List[Dict[str, Any]]:
+    return _history_query(
+        project_root,
+        f"""
+        SELECT class_name, test_name, COUNT(*) AS runs,
+               ROUND(AVG(seconds), 4) AS avg_seconds, ROUND(MAX(seconds), 4) AS max_seconds
+        FROM results
+        WHERE run_id IN {_RECENT_RUNS_SQL} AND status != 'skipped'
+        GROUP BY class_name, test_name
+        ORDER BY avg_seconds DESC
+        LIMIT ?
+        """,
+        (last_runs, limit),
+    )
+
+def _flaky_tests_internal(project_root: Path, last_runs: int = 20, min_flips: int = 1) -> List[Dict[str, Any]]:
+    """
+    Tests whose outcome flipped between passing and failing across the last
+    runs (skipped runs ignored), most flips first.
+    """
+    return _history_query(
+        project_root,
+        f"""
+        WITH outcomes AS (
+            SELECT class_name, test_name, run_id, status, failure_signature,
+                   (status = 'passed') AS passed,
+                   LAG(status = 'passed') OVER (PARTITION BY class_name, test_name ORDER BY run_id) AS prev_passed
+            FROM results
+            WHERE run_id IN {_RECENT_RUNS_SQL} AND status != 'skipped'
+        )
+        SELECT class_name, test_name, COUNT(*) AS runs,
+               SUM(passed) AS passes, COUNT(*) - SUM(passed) AS fails,
+               SUM(prev_passed IS NOT NULL AND passed != prev_passed) AS flips,
+               MAX(CASE WHEN passed THEN NULL ELSE run_id END) AS last_failed_run,
+               GROUP_CONCAT(DISTINCT failure_signature) AS failure_signatures
+        FROM outcomes
+        GROUP BY class_name, test_name
+        HAVING flips >= ?
+        ORDER BY flips DESC, fails DESC, class_name, test_name
+        """,
+        (last_runs, min_flips),
+    )
+
+def _duration_regressions_internal(
+    project_root: Path,
+    recent_runs: int = 3,
+    baseline_runs: int = 20,
+    min_ratio: float = 1.5,
+    min_seconds: float = 0.1,
+) -> List[Dict[str, Any]]:
+    """
+    Tests whose average duration over the latest `recent_runs` runs exceeds
+    their average over the `baseline_runs` runs before that by `min_ratio`
+    and by at least `min_seconds`.
+    """
+    return _history_query(
+        project_root,
+        f"""
+        WITH recent AS (SELECT id FROM runs ORDER BY id DESC LIMIT ?),
+             baseline AS (SELECT id FROM runs WHERE id NOT IN recent ORDER BY id DESC LIMIT ?),
+             durations AS (
+                 SELECT class_name, test_name,
+                        AVG(CASE WHEN run_id IN recent THEN seconds END) AS recent_seconds,
+                        AVG(CASE WHEN run_id IN baseline THEN seconds END) AS baseline_seconds
+                 FROM results
+                 WHERE status = 'passed' AND (run_id IN recent OR run_id IN baseline)
+                 GROUP BY class_name, test_name
+             )
+        SELECT class_name, test_name,
+               ROUND(baseline_seconds, 4) AS baseline_seconds, ROUND(recent_seconds, 4) AS recent_seconds,
+               ROUND(recent_seconds / baseline_seconds, 2) AS ratio
+        FROM durations
+        WHERE baseline_seconds > 0 AND recent_seconds >= baseline_seconds * ?
+              AND recent_seconds - baseline_seconds >= ?
+        ORDER BY recent_seconds - baseline_seconds DESC
+        """,
+        (recent_runs, baseline_runs, min_ratio, min_seconds),
+    )
+
+def _class_trend_internal(project_root: Path, class_name: str, last_runs: int = 20) -> List[Dict[str, Any]]:
+    """
+    Per-run totals for one test class (FQN, or simple name), oldest run first.
+    """
+    return _history_query(
+        project_root,
+        f"""
+        SELECT r.id AS run_id, r.started_at, r.git_commit, res.class_name,
+               COUNT(*) AS tests,
+               SUM(res.status = 'failure') AS failures,
+               SUM(res.status = 'error') AS errors,
+               SUM(res.status = 'skipped') AS skipped,
+               ROUND(SUM(res.seconds), 4) AS seconds
+        FROM results res JOIN runs r ON r.id = res.run_id
+        WHERE res.run_id IN {_RECENT_RUNS_SQL} AND (res.class_name = ? OR res.class_name LIKE ? ESCAPE '\\')
+        GROUP BY r.id, res.class_name
+        ORDER BY r.id
+        """,
+        (last_runs, class_name, "%." + class_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")),
+    )
+
+def _history_class_durations(project_root: Path, last_runs: int = 5) -> Dict[str, float]:
+    """
+    Average per-run duration of each test class (simple name) over the last
+    recorded runs, for shard balancing.
+    """
+    try:
+        rows = _history_query(
+            project_root,
+            f"""
+            SELECT class_name, SUM(seconds) / COUNT(DISTINCT run_id) AS seconds
+            FROM results WHERE run_id IN {_RECENT_RUNS_SQL}
+            GROUP BY class_name
+            """,
+            (last_runs,),
+        )
+    except sqlite3.Error:
+        return {}
+    return {row["class_name"].rsplit(".", 1)[-1]: row["seconds"] for row in rows}
+
+############### Coverage snapshots ###################
+
+_COVERAGE_SNAPSHOTS_KEPT = 100
+_RE_BIT_RUN = re.compile("1+")
+
+def _line_bitmaps(cols: LineColumns) -> Tuple[bytes, bytes]:
+    """
+    (instrumented, covered) line bitmaps of one source file; bit n = line n.
+    """
+    size = (cols.nr[-1] >> 3) + 1 if cols.nr else 0
+    instrumented = bytearray(size)
+    covered = bytearray(size)
+    for nr, ci in zip(cols.nr, cols.ci):
+        instrumented[nr >> 3] |= 1 << (nr & 7)
+        if ci:
+            covered[nr >> 3] |= 1 << (nr & 7)
+    return bytes(instrumented), bytes(covered)
+
+def _bitmap_ranges(bits: int) -> List[Tuple[int, int]]:
+    """
+    Set bits of an int bitmap as consecutive (first, last) line ranges.
+    """
+    # Reversed binary string: index i is line i
+    return [(m.start(), m.end() - 1) for m in _RE_BIT_RUN.finditer(bin(bits)[:1:-1])]
+
+def _coverage_report_signature(reports: List[Path]) -> str:
+    return json.dumps([[str(r), r.stat().st_mtime_ns, r.stat().st_size] for r in reports])
+
+def _snapshot_meta(row: sqlite3.Row) -> Dict[str, Any]:
+    instr_total = row["instructions_missed"] + row["instructions_covered"]
+    return {
+        "snapshot_id": row["id"],
+        "created_at": row["created_at"],
+        "git_commit": row["git_commit"],
+        "run_id": row["run_id"],
+        "instruction_ratio": row["instructions_covered"] / instr_total if instr_total else 0.0,
+        "instructions_covered": row["instructions_covered"],
+        "branches_covered": row["branches_covered"],
+    }
+
+def _record_coverage_snapshot(project_root: Path, reports: List[Path], snapshot_id: str = "") -> Dict[str, Any]:
+    """
+    Store per-method counters and per-file line bitmaps of the current JaCoCo
+    report(s). Without an explicit snapshot_id, a report already stored as the
+    latest snapshot is not stored again; the default ID is "<commit>.<seq>".
+    The oldest snapshots beyond _COVERAGE_SNAPSHOTS_KEPT are dropped.
+    """
+    signature = _coverage_report_signature(reports)
+    conn = _history_connect(project_root)
+    try:
+        latest = conn.execute("SELECT * FROM coverage_snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+        if not snapshot_id and latest is not None and latest["report_signature"] == signature:
+            return {"created": False, "snapshot": _snapshot_meta(latest)}
+
+        model = _load_coverage_reports(reports)
+        head = _run_git(project_root, ["rev-parse", "HEAD"])
+        commit = head.stdout.strip() if head.returncode == 0 else None
+
+        methods = []
+        for cls in model.classes:
+            for m in cls.methods:
+                c = m.counters
+                methods.append(
+                    (cls.fqn, m.name, m.descriptor, m.line,
+                     *c.get("INSTRUCTION", (0, 0)), *c.get("BRANCH", (0, 0)), *c.get("LINE", (0, 0)))
+                )
+        lines = [(module, pkg, source, *_line_bitmaps(cols)) for (module, pkg, source), cols in model.source_lines.items()]
+        mi, ci = model.counters.get("INSTRUCTION", (0, 0))
+        mb, cb = model.counters.get("BRANCH", (0, 0))
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM coverage_snapshots").fetchone()[0]
+            run = conn.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+            name = snapshot_id or f"{(commit or 'snapshot')[:12]}.{seq}"
+            conn.execute("DELETE FROM coverage_snapshots WHERE id = ?", (name,))
+            conn.execute(
+                "INSERT INTO coverage_snapshots (seq, id, created_at, git_commit, run_id, report_signature,"
+                " instructions_missed, instructions_covered, branches_missed, branches_covered)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (seq, name, datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                 commit, run, signature, mi, ci, mb, cb),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO coverage_methods VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(seq, *m) for m in methods],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO coverage_lines VALUES (?, ?, ?, ?, ?, ?)",
+                [(seq, *row) for row in lines],
+            )
+            conn.execute(
+                "DELETE FROM coverage_snapshots WHERE seq <= ?",
+                (seq - _COVERAGE_SNAPSHOTS_KEPT,),
+            )
+        row = conn.execute("SELECT * FROM coverage_snapshots WHERE seq = ?", (seq,)).fetchone()
+        return {"created": True, "snapshot": _snapshot_meta(row), "methods": len(methods), "source_files": len(lines)}
+    finally:
+        conn.close()
+
+def _resolve_snapshot(conn: sqlite3.Connection, ref: str) -> Optional[sqlite3.Row]:
+    """
+    "latest", "previous", a snapshot ID, "run:<id>" or a commit (prefix);
+    commits and runs resolve to their most recent snapshot.
+    """
+    if ref in ("latest", "previous"):
+        return conn.execute(
+            "SELECT * FROM coverage_snapshots ORDER BY seq DESC LIMIT 1 OFFSET ?", (0 if ref == "latest" else 1,)
+        ).fetchone()
+    row = conn.execute("SELECT * FROM coverage_snapshots WHERE id = ?", (ref,)).fetchone()
+    if row is not None:
+        return row
+    if ref.startswith("run:") and ref[4:].isdigit():
+        return conn.execute(
+            "SELECT * FROM coverage_snapshots WHERE run_id = ? ORDER BY seq DESC LIMIT 1", (int(ref[4:]),)
+        ).fetchone()
+    if re.fullmatch(r"[0-9a-fA-F]{4,40}", ref):
+        return conn.execute(
+            "SELECT * FROM coverage_snapshots WHERE git_commit LIKE ? ORDER BY seq DESC LIMIT 1", (ref.lower() + "%",)
+        ).fetchone()
+    return None
+
+_COUNTER_COLUMNS = (
+    "instructions_missed", "instructions_covered", "branches_missed",
+    "branches_covered", "lines_missed", "lines_covered",
+)
+
+def _method_counters(values: Tuple[Any, ...]) -> Optional[Dict[str, List[int]]]:
+    """
+    {"instructions": [missed, covered], ...} from the six _COUNTER_COLUMNS values.
+    """
+    if values[0] is None:
+        return None
+    return {
+        "instructions": [values[0], values[1]],
+        "branches": [values[2], values[3]],
+        "lines": [values[4], values[5]],
+    }
+
+def _coverage_delta_internal(
+    project_root: Path,
+    base: str = "previous",
+    head: str = "latest",
+    max_methods: int = 200,
+) -> Dict[str, Any]:
+    """
+    Methods and lines whose coverage differs between two stored snapshots,
+    computed from the stored counters and bitmaps (no report is parsed).
+    """
+    start = time.perf_counter()
+    if not (project_root / _STATE_DIR_NAME / _TEST_HISTORY_DB).exists():
+        return {"error": "No coverage snapshots recorded yet; run analyze_coverage or snapshot_coverage first."}
+    conn = _history_connect(project_root)
+    try:
+        base_row, head_row = _resolve_snapshot(conn, base), _resolve_snapshot(conn, head)
+        missing = [ref for ref, row in ((base, base_row), (head, head_row)) if row is None]
+        if missing or base_row is None or head_row is None:
+            return {"error": f"Unknown coverage snapshot(s): {', '.join(missing)}."}
+
+        cols_b = ", ".join(f"b.{c} AS b_{c}" for c in _COUNTER_COLUMNS)
+        cols_h = ", ".join(f"h.{c} AS h_{c}" for c in _COUNTER_COLUMNS)
+        differs = " OR ".join(f"b.{c} IS NOT h.{c}" for c in _COUNTER_COLUMNS)
+        # Changed or added methods, then removed ones (no FULL OUTER JOIN before
+        # SQLite 3.39). Plain tuples: (class, method, descriptor, line, 6 base, 6 head counters)
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(
+            f"""
+            SELECT h.class_fqn, h.method, h.descriptor, h.line, {cols_b}, {cols_h}
+            FROM coverage_methods h
+            LEFT JOIN coverage_methods b
+              ON b.snapshot = ? AND b.class_fqn = h.class_fqn AND b.method = h.method AND b.descriptor = h.descriptor
+            WHERE h.snapshot = ? AND ({differs})
+            UNION ALL
+            SELECT b.class_fqn, b.method, b.descriptor, b.line, {cols_b}, {cols_h}
+            FROM coverage_methods b
+            LEFT JOIN coverage_methods h
+              ON h.snapshot = ? AND h.class_fqn = b.class_fqn AND h.method = b.method AND h.descriptor = b.descriptor
+            WHERE b.snapshot = ? AND h.class_fqn IS NULL
+            """,
+            (base_row["seq"], head_row["seq"], head_row["seq"], base_row["seq"]),
+        ).fetchall()
+        line_rows = conn.execute(
+            """
+            SELECT h.module, h.package, h.source_file, b.instrumented AS b_instrumented, b.covered AS b_covered,
+                   h.instrumented AS h_instrumented, h.covered AS h_covered
+            FROM coverage_lines h
+            LEFT JOIN coverage_lines b
+              ON b.snapshot = ? AND b.module = h.module AND b.package = h.package AND b.source_file = h.source_file
+            WHERE h.snapshot = ? AND (b.covered IS NOT h.covered OR b.instrumented IS NOT h.instrumented)
+            """,
+            (base_row["seq"], head_row["seq"]),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # Rank on the raw tuples; only the returned methods are turned into dicts
+    def covered_delta(row: Tuple[Any, ...]) -> int:
+        return (row[11] or 0) - (row[5] or 0)
+
+    rows.sort(key=lambda r: (-abs(covered_delta(r)), r[0], r[3]))
+    methods: List[Dict[str, Any]] = []
+    for row in rows[:max_methods]:
+        before, after = _method_counters(row[4:10]), _method_counters(row[10:16])
+        methods.append(
             {
-                "suite_name": root.attrib.get("name", xml_file.name),
-                "file": str(xml_file),
-                "tests": tests,
-                "failures": failures,
-                "errors": errors,
-                "skipped": skipped,
-                "cases": cases,
+                "class_fqn": row[0],
+                "method": row[1],
+                "descriptor": row[2],
+                "line": row[3],
+                "status": "added" if before is None else ("removed" if after is None else "changed"),
+                "before": before,
+                "after": after,
+                "instructions_covered_delta": covered_delta(row),
             }
         )
 
-    summary = {
-        "total_tests": total_tests,
-        "failures": total_failures,
-        "errors": total_errors,
-        "skipped": total_skipped,
+    lines: List[Dict[str, Any]] = []
+    gained_total = lost_total = 0
+    for row in line_rows:
+        b_cov = int.from_bytes(row["b_covered"] or b"", "little")
+        h_cov = int.from_bytes(row["h_covered"], "little")
+        h_instr = int.from_bytes(row["h_instrumented"], "little")
+        gained = h_cov & ~b_cov
+        lost = b_cov & ~h_cov & h_instr  # still code, no longer executed
+        if not gained and not lost:
+            continue
+        gained_total += gained.bit_count()
+        lost_total += lost.bit_count()
+        lines.append(
+            {
+                "module": row["module"],
+                "package": row["package"],
+                "source_file": row["source_file"],
+                "newly_covered": _bitmap_ranges(gained),
+                "newly_uncovered": _bitmap_ranges(lost),
+            }
+        )
+    lines.sort(key=lambda f: (f["module"], f["package"], f["source_file"]))
+
+    before_meta, after_meta = _snapshot_meta(base_row), _snapshot_meta(head_row)
+    return {
+        "base": before_meta,
+        "head": after_meta,
+        "summary": {
+            "instruction_ratio_delta": after_meta["instruction_ratio"] - before_meta["instruction_ratio"],
+            "instructions_covered_delta": after_meta["instructions_covered"] - before_meta["instructions_covered"],
+            "branches_covered_delta": after_meta["branches_covered"] - before_meta["branches_covered"],
+            "methods_changed": len(rows),
+            "lines_newly_covered": gained_total,
+            "lines_newly_uncovered": lost_total,
+        },
+        "methods": methods,
+        "methods_truncated": len(rows) > max_methods,
+        "lines": lines,
+        "seconds": round(time.perf_counter() - start, 4),
     }
 
-    return {"suites": suites, "summary": summary}
+############### Git Phase 3 helpers ###################
+
+@dataclass
+class GitBackend:
+    """
+    Runs every git command as a subprocess.
+    """
+
+    name: str = "subprocess"
+    subprocess_calls: int = 0
+    in_process_calls: int = 0
+
+    def answer(self, repo_root: Path, args: List[str]) -> Optional[str]:
+        """
+        stdout for queries this backend can answer without running git,
+        or None to run git.
+        """
+        return None
+
+    def run(self, repo_root: Path, args: List[str], input: Optional[str] = None) -> subprocess.CompletedProcess:
+        stdout = self.answer(repo_root, args) if input is None else None
+        if stdout is not None:
+            self.in_process_calls += 1
+            return subprocess.CompletedProcess(["git"] + args, 0, stdout, "")
+        self.subprocess_calls += 1
+        return subprocess.run(
+            ["git"] + args,
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            input=input,
+        )
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "subprocess_calls": self.subprocess_calls,
+            "in_process_calls": self.in_process_calls,
+        }
+
+@dataclass
+class _GitDirs:
+    toplevel: Path
+    git_dir: Path  # per-worktree: HEAD
+    common_dir: Path  # shared: refs, packed-refs, config
 
-def _run_maven_and_parse(project_root: Path, goal: str = "test") -> Dict[str, Any]:
-    proc = subprocess.run(
-        ["mvn", goal],
-        cwd=project_root,
-        capture_output=True,
-        text=True,
-    )
+@dataclass
+class FileGitBackend(GitBackend):
+    """
+    Answers ref queries (`rev-parse HEAD`, `--abbrev-ref HEAD`, `@{u}`,
+    `--show-toplevel`) by reading HEAD, refs, packed-refs and config from the
+    .git directory. Anything it does not recognize, or any repository layout
+    it is unsure about, goes to the git subprocess.
+    """
 
-    reports_dir = project_root / "target" / "surefire-reports"
-    report_data = _parse_surefire_reports(reports_dir)
+    name: str = "files"
 
-    return {
-        "project_root": str(project_root),
-        "maven_goal": goal,
-        "exit_code": proc.returncode,
-        "stdout": proc.stdout,
-        "stderr": proc.stderr,
-        "reports": report_data,
-    }
+    def _dirs(self, repo_root: Path) -> Optional[_GitDirs]:
+        if any(var in os.environ for var in ("GIT_DIR", "GIT_WORK_TREE", "GIT_COMMON_DIR")):
+            return None
+        try:
+            start = repo_root.resolve()
+        except OSError:
+            return None
+        for candidate in (start, *start.parents):
+            dot_git = candidate / ".git"
+            if dot_git.is_dir():
+                git_dir = dot_git
+            elif dot_git.is_file():
+                # Linked worktree or submodule: "gitdir: <path>"
+                text = dot_git.read_text(encoding="utf-8").strip()
+                if not text.startswith("gitdir: "):
+                    return None
+                git_dir = (candidate / text[len("gitdir: "):]).resolve()
+            else:
+                continue
+            common_dir = git_dir
+            commondir_file = git_dir / "commondir"
+            if commondir_file.is_file():
+                common_dir = (git_dir / commondir_file.read_text(encoding="utf-8").strip()).resolve()
+            # git refuses repositories owned by someone else (safe.directory)
+            if hasattr(os, "getuid") and git_dir.stat().st_uid != os.getuid():
+                return None
+            # Reftable storage keeps refs in binary tables
+            if (common_dir / "reftable").exists():
+                return None
+            return _GitDirs(candidate, git_dir, common_dir)
+        return None
 
-############### Git Phase 3 helpers ###################
+    def _resolve_ref(self, dirs: _GitDirs, ref: str) -> Optional[str]:
+        loose = dirs.common_dir / ref
+        if loose.is_file():
+            value = loose.read_text(encoding="utf-8").strip()
+            return value if not value.startswith("ref: ") else None
+        packed = dirs.common_dir / "packed-refs"
+        if packed.is_file():
+            with packed.open(encoding="utf-8") as fh:
+                for line in fh:
+                    if line.startswith(("#", "^")):
+                        continue
+                    sha, _, name = line.rstrip("\n").partition(" ")
+                    if name == ref:
+                        return sha
+        return None
 
-def _run_git(repo_root: Path, args: List[str]) -> subprocess.CompletedProcess:
+    def _head(self, dirs: _GitDirs) -> Optional[Tuple[Optional[str], str]]:
+        """
+        (branch or None when detached, commit sha) of HEAD.
+        """
+        head = (dirs.git_dir / "HEAD").read_text(encoding="utf-8").strip()
+        if head.startswith("ref: "):
+            ref = head[len("ref: "):]
+            sha = self._resolve_ref(dirs, ref)
+            if sha is None or not ref.startswith("refs/heads/"):
+                return None  # unborn branch or unusual symref
+            return ref[len("refs/heads/"):], sha
+        return None, head
+
+    def _config(self, dirs: _GitDirs) -> Optional[Dict[Tuple[str, str], Dict[str, str]]]:
+        """
+        Simple parse of the repository config: {(section, subsection): {key: value}}.
+        A key set several times keeps all values, newline-separated. None when
+        the file uses features this parser does not handle.
+        """
+        config_file = dirs.common_dir / "config"
+        if not config_file.is_file():
+            return {}
+        sections: Dict[Tuple[str, str], Dict[str, str]] = {}
+        current: Optional[Dict[str, str]] = None
+        for raw in config_file.read_text(encoding="utf-8").splitlines():
+            line = raw.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("["):
+                header = line[1:line.index("]")].strip()
+                section, _, sub = header.partition(" ")
+                section = section.lower()
+                if section in ("include", "includeif") or "\\" in sub:
+                    return None
+                current = sections.setdefault((section, sub.strip().strip('"')), {})
+                continue
+            if current is None or "\\" in line:
+                return None
+            key, _, value = line.partition("=")
+            if "#" in value or ";" in value:
+                return None  # possibly an inline comment
+            key, value = key.strip().lower(), value.strip().strip('"')
+            current[key] = f"{current[key]}\n{value}" if key in current else value
+        return sections
+
+    def answer(self, repo_root: Path, args: List[str]) -> Optional[str]:
+        if args not in (
+            ["rev-parse", "HEAD"],
+            ["rev-parse", "--abbrev-ref", "HEAD"],
+            ["rev-parse", "--abbrev-ref", "@{u}"],
+            ["rev-parse", "--show-toplevel"],
+        ):
+            return None
+        try:
+            dirs = self._dirs(repo_root)
+            if dirs is None:
+                return None
+            if args[1] == "--show-toplevel":
+                config = self._config(dirs)
+                if config is None or "worktree" in config.get(("core", ""), {}):
+                    return None
+                return f"{dirs.toplevel}\n"
+
+            head = self._head(dirs)
+            if head is None:
+                return None
+            branch, sha = head
+            if args == ["rev-parse", "HEAD"]:
+                return f"{sha}\n"
+            if args[2] == "HEAD":
+                return f"{branch or 'HEAD'}\n"
+
+            # @{u}: branch.<name>.remote / .merge, as a remote-tracking ref
+            if branch is None:
+                return None
+            config = self._config(dirs)
+            tracking = (config or {}).get(("branch", branch), {})
+            remote, merge = tracking.get("remote"), tracking.get("merge")
+            if not remote or remote == "." or not merge or not merge.startswith("refs/heads/"):
+                return None
+            # <remote>/<branch> only holds for the default fetch refspec
+            fetch = (config or {}).get(("remote", remote), {}).get("fetch")
+            if fetch != f"+refs/heads/*:refs/remotes/{remote}/*":
+                return None
+            upstream = f"{remote}/{merge[len('refs/heads/'):]}"
+            if self._resolve_ref(dirs, f"refs/remotes/{upstream}") is None:
+                return None
+            return f"{upstream}\n"
+        except (OSError, UnicodeDecodeError, ValueError):
+            return None
+
+_GIT_BACKENDS: Dict[str, GitBackend] = {
+    "subprocess": GitBackend(),
+    "files": FileGitBackend(),
+}
+
+# "files" only serves ref queries so far; index and status still need git
+_GIT_BACKEND = _GIT_BACKENDS.get(os.environ.get("TEST_AGENT_GIT_BACKEND", "subprocess"), _GIT_BACKENDS["subprocess"])
+
+def _run_git(repo_root: Path, args: List[str], input: Optional[str] = None) -> subprocess.CompletedProcess:
     """
-    Run a git command in the given repository.
+    Run a git command in the given repository, optionally feeding `input` on
+    stdin. Ref lookups are answered from the .git directory when the "files"
+    backend is selected (TEST_AGENT_GIT_BACKEND, default "subprocess").
     """
-    return subprocess.run(
-        ["git"] + args,
-        cwd=repo_root,
-        capture_output=True,
-        text=True,
-    )
+    return _GIT_BACKEND.run(repo_root, args, input)
 
 
 def _parse_git_status_porcelain(repo_root: Path) -> Dict[str, Any]:
@@ -618,6 +3524,76 @@ def _parse_git_status_porcelain(repo_root: Path) -> Dict[str, Any]:
     }
 
 
+def _parse_git_status_porcelain_v2(repo_root: Path, untracked_files: str = "normal") -> Dict[str, Any]:
+    """
+    Parse `git status --porcelain=v2 -z` into the same buckets as
+    _parse_git_status_porcelain (whose v1 text the git_status tool returns).
+    Paths are relative to the repository root and never quoted. With
+    untracked_files="all", untracked directories are listed file by file.
+    """
+    proc = _run_git(repo_root, ["status", "--porcelain=v2", "-z", f"--untracked-files={untracked_files}"])
+    staged: List[Dict[str, str]] = []
+    unstaged: List[Dict[str, str]] = []
+    untracked: List[str] = []
+    conflicts: List[str] = []
+
+    if proc.returncode != 0:
+        return {
+            "exit_code": proc.returncode,
+            "stdout": proc.stdout,
+            "stderr": proc.stderr,
+            "staged_changes": staged,
+            "unstaged_changes": unstaged,
+            "untracked_files": untracked,
+            "conflicts": conflicts,
+            "is_clean": False,
+        }
+
+    records = iter(proc.stdout.split("\0"))
+    for record in records:
+        if not record:
+            continue
+        kind = record[0]
+        if kind == "?":
+            # ? <path>
+            untracked.append(record[2:])
+            continue
+        if kind not in ("1", "2", "u"):
+            continue  # ignored files ("!") and headers ("#")
+
+        # 1 XY sub mH mI mW hH hI <path>
+        # 2 XY sub mH mI mW hH hI Xscore <path> NUL <origPath>
+        # u XY sub m1 m2 m3 mW h1 h2 h3 <path>
+        fields = {"1": 8, "2": 9, "u": 10}[kind]
+        parts = record.split(" ", fields)
+        status_x, status_y = parts[1][0], parts[1][1]
+        path = parts[fields]
+        if kind == "2":
+            next(records, None)  # rename/copy source
+
+        if status_x in {"M", "A", "D", "R", "C"}:
+            staged.append({"path": path, "status": status_x})
+        if status_y in {"M", "D"}:
+            unstaged.append({"path": path, "status": status_y})
+
+        # unmerged entries (UU, AA, DD, AU, UD, UA, DU)
+        if kind == "u":
+            conflicts.append(path)
+
+    is_clean = not staged and not unstaged and not untracked
+
+    return {
+        "exit_code": proc.returncode,
+        "stdout": proc.stdout,
+        "stderr": proc.stderr,
+        "staged_changes": staged,
+        "unstaged_changes": unstaged,
+        "untracked_files": untracked,
+        "conflicts": conflicts,
+        "is_clean": is_clean,
+    }
+
+
 # Intelligent filtering for git_add_all
 _EXCLUDE_PREFIXES = (
     "target/",
@@ -627,6 +3603,7 @@ _EXCLUDE_PREFIXES = (
     ".vscode/",
     ".gradle/",
     "node_modules/",
+    _STATE_DIR_NAME + "/",
 )
 
 _EXCLUDE_SUFFIXES = (
@@ -658,11 +3635,34 @@ def _git_status_internal(repo_root: Path) -> Dict[str, Any]:
     return _parse_git_status_porcelain(repo_root)
 
 
+def _staged_paths(repo_root: Path) -> Optional[List[str]]:
+    """
+    Paths whose index entry differs from HEAD (`git diff --cached --name-only -z`),
+    relative to the repository root. Compares against the empty tree on an
+    unborn branch. None if git fails.
+    """
+    args = ["diff", "--cached", "--name-only", "--no-renames", "-z"]
+    proc = _run_git(repo_root, args)
+    if proc.returncode != 0:
+        empty_tree = _run_git(repo_root, ["hash-object", "-t", "tree", "--stdin"], input="")
+        if empty_tree.returncode != 0:
+            return None
+        proc = _run_git(repo_root, args + [empty_tree.stdout.strip()])
+        if proc.returncode != 0:
+            return None
+    return [p for p in proc.stdout.split("\0") if p]
+
+
 def _git_add_all_internal(repo_root: Path) -> Dict[str, Any]:
     """
     Stage all changes with intelligent filtering, confirm staging success.
+
+    Candidate files are streamed NUL-separated to a single
+    `git update-index --add --remove --stdin` (so change sets of any size stay
+    clear of argv limits and pathspec matching), and staging is confirmed
+    against the index with `git diff --cached` rather than a second status scan.
     """
-    status_before = _parse_git_status_porcelain(repo_root)
+    status_before = _parse_git_status_porcelain_v2(repo_root, untracked_files="all")
     staged = status_before["staged_changes"]
     unstaged = status_before["unstaged_changes"]
     untracked = status_before["untracked_files"]
@@ -670,6 +3670,7 @@ def _git_add_all_internal(repo_root: Path) -> Dict[str, Any]:
     # Collect candidate paths
     candidate_paths: List[str] = []
     skipped_paths: List[str] = []
+    skipped_unstaged: List[Dict[str, str]] = []
 
     for entry in unstaged:
         p = entry["path"]
@@ -677,12 +3678,15 @@ def _git_add_all_internal(repo_root: Path) -> Dict[str, Any]:
             candidate_paths.append(p)
         else:
             skipped_paths.append(p)
+            skipped_unstaged.append(entry)
 
+    skipped_untracked: List[str] = []
     for p in untracked:
         if _should_stage_path(p):
             candidate_paths.append(p)
         else:
             skipped_paths.append(p)
+            skipped_untracked.append(p)
 
     # Remove duplicates
     candidate_paths = sorted(set(candidate_paths))
@@ -697,21 +3701,31 @@ def _git_add_all_internal(repo_root: Path) -> Dict[str, Any]:
             "message": "No new changes to stage (or all changes filtered).",
         }
 
-    proc = _run_git(repo_root, ["add"] + candidate_paths)
+    # Status paths are relative to the top level, and so are update-index paths
+    # when run from there. Unlike `git add <pathspec>...`, update-index does not
+    # match every pathspec against every index entry, so it stays linear.
+    top = _run_git(repo_root, ["rev-parse", "--show-toplevel"])
+    top_level = Path(top.stdout.strip()) if top.returncode == 0 else repo_root
+    proc = _run_git(
+        top_level,
+        ["update-index", "--add", "--remove", "-z", "--stdin"],
+        input="".join(f"{p}\0" for p in candidate_paths),
+    )
 
     # Confirm staging success
-    status_after = _parse_git_status_porcelain(repo_root)
-    staged_after_paths = {e["path"] for e in status_after["staged_changes"]}
+    staged_after = _staged_paths(repo_root)
+    staged_after_paths = set(staged_after or [])
     successfully_staged = [p for p in candidate_paths if p in staged_after_paths]
 
+    not_staged = set(candidate_paths) - set(successfully_staged)
     return {
         "exit_code": proc.returncode,
         "stdout": proc.stdout,
         "stderr": proc.stderr,
         "staged_files": successfully_staged,
         "skipped_files": skipped_paths,
-        "remaining_unstaged": status_after["unstaged_changes"],
-        "remaining_untracked": status_after["untracked_files"],
+        "remaining_unstaged": skipped_unstaged + [e for e in unstaged if e["path"] in not_staged],
+        "remaining_untracked": skipped_untracked + [p for p in untracked if p in not_staged],
     }
 
 
@@ -719,18 +3733,17 @@ def _overall_coverage_summary(repo_root: Path) -> Optional[Dict[str, Any]]:
     """
     Compute overall coverage from JaCoCo if jacoco.xml exists.
     """
-    xml_path = _find_jacoco_xml(repo_root)
-    if xml_path is None:
+    reports = _find_jacoco_reports(repo_root)
+    if not reports:
         return None
 
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    model = _load_coverage_reports(reports)
 
-    mi, ci, r_instr = _coverage_from_counters(root, "INSTRUCTION")
-    mb, cb, r_branch = _coverage_from_counters(root, "BRANCH")
+    mi, ci, r_instr = _coverage_from_counters(model.counters, "INSTRUCTION")
+    mb, cb, r_branch = _coverage_from_counters(model.counters, "BRANCH")
 
     return {
-        "jacoco_xml": str(xml_path),
+        "jacoco_xml": model.report_file,
         "instruction_missed": mi,
         "instruction_covered": ci,
         "instruction_ratio": r_instr,
@@ -971,14 +3984,78 @@ def _git_pull_request_internal(
         "pull_request_url": pr_url,
     }
 
+def _tests_passed(test_result: Dict[str, Any]) -> bool:
+    summary = (test_result.get("reports") or {}).get("summary") or {}
+    return test_result["exit_code"] == 0 and not summary.get("failures") and not summary.get("errors")
+
+def _last_failed_tests(project_root: Path) -> List[str]:
+    """
+    Test classes (simple names) that failed or errored in the last recorded run.
+    """
+    try:
+        rows = _history_query(
+            project_root,
+            """
+            SELECT DISTINCT class_name FROM results
+            WHERE run_id = (SELECT MAX(id) FROM runs) AND status IN ('failure', 'error')
+            """,
+            (),
+        )
+    except sqlite3.Error:
+        return []
+    return sorted({row["class_name"].rsplit(".", 1)[-1] for row in rows})
+
+def _fail_fast_selection(project_root: Path) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Tests to run before the full suite in fail-fast mode: last run's failures
+    plus the tests affected by uncommitted changes.
+    """
+    last_failed = _last_failed_tests(project_root)
+    affected = _affected_test_classes(project_root) or []
+    priority = sorted(set(last_failed) | set(affected))
+    return priority, {"priority_tests": priority, "last_failed": last_failed, "affected": affected}
+
+def _fail_fast_runs(
+    project_root: Path,
+    maven_goal: str,
+) -> Generator[Tuple[str, Optional[List[str]]], Dict[str, Any], Dict[str, Any]]:
+    """
+    The fail-fast test step, independent of how Maven is run: yields the
+    (goal, tests) of each run to make and is sent its result; returns the
+    test result that decides the pipeline. The priority tests go first and a
+    failure among them ends the step; otherwise the full goal runs.
+    """
+    priority, selection = _fail_fast_selection(project_root)
+    if priority:
+        first = yield "test", priority
+        first["fail_fast"] = dict(selection, phase="priority")
+        if not _tests_passed(first):
+            return first
+        selection = dict(selection, priority_summary=(first.get("reports") or {}).get("summary"))
+    full = yield maven_goal, None
+    full["fail_fast"] = dict(selection, phase="full")
+    return full
+
 def _auto_test_and_commit_internal(
     repo_root: Path,
     message: str,
     coverage_threshold: float,
     maven_goal: str = "test",
+    backend: str = "",
+    test_result: Optional[Dict[str, Any]] = None,
+    fail_fast: bool = False,
+    enter_git_phase: Optional[Callable[[], bool]] = None,
 ) -> Dict[str, Any]:
     """
     Run tests, check coverage, and automatically stage & commit if thresholds are met.
+    A test_result from a Maven run that already happened skips step 1.
+    enter_git_phase (background jobs) is asked before any branch, index or
+    commit change; when it returns False the pipeline stops there.
+
+    With fail_fast, the tests that failed in the last recorded run and the
+    tests affected by uncommitted changes run first; if one of them fails the
+    pipeline stops there, without running the rest of the suite. Both runs
+    stop at the first failing test (surefire.skipAfterFailureCount=1).
 
     If the current branch is a protected branch (main/master), this function will:
       - create a new test-improvement/* branch, and
@@ -987,16 +4064,20 @@ def _auto_test_and_commit_internal(
     This keeps branch protection rules intact while still allowing the agent to
     operate autonomously.
     """
-    # 1) Run Maven tests
-    test_result = _run_maven_and_parse(repo_root, goal=maven_goal)
-    exit_code = test_result["exit_code"]
-    summary = (
-        test_result["reports"]["summary"]
-        if test_result.get("reports")
-        else {"total_tests": 0, "failures": 0, "errors": 0, "skipped": 0}
-    )
-
-    if exit_code != 0 or summary["failures"] > 0 or summary["errors"] > 0:
+    # 1) Run Maven tests; in fail-fast mode the likeliest failures go first
+    if test_result is None and fail_fast:
+        runs = _fail_fast_runs(repo_root, maven_goal)
+        try:
+            goal, tests = next(runs)
+            while True:
+                run = _run_maven_and_parse(repo_root, goal=goal, tests=tests, backend=backend, fail_fast=True)
+                goal, tests = runs.send(run)
+        except StopIteration as done:
+            test_result = done.value
+    elif test_result is None:
+        test_result = _run_maven_and_parse(repo_root, goal=maven_goal, backend=backend)
+
+    if not _tests_passed(test_result):
         return {
             "stage": "tests",
             "tests": test_result,
@@ -1044,6 +4125,20 @@ def _auto_test_and_commit_internal(
             ),
         }
 
+    if enter_git_phase is not None and not enter_git_phase():
+        return {
+            "stage": "branch_creation",
+            "tests": test_result,
+            "coverage": coverage,
+            "git_add": None,
+            "git_commit": None,
+            "branch_before": None,
+            "branch_after": None,
+            "created_branch": False,
+            "status": "cancelled",
+            "reason": "The job was cancelled before staging and committing.",
+        }
+
     # 3) Ensure we are on a non-protected branch
     branch_before = None
     branch_after = None
@@ -1106,52 +4201,284 @@ def _auto_test_and_commit_internal(
     }
 
 
+############### Background jobs ###################
+
+_JOB_OUTPUT_LIMIT = 200
+# Finished jobs kept for job_status/list_jobs; older ones are dropped
+_FINISHED_JOBS_KEPT = 100
+
+@dataclass
+class BackgroundJob:
+    job_id: str
+    kind: str
+    project_root: str
+    status: str = "running"  # running | succeeded | failed | cancelled
+    command: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    collector: Optional[MavenOutputCollector] = field(default=None, repr=False)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    task: Optional["asyncio.Task[None]"] = field(default=None, repr=False)
+    process: Optional[asyncio.subprocess.Process] = field(default=None, repr=False)
+    # Git phase of auto-test jobs: once it started the job cannot be cancelled
+    committing: bool = False
+    cancel_requested: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def enter_git_phase(self) -> bool:
+        """
+        Called from the pipeline's worker thread before it touches git.
+        False if the job was cancelled meanwhile.
+        """
+        with self._lock:
+            if self.cancel_requested:
+                return False
+            self.committing = True
+            return True
+
+    def request_cancel(self) -> bool:
+        """
+        Mark the job cancelled, unless it is already staging and committing.
+        """
+        with self._lock:
+            if self.committing:
+                return False
+            self.cancel_requested = True
+            return True
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "project_root": self.project_root,
+            "status": self.status,
+            "command": self.command,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(end - self.started_at, 3),
+            "output_lines": self.collector.lines_seen if self.collector is not None else 0,
+            "committing": self.committing,
+            "error": self.error,
+        }
+
+_JOBS: Dict[str, BackgroundJob] = {}
+
+async def _run_maven_async(
+    job: BackgroundJob,
+    project_root: Path,
+    goal: str,
+    args: List[str],
+    selected: List[str],
+    runner: MavenBackend,
+) -> Dict[str, Any]:
+    """
+    Run Maven through the backend as an asyncio subprocess, streaming output
+    lines into the job's collector as they arrive so callers can follow
+    progress while the build runs.
+    """
+    job.command = runner.command(args)
+    reports_before = _surefire_report_stats_all(_surefire_report_dirs(project_root))
+    collector = job.collector = MavenOutputCollector(_new_maven_log(project_root))
+
+    def track(proc: Optional[asyncio.subprocess.Process]) -> None:
+        job.process = proc
+
+    try:
+        exit_code = await runner.run_async(project_root, args, collector.feed, track)
+    finally:
+        collector.close()
+
+    # Reports are parsed off the event loop
+    return await asyncio.to_thread(
+        _maven_run_result, project_root, goal, args, selected, runner, exit_code, collector, False, reports_before
+    )
+
+async def _drive_job(job: BackgroundJob, work: Callable[[BackgroundJob], Awaitable[Dict[str, Any]]]) -> None:
+    try:
+        job.result = result = await work(job)
+        ok = result.get("exit_code", 0) == 0 and result.get("status", "ok") == "ok"
+        job.status = "succeeded" if ok else "failed"
+    except asyncio.CancelledError:
+        if job.process is not None and job.process.returncode is None:
+            job.process.kill()
+            await job.process.wait()
+        job.status = "cancelled"
+    except Exception as e:  # surfaced through job_status
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+
+def _start_job(
+    kind: str,
+    project_root: Path,
+    work: Callable[[BackgroundJob], Awaitable[Dict[str, Any]]],
+) -> BackgroundJob:
+    """
+    Register a job and schedule `work(job)` on the running event loop.
+    """
+    finished = [j.job_id for j in _JOBS.values() if j.status != "running"]
+    for job_id in finished[: max(0, len(finished) - _FINISHED_JOBS_KEPT + 1)]:
+        del _JOBS[job_id]  # oldest first (insertion order)
+    job = BackgroundJob(job_id=uuid.uuid4().hex[:12], kind=kind, project_root=str(project_root))
+    _JOBS[job.job_id] = job
+    job.task = asyncio.get_running_loop().create_task(_drive_job(job, work))
+    return job
+
+async def _maven_job_work(
+    job: BackgroundJob,
+    project_root: Path,
+    goal: str,
+    tests: Optional[List[str]],
+    modules: Optional[List[str]],
+    affected_only: bool,
+    base_ref: str,
+    backend: str,
+    fail_fast: bool = False,
+) -> Dict[str, Any]:
+    runner, args, selected, early = await asyncio.to_thread(
+        _plan_maven_run, project_root, goal, tests, modules, affected_only, base_ref, backend, fail_fast
+    )
+    if early is not None or runner is None:
+        return cast(Dict[str, Any], early)
+    return await _run_maven_async(job, project_root, goal, args, selected, runner)
+
+async def _auto_test_job_work(
+    job: BackgroundJob,
+    repo_root: Path,
+    message: str,
+    coverage_threshold: float,
+    maven_goal: str,
+    backend: str,
+    fail_fast: bool = False,
+) -> Dict[str, Any]:
+    if fail_fast:
+        # Same steps as the synchronous pipeline; the runs go through the job
+        runs = _fail_fast_runs(repo_root, maven_goal)
+        try:
+            goal, tests = await asyncio.to_thread(next, runs)
+            while True:
+                run = await _maven_job_work(job, repo_root, goal, tests, None, False, "", backend, True)
+                goal, tests = runs.send(run)
+        except StopIteration as done:
+            test_result = done.value
+    else:
+        test_result = await _maven_job_work(job, repo_root, maven_goal, None, None, False, "", backend)
+    return await asyncio.to_thread(
+        _auto_test_and_commit_internal,
+        repo_root,
+        message,
+        coverage_threshold,
+        maven_goal,
+        backend,
+        test_result,
+        False,
+        job.enter_git_phase,
+    )
+
 ############### Extension: Specification-Based Testing Generator ###############
 
+@dataclass(slots=True)
+class _SymbolEntry:
+    class_info: ClassInfo
+    overloads: Dict[str, List[MethodInfo]]  # method name -> overloads, in source order
+    mtime_ns: int
+    size: int
+
+@dataclass(slots=True)
+class SymbolTable:
+    """
+    FQN -> class -> method overloads for one project, filled lazily: single
+    files resolved from their package path, or everything at once after a
+    full analysis.
+    """
+
+    entries: Dict[str, _SymbolEntry] = field(default_factory=dict)
+
+    def add(self, class_info: ClassInfo) -> Optional[_SymbolEntry]:
+        try:
+            st = os.stat(class_info.file_path)
+        except OSError:
+            return None
+        overloads: Dict[str, List[MethodInfo]] = {}
+        for m in class_info.methods:
+            overloads.setdefault(m.name, []).append(m)
+        entry = _SymbolEntry(class_info, overloads, st.st_mtime_ns, st.st_size)
+        self.entries[_class_fqn(class_info.package, class_info.class_name)] = entry
+        return entry
+
+    def get(self, fqn: str) -> Optional[_SymbolEntry]:
+        """
+        The entry for fqn if its source file is unchanged since it was parsed.
+        """
+        entry = self.entries.get(fqn)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(entry.class_info.file_path)
+        except OSError:
+            st = None
+        if st is None or (st.st_mtime_ns, st.st_size) != (entry.mtime_ns, entry.size):
+            del self.entries[fqn]
+            return None
+        return entry
+
+# project root -> symbol table
+_SYMBOL_TABLES: Dict[str, SymbolTable] = {}
+
+def _lookup_class(project_root: Path, class_fqn: str) -> Tuple[Optional[_SymbolEntry], str]:
+    """
+    Find a class by FQN. Returns (entry, how it was found): "symbol_table"
+    for a fresh table entry, "direct" when <pkg>/<Class>.java under a
+    (module's) src/main/java was parsed on its own, "full_analysis" after
+    falling back to analyzing the whole project.
+    """
+    table = _SYMBOL_TABLES.setdefault(str(project_root), SymbolTable())
+    entry = table.get(class_fqn)
+    if entry is not None:
+        return entry, "symbol_table"
+
+    rel = class_fqn.replace(".", "/") + ".java"
+    for root in _main_source_roots(project_root):
+        candidate = root / rel
+        if not candidate.is_file():
+            continue
+        info = _extract_package_and_classes(candidate)
+        if info is not None and _class_fqn(info.package, info.class_name) == class_fqn:
+            entry = table.add(info)
+            if entry is not None:
+                return entry, "direct"
+
+    for info in _project_classes(project_root):
+        table.add(info)
+    return table.entries.get(class_fqn), "full_analysis"
+
 def _resolve_class_and_method(
     project_root: Path,
     class_fqn: str,
     method_name: str,
 ) -> Optional[Dict[str, Any]]:
     """
-    Find the specified class and method using the existing Java analysis.
+    Find the specified class and method through the project's symbol table.
+    With several overloads the first one declared is used.
 
     Returns
     -------
     dict with keys:
       - class_info: ClassInfo
       - method_info: MethodInfo
+      - resolved_via: str ("symbol_table", "direct" or "full_analysis")
     or None if not found.
     """
-    analysis = _analyze_project_internal(project_root)
-    for cdict in analysis["classes"]:
-        fqn = f"{cdict['package']}.{cdict['class_name']}" if cdict["package"] else cdict["class_name"]
-        if fqn != class_fqn:
-            continue
-
-        method_infos = [
-            MethodInfo(
-                name=m["name"],
-                return_type=m["return_type"],
-                parameters=m["parameters"],
-                modifiers=m["modifiers"],
-                is_static=m["is_static"],
-                is_constructor=m["is_constructor"],
-            )
-            for m in cdict["methods"]
-        ]
-        ci = ClassInfo(
-            package=cdict["package"],
-            class_name=cdict["class_name"],
-            file_path=cdict["file_path"],
-            methods=method_infos,
-        )
-
-        for mi in method_infos:
-            if mi.name == method_name:
-                return {"class_info": ci, "method_info": mi}
-
-    return None
+    entry, resolved_via = _lookup_class(project_root, class_fqn)
+    if entry is None:
+        return None
+    overloads = entry.overloads.get(method_name)
+    if not overloads:
+        return None
+    return {"class_info": entry.class_info, "method_info": overloads[0], "resolved_via": resolved_via}
 
 
 def _is_numeric_type(t: str) -> bool:
@@ -1332,8 +4659,8 @@ def _generate_param_value_sets(
     param_sets: Dict[str, List[Dict[str, Any]]] = {}
 
     for p in method_info.parameters:
-        pname = p["name"]
-        ptype = p["type"]
+        pname = p.name
+        ptype = p.type
         spec = param_specs.get(pname, {}) if param_specs else {}
 
         if _is_numeric_type(ptype):
@@ -1404,84 +4731,352 @@ def _cartesian_combinations(
     return results
 
 
-def _build_spec_junit_snippet(
+def _nwise_combinations(
+    param_sets: Dict[str, List[Dict[str, Any]]],
+    strength: int = 2,
+    max_cases: int = 20,
+    candidates: int = 4,
+    seed: int = 0,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Greedy t-wise covering array (AETG style): every combination of values of
+    any `strength` parameters appears in at least one case, using close to the
+    minimal number of cases.
+
+    Each case starts from an uncovered t-tuple; the remaining parameters are
+    filled in a shuffled order with the value covering the most new tuples.
+    The best of `candidates` such rows is kept. A seeded RNG makes the result
+    deterministic.
+
+    Returns (cases in the _cartesian_combinations format, coverage stats).
+    """
+    items = list(param_sets.items())
+    n = len(items)
+    if n == 0:
+        return [], {"strength": 0, "tuples_total": 0, "tuples_covered": 0}
+    t = max(1, min(strength, n))
+    sizes = [len(vals) for _, vals in items]
+
+    # Uncovered t-tuples: parameter-index group -> set of value-index tuples
+    param_groups = list(itertools.combinations(range(n), t))
+    uncovered: Dict[Tuple[int, ...], set] = {
+        group: set(itertools.product(*(range(sizes[i]) for i in group))) for group in param_groups
+    }
+    total = sum(len(v) for v in uncovered.values())
+    remaining = total
+    # Seed tuples to start rows from, in a fixed order; covered ones are
+    # dropped lazily when drawn
+    seeds = [(group, values) for group in param_groups for values in sorted(uncovered[group])]
+    rng = random.Random(seed)
+    rows: List[List[int]] = []
+
+    def draw_seed() -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        while True:
+            i = rng.randrange(len(seeds))
+            group, values = seeds[i]
+            if values in uncovered[group]:
+                return group, values
+            seeds[i] = seeds[-1]
+            seeds.pop()
+
+    while remaining and len(rows) < max_cases:
+        best_row: Optional[List[int]] = None
+        best_gain = -1
+        for _ in range(max(1, candidates)):
+            group, values = draw_seed()
+            row = [-1] * n
+            for i, v in zip(group, values):
+                row[i] = v
+            fixed = list(group)
+            rest = [i for i in range(n) if row[i] < 0]
+            rng.shuffle(rest)
+            for p in rest:
+                counts = [0] * sizes[p]
+                for others in itertools.combinations(sorted(fixed), t - 1):
+                    # p's slot within the sorted group, with the other values around it
+                    pos = bisect_left(others, p)
+                    open_values = uncovered[others[:pos] + (p,) + others[pos:]]
+                    if not open_values:
+                        continue
+                    before = tuple(row[i] for i in others[:pos])
+                    after = tuple(row[i] for i in others[pos:])
+                    for v in range(sizes[p]):
+                        if before + (v,) + after in open_values:
+                            counts[v] += 1
+                top = max(counts)
+                best_values = [v for v, c in enumerate(counts) if c == top]
+                row[p] = best_values[rng.randrange(len(best_values))]
+                fixed.append(p)
+            gain = sum(1 for g in param_groups if tuple(row[i] for i in g) in uncovered[g])
+            if gain > best_gain:
+                best_row, best_gain = row, gain
+        assert best_row is not None
+        rows.append(best_row)
+        for group in param_groups:
+            values = tuple(best_row[i] for i in group)
+            if values in uncovered[group]:
+                uncovered[group].discard(values)
+                remaining -= 1
+
+    cases = []
+    for row in rows:
+        inputs: Dict[str, Any] = {}
+        meta: Dict[str, Any] = {}
+        for (pname, vals), v in zip(items, row):
+            inputs[pname] = vals[v]["value"]
+            meta[pname] = {"label": vals[v]["label"], "kind": vals[v]["kind"]}
+        cases.append({"inputs": inputs, "meta": meta})
+    return cases, {"strength": t, "tuples_total": total, "tuples_covered": total - remaining}
+
+_COMBINATION_STRATEGIES = ("nwise", "cartesian")
+
+def _combine_param_sets(
+    param_sets: Dict[str, List[Dict[str, Any]]],
+    strategy: str,
+    strength: int,
+    max_cases: int,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Combine per-parameter value sets into cases with the chosen strategy.
+    Returns (cases, description of how they were combined).
+    """
+    if strategy == "cartesian":
+        cases = _cartesian_combinations(param_sets, max_cases=max_cases)
+        full = 1
+        for vals in param_sets.values():
+            full *= len(vals)
+        return cases, {"strategy": "cartesian", "cases": len(cases), "full_product": full if param_sets else 0}
+    cases, stats = _nwise_combinations(param_sets, strength=strength, max_cases=max_cases)
+    return cases, dict({"strategy": "nwise", "cases": len(cases)}, **stats)
+
+def _spec_case_lines(
     class_info: ClassInfo,
     method_info: MethodInfo,
-    cases: List[Dict[str, Any]],
-) -> str:
+    case: Dict[str, Any],
+    test_name: str,
+) -> List[str]:
     """
-    Build a JUnit5 snippet exercising boundary/equivalence cases for the method.
-    This is returned as text only (not written to disk).
+    Lines of one @Test method exercising a single generated case.
     """
+    lines: List[str] = []
+    need_instance = not method_info.is_static and not method_info.is_constructor
+
+    lines.append("    @Test")
+    lines.append(f"    void {test_name}() {{")
+    lines.append("        // Arrange")
+
+    if need_instance:
+        lines.append(f"        {class_info.class_name} obj = new {class_info.class_name}();")
+
+    # Parameter initializations
+    for p in method_info.parameters:
+        pname = p.name
+        ptype = p.type
+        val = case["inputs"].get(pname, None)
+        meta = case["meta"].get(pname, {})
+        label = meta.get("label", "")
+        kind = meta.get("kind", "")
+
+        comment = f"// {pname}: {label} ({kind})"
+        if val is None:
+            # Let user decide the concrete value; just comment it
+            lines.append(f"        {comment}")
+            lines.append(f"        {ptype} {pname} = /* TODO: choose value for this equivalence class */;")
+        elif isinstance(val, str):
+            lines.append(f"        {comment}")
+            lines.append(f"        {ptype} {pname} = \"{val}\";")
+        else:
+            lines.append(f"        {comment}")
+            lines.append(f"        {ptype} {pname} = {val};")
+
+    lines.append("")
+    lines.append("        // Act")
+    call_prefix = ""
+    if need_instance:
+        call_prefix = "obj."
+    elif method_info.is_static and not method_info.is_constructor:
+        call_prefix = f"{class_info.class_name}."
+
+    call = f"{call_prefix}{method_info.name}("
+    call += ", ".join(p.name for p in method_info.parameters)
+    call += ")"
+
+    if method_info.return_type and method_info.return_type.lower() != "void":
+        lines.append(f"        var result = {call};")
+    else:
+        lines.append(f"        {call};")
+
+    lines.append("")
+    lines.append("        // Assert")
+    lines.append("        // TODO: assert expected behavior for this equivalence class / boundary case")
+    lines.append("    }")
+    lines.append("")
+    return lines
+
+def _spec_test_class(class_info: ClassInfo, test_class_name: str, body: List[str]) -> str:
     pkg_line = f"package {class_info.package};\n\n" if class_info.package else ""
     imports = (
         "import org.junit.jupiter.api.Test;\n"
         "import static org.junit.jupiter.api.Assertions.*;\n\n"
     )
+    lines = [f"public class {test_class_name} {{", ""] + body + ["}"]
+    return pkg_line + imports + "\n".join(lines)
 
-    test_class_name = f"{class_info.class_name}_{method_info.name}_SpecTests"
-    lines: List[str] = []
+def _build_spec_junit_snippet(
+    class_info: ClassInfo,
+    method_info: MethodInfo,
+    cases: List[Dict[str, Any]],
+) -> str:
+    """
+    Build a JUnit5 snippet exercising boundary/equivalence cases for the method.
+    This is returned as text only (not written to disk).
+    """
+    body: List[str] = []
+    for idx, case in enumerate(cases):
+        body.extend(_spec_case_lines(class_info, method_info, case, f"spec_case_{idx + 1}"))
+    return _spec_test_class(class_info, f"{class_info.class_name}_{method_info.name}_SpecTests", body)
 
-    lines.append(f"public class {test_class_name} {{")
-    lines.append("")
+############### Batch spec-based generation ###############
 
-    need_instance = not method_info.is_static and not method_info.is_constructor
+# Above this many distinct classes a batch resolves against one full
+# (parse-cached) analysis instead of parsing class files one by one
+_SPEC_BATCH_FULL_INDEX_CLASSES = 16
 
-    for idx, case in enumerate(cases):
-        test_name = f"spec_case_{idx + 1}"
-        lines.append("    @Test")
-        lines.append(f"    void {test_name}() {{")
-        lines.append("        // Arrange")
+def _low_coverage_targets(
+    project_root: Path,
+    below_coverage: float,
+    max_methods: int,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Methods whose instruction coverage is below `below_coverage`, most missed
+    instructions first. Returns (targets, error).
+    """
+    reports = _find_jacoco_reports(project_root)
+    if not reports:
+        return [], f"Could not find jacoco.xml under {project_root}; run the tests with JaCoCo first."
+    model = _load_coverage_reports(reports)
+
+    found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for cls in model.classes:
+        if "$" in cls.class_name:
+            continue  # nested/anonymous classes are not in the source symbol index
+        for m in cls.methods:
+            if m.name.startswith(_SYNTHETIC_METHOD_PREFIXES):
+                continue
+            missed, _, ratio = _coverage_from_counters(m.counters, "INSTRUCTION")
+            if ratio >= below_coverage or missed == 0:
+                continue
+            name = cls.class_name if m.name == "<init>" else m.name
+            key = (cls.fqn, name)
+            # Overloads are resolved by name; keep the worst-covered one
+            if key not in found or missed > found[key]["missed_instructions"]:
+                found[key] = {
+                    "class_fqn": cls.fqn,
+                    "method_name": name,
+                    "instruction_coverage": ratio,
+                    "missed_instructions": missed,
+                }
+    targets = sorted(found.values(), key=lambda t: (-t["missed_instructions"], t["class_fqn"], t["method_name"]))
+    return targets[:max_methods], None
 
-        if need_instance:
-            lines.append(f"        {class_info.class_name} obj = new {class_info.class_name}();")
+def _spec_cases(
+    method_info: MethodInfo,
+    param_specs: Dict[str, Any],
+    max_cases: int,
+    strategy: str = "nwise",
+    strength: int = 2,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    param_sets = _generate_param_value_sets(method_info, param_specs)
+    return _combine_param_sets(param_sets, strategy, strength, max_cases)
 
-        # Parameter initializations
-        for p in method_info.parameters:
-            pname = p["name"]
-            ptype = p["type"]
-            val = case["inputs"].get(pname, None)
-            meta = case["meta"].get(pname, {})
-            label = meta.get("label", "")
-            kind = meta.get("kind", "")
-
-            comment = f"// {pname}: {label} ({kind})"
-            if val is None:
-                # Let user decide the concrete value; just comment it
-                lines.append(f"        {comment}")
-                lines.append(f"        {ptype} {pname} = /* TODO: choose value for this equivalence class */;")
-            elif isinstance(val, str):
-                lines.append(f"        {comment}")
-                lines.append(f"        {ptype} {pname} = \"{val}\";")
-            else:
-                lines.append(f"        {comment}")
-                lines.append(f"        {ptype} {pname} = {val};")
+def _generate_spec_batch_internal(
+    project_root: Path,
+    targets: List[Dict[str, Any]],
+    param_specs: Dict[str, Any],
+    max_cases: int,
+    combination_strategy: str = "nwise",
+    strength: int = 2,
+) -> Dict[str, Any]:
+    """
+    Resolve every target against the project's symbol table and build one
+    *SpecTests class per target class.
 
-        lines.append("")
-        lines.append("        // Act")
-        call_prefix = ""
-        if need_instance:
-            call_prefix = "obj."
-        elif method_info.is_static and not method_info.is_constructor:
-            call_prefix = f"{class_info.class_name}."
+    Generating value sets and snippets is pure string work measured in
+    microseconds per method, so it runs inline; resolution is the only
+    expensive step and is shared across the batch.
+    """
+    class_names = {t["class_fqn"] for t in targets}
+    table = _SYMBOL_TABLES.setdefault(str(project_root), SymbolTable())
+    full_index = len([c for c in class_names if c not in table.entries]) > _SPEC_BATCH_FULL_INDEX_CLASSES
+    if full_index:
+        for info in _project_classes(project_root):
+            table.add(info)
+
+    grouped: Dict[str, Dict[str, Any]] = {}
+    unresolved: List[Dict[str, str]] = []
+    seen = set()
+    for target in targets:
+        fqn, name = target["class_fqn"], target["method_name"]
+        if (fqn, name) in seen:
+            continue
+        seen.add((fqn, name))
 
-        call = f"{call_prefix}{method_info.name}("
-        call += ", ".join(p["name"] for p in method_info.parameters)
-        call += ")"
+        # With the full index loaded a miss is final; don't re-analyze per target
+        entry = table.get(fqn) if full_index else _lookup_class(project_root, fqn)[0]
+        overloads = entry.overloads.get(name) if entry is not None else None
+        if entry is None or not overloads:
+            unresolved.append({"class_fqn": fqn, "method_name": name})
+            continue
+        class_info = entry.class_info
+        method_info = overloads[0]
 
-        if method_info.return_type and method_info.return_type.lower() != "void":
-            lines.append(f"        var result = {call};")
-        else:
-            lines.append(f"        {call};")
+        specs = param_specs.get(f"{fqn}#{name}", {})
+        cases, combination = _spec_cases(
+            method_info, specs if isinstance(specs, dict) else {}, max_cases, combination_strategy, strength
+        )
 
-        lines.append("")
-        lines.append("        // Assert")
-        lines.append("        // TODO: assert expected behavior for this equivalence class / boundary case")
-        lines.append("    }")
-        lines.append("")
+        group = grouped.get(fqn)
+        if group is None:
+            group = grouped[fqn] = {
+                "class_fqn": fqn,
+                "test_class_name": f"{class_info.class_name}SpecTests",
+                "test_file": str(
+                    project_root / "src" / "test" / "java" / _package_to_dir(class_info.package)
+                    / f"{class_info.class_name}SpecTests.java"
+                ),
+                "methods": [],
+                "_class_info": class_info,
+                "_body": [],
+            }
+        method_entry: Dict[str, Any] = {
+            "method_name": name,
+            "parameters": [{"name": p.name, "type": p.type} for p in method_info.parameters],
+            "test_cases": [
+                {"name": f"case_{i + 1}", "inputs": c["inputs"], "parameter_classes": c["meta"]}
+                for i, c in enumerate(cases)
+            ],
+            "combination": combination,
+        }
+        if "instruction_coverage" in target:
+            method_entry["instruction_coverage"] = target["instruction_coverage"]
+            method_entry["missed_instructions"] = target["missed_instructions"]
+        group["methods"].append(method_entry)
+        for i, case in enumerate(cases):
+            group["_body"].extend(_spec_case_lines(class_info, method_info, case, f"spec_{name}_case_{i + 1}"))
+
+    classes = []
+    for group in grouped.values():
+        class_info = group.pop("_class_info")
+        body = group.pop("_body")
+        group["junit_class"] = _spec_test_class(class_info, group["test_class_name"], body)
+        classes.append(group)
 
-    lines.append("}")
-    return pkg_line + imports + "\n".join(lines)
+    return {
+        "project_root": str(project_root),
+        "classes": classes,
+        "unresolved": unresolved,
+        "num_methods": sum(len(c["methods"]) for c in classes),
+    }
 
 
 ############### MCP ###################
@@ -1489,24 +5084,88 @@ mcp = FastMCP("software-tester")
 
 
 
-########### Test Gen Tools #########
+########### Test Gen Tools #########
+@mcp.tool()
+def analyze_java_project(
+    project_root: str,
+    use_cache: bool = True,
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> Dict[str, Any]:
+    """
+    Analyze a Java project and return classes and method signatures.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root folder (contains src/main/java), or the
+        root of a multi-module Maven reactor: modules are discovered from the
+        pom.xml <modules> tree and only their src/main/java is analyzed.
+    use_cache : bool, default True
+        Reuse parse results for unchanged files from <project_root>/.test-agent/
+        (one cache file per reactor module).
+    workers : int, default 1
+        Number of parser processes for files that are not cached. 1 parses
+        in-process, 0 uses one process per CPU. Cache misses of all modules
+        share one pool.
+    chunk_size : int, default 64
+        Number of files handed to a worker per batch.
+
+    Returns
+    -------
+    dict
+        Summary counts and a list of classes with their method signatures;
+        for a reactor also "modules": [{"module", "num_java_files", "num_classes"}].
+    """
+    root = Path(project_root).expanduser().resolve()
+    return _analyze_project_internal(root, use_cache=use_cache, workers=workers, chunk_size=chunk_size)
+
 @mcp.tool()
-def analyze_java_project(project_root: str) -> Dict[str, Any]:
+def analyze_java_project_incremental(
+    project_root: str,
+    base_ref: str = "",
+    workers: int = 1,
+) -> Dict[str, Any]:
     """
-    Analyze a Java project and return classes and method signatures.
+    Incrementally analyze a Java project: only .java files reported as changed
+    by git (`git diff --name-only`, `git status`) are re-parsed and merged into
+    the index from the previous call.
 
     Parameters
     ----------
     project_root : str
-        Path to the Java project root folder (contains src/main/java).
+        Path to the Java project root folder (inside a git repository).
+    base_ref : str, optional
+        Commit/branch to compute the method delta against. Defaults to the
+        commit recorded by the previous analysis snapshot.
+    workers : int, default 1
+        Number of parser processes for files that need re-parsing.
 
     Returns
     -------
     dict
-        Summary counts and a list of classes with their method signatures.
+        The same fields as analyze_java_project, plus
+        {
+          "incremental": {
+            "mode": "full" | "incremental",
+            "missing_snapshot_commit": str,  # only when the previous snapshot's
+                                             # commit is gone and a full analysis replaced it
+            "base": Optional[str],
+            "head": Optional[str],
+            "reparsed_files": [ str, ... ],
+            "changed_files": [ str, ... ],
+            "delta": {
+              "classes_added": [ str, ... ],
+              "classes_removed": [ str, ... ],
+              "methods_added": [ { "class_fqn": str, "signature": str }, ... ],
+              "methods_removed": [ { "class_fqn": str, "signature": str }, ... ],
+              "methods_changed": [ { "class_fqn": str, "signature": str, "before": {...}, "after": {...} }, ... ]
+            }
+          }
+        }
     """
     root = Path(project_root).expanduser().resolve()
-    return _analyze_project_internal(root)
+    return _analyze_project_incremental(root, base_ref=base_ref, workers=workers)
 
 @mcp.tool()
 def generate_junit_tests(
@@ -1516,17 +5175,23 @@ def generate_junit_tests(
     """
     Generate JUnit 5 test skeletons based on public method signatures.
 
+    Public signatures are fingerprinted per class (stored in .test-agent/), so
+    a skeleton is only rebuilt and written when they change; classes with
+    unchanged signatures cost no file I/O.
+
     Parameters
     ----------
     project_root : str
         Path to the Java project root folder.
     overwrite : bool, default False
-        If false, existing *Test.java files are not overwritten.
+        If false, hand-written or hand-edited *Test.java files are not overwritten.
 
     Returns
     -------
     dict
-        Paths of generated and skipped test files, plus a small analysis summary.
+        Paths of generated and skipped test files, a per-class status
+        ("generated", "regenerated", "unchanged", "stale", "skipped") with
+        counts, plus a small analysis summary.
     """
     root = Path(project_root).expanduser().resolve()
     return _generate_tests_internal(root, overwrite=overwrite)
@@ -1535,6 +5200,13 @@ def generate_junit_tests(
 def run_maven_tests(
     project_root: str,
     goal: str = "test",
+    tests: Optional[List[str]] = None,
+    modules: Optional[List[str]] = None,
+    affected_only: bool = False,
+    base_ref: str = "",
+    backend: str = "",
+    include_output: bool = False,
+    shards: int = 0,
 ) -> Dict[str, Any]:
     """
     Run Maven tests in the given project and parse the results.
@@ -1545,14 +5217,51 @@ def run_maven_tests(
         Path to the Java project root folder (contains pom.xml).
     goal : str, default "test"
         Maven goal to run (e.g., "test", "verify").
+    tests : list of str, optional
+        Test classes or methods to run, passed as -Dtest (e.g. "PriceTest",
+        "PriceTest#testCompare"). Runs the whole suite when omitted.
+    modules : list of str, optional
+        Reactor modules to build, passed as -pl.
+    affected_only : bool, default False
+        Add the tests affected by changed files (git diff against base_ref)
+        to the selection: changed test classes, and FooTest, FooTests,
+        FooTestCase, FooIT and TestFoo for a changed class Foo. Nothing is run
+        if no tests are affected.
+    base_ref : str, optional
+        Commit to diff against for affected_only (default HEAD, i.e. uncommitted changes).
+    backend : str, optional
+        Execution backend: "cold" (a fresh `mvn` per call) or "mvnd" (warm
+        Maven Daemon). Defaults to $TEST_AGENT_MAVEN_BACKEND, else "cold".
+    include_output : bool, default False
+        Also return the complete build output as "stdout". By default only a
+        build summary, the last lines and the path of the full log are returned.
+    shards : int, default 0
+        With shards > 1 (goal "test" only), compile once and then run the test
+        classes as that many concurrent `mvn test -Dtest=...` processes, balanced by
+        the durations recorded in the previous Surefire reports. Each shard
+        writes its own reports (kept in target/surefire-shards/shard-<i>/) and
+        JaCoCo data (target/jacoco-shard<i>.exec).
 
     Returns
     -------
     dict
-        Maven exit code/output and structured test results parsed from Surefire reports.
+        Maven exit code, a structured build summary ("build": module results,
+        test failures, BUILD SUCCESS/FAILURE), "output_tail", "log_file" and
+        structured test results parsed from Surefire reports. Sharded runs
+        add "sharding" (balance and wall time) and per-shard "shards".
     """
     root = Path(project_root).expanduser().resolve()
-    return _run_maven_and_parse(root, goal=goal)
+    return _run_maven_and_parse(
+        root,
+        goal=goal,
+        tests=tests,
+        modules=modules,
+        affected_only=affected_only,
+        base_ref=base_ref,
+        backend=backend,
+        include_output=include_output,
+        shards=shards,
+    )
 
 @mcp.tool()
 def analyze_coverage(
@@ -1574,6 +5283,7 @@ def analyze_coverage(
     dict
         {
           "report_file": ".../jacoco.xml",
+          "snapshot_id": str,  # stored coverage snapshot, see coverage_delta
           "classes": [
              {
                "package": "main.price",
@@ -1606,14 +5316,290 @@ def analyze_coverage(
         }
     """
     root = Path(project_root).expanduser().resolve()
-    xml_path = _find_jacoco_xml(root)
-    if xml_path is None:
+    reports = _find_jacoco_reports(root)
+    if not reports:
+        return {
+            "error": f"Could not find jacoco.xml under {root}. "
+                     "Make sure you ran `mvn test` or `mvn verify` with the JaCoCo plugin enabled."
+        }
+
+    result = _analyze_coverage_internal(reports, min_coverage=min_coverage)
+    # Keep a compact snapshot so later runs can be compared with coverage_delta
+    try:
+        result["snapshot_id"] = _record_coverage_snapshot(root, reports)["snapshot"]["snapshot_id"]
+    except sqlite3.Error as e:
+        result["snapshot_error"] = str(e)
+    return result
+
+@mcp.tool()
+def plan_next_targets(
+    project_root: str,
+    top_k: int = 10,
+    budget: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Pick the methods to test next so the next build cycle buys the most coverage.
+
+    Methods from the JaCoCo report are ranked by expected gain per effort:
+    gain = missed instructions + 2 * missed branches; cost grows with the
+    number of uncovered line ranges and with method size.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root (directory containing target/).
+    top_k : int, default 10
+        Maximum number of targets to return.
+    budget : float, default 0
+        Maximum summed cost of the returned targets (a method with one
+        uncovered range and ~30 instructions costs ~2.7); 0 means no budget.
+
+    Returns
+    -------
+    dict
+        {
+          "targets": [
+            {
+              "class_fqn": str,
+              "method_name": str,
+              "descriptor": str,
+              "line": int,
+              "spec_target": "<class_fqn>#<method_name>",  # for generate_spec_based_tests_batch
+              "instruction_coverage": float,
+              "missed_instructions": int,
+              "missed_branches": int,
+              "uncovered_line_ranges": [ (int, int), ... ],
+              "gain": float,
+              "cost": float,
+              "score": float
+            },
+            ...
+          ],
+          "planned_gain": float,
+          "planned_cost": float,
+          "total_missed_gain": float,
+          "gain_share": float,
+          "num_candidates": int
+        }
+    """
+    root = Path(project_root).expanduser().resolve()
+    reports = _find_jacoco_reports(root)
+    if not reports:
+        return {
+            "error": f"Could not find jacoco.xml under {root}. "
+                     "Make sure you ran `mvn test` or `mvn verify` with the JaCoCo plugin enabled."
+        }
+
+    return _plan_next_targets_internal(reports, top_k=top_k, budget=budget)
+
+@mcp.tool()
+def snapshot_coverage(project_root: str, snapshot_id: str = "") -> Dict[str, Any]:
+    """
+    Store a compact snapshot of the current JaCoCo coverage (per-method
+    counters and per-file line bitmaps) in <project_root>/.test-agent/.
+
+    analyze_coverage records one automatically; use this to name a snapshot
+    (e.g. "before-refactor").
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root (directory containing target/).
+    snapshot_id : str, optional
+        Name for the snapshot (replaces an existing snapshot of that name).
+        By default "<commit>.<n>", and an unchanged report is not stored twice.
+
+    Returns
+    -------
+    dict
+        {"created": bool,
+         "snapshot": {"snapshot_id", "created_at", "git_commit", "run_id",
+                      "instruction_ratio", "instructions_covered", "branches_covered"}}
+    """
+    root = Path(project_root).expanduser().resolve()
+    reports = _find_jacoco_reports(root)
+    if not reports:
         return {
             "error": f"Could not find jacoco.xml under {root}. "
                      "Make sure you ran `mvn test` or `mvn verify` with the JaCoCo plugin enabled."
         }
+    return _record_coverage_snapshot(root, reports, snapshot_id)
+
+@mcp.tool()
+def coverage_delta(
+    project_root: str,
+    base: str = "previous",
+    head: str = "latest",
+    max_methods: int = 200,
+) -> Dict[str, Any]:
+    """
+    Methods and lines whose coverage changed between two coverage snapshots.
+
+    Computed from the stored snapshots only; no JaCoCo report is parsed.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    base, head : str
+        Snapshots to compare: "latest", "previous", a snapshot ID, a git
+        commit (prefix) or "run:<test-history run id>". Defaults compare the
+        two most recent snapshots.
+    max_methods : int, default 200
+        Maximum number of changed methods returned (largest change first).
+
+    Returns
+    -------
+    dict
+        {
+          "base": {...snapshot...}, "head": {...snapshot...},
+          "summary": {"instruction_ratio_delta", "instructions_covered_delta",
+                      "branches_covered_delta", "methods_changed",
+                      "lines_newly_covered", "lines_newly_uncovered"},
+          "methods": [
+            {"class_fqn", "method", "descriptor", "line",
+             "status": "changed" | "added" | "removed",
+             "before": {"instructions": [missed, covered], "branches": [...], "lines": [...]} | None,
+             "after": {...} | None,
+             "instructions_covered_delta": int},
+            ...
+          ],
+          "methods_truncated": bool,
+          "lines": [{"module", "package", "source_file", "newly_covered": [(first, last), ...],
+                     "newly_uncovered": [(first, last), ...]}, ...],
+          "seconds": float
+        }
+    """
+    root = Path(project_root).expanduser().resolve()
+    return _coverage_delta_internal(root, base=base, head=head, max_methods=max_methods)
+
+########### Test History Tools #############
+def _history_runs_recorded(project_root: Path) -> int:
+    rows = _history_query(project_root, "SELECT COUNT(*) AS n FROM runs", ())
+    return rows[0]["n"] if rows else 0
+
+@mcp.tool()
+def slowest_tests(project_root: str, limit: int = 20, last_runs: int = 10) -> Dict[str, Any]:
+    """
+    Slowest tests by average duration over the most recent recorded runs.
+
+    Every run_maven_tests / auto_test_and_commit run is recorded in
+    <project_root>/.test-agent/test-history.sqlite; nothing is executed here.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    limit : int, default 20
+        Number of tests to return.
+    last_runs : int, default 10
+        How many of the latest runs to consider.
+
+    Returns
+    -------
+    dict
+        {"runs_recorded": int,
+         "tests": [{"class_name", "test_name", "runs", "avg_seconds", "max_seconds"}, ...]}
+    """
+    root = Path(project_root).expanduser().resolve()
+    return {
+        "runs_recorded": _history_runs_recorded(root),
+        "tests": _slowest_tests_internal(root, limit=limit, last_runs=last_runs),
+    }
+
+@mcp.tool()
+def flaky_tests(project_root: str, last_runs: int = 20, min_flips: int = 1) -> Dict[str, Any]:
+    """
+    Tests that flipped between passing and failing across recent runs.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    last_runs : int, default 20
+        How many of the latest recorded runs to consider.
+    min_flips : int, default 1
+        Minimum number of pass/fail transitions (skipped runs are ignored).
+
+    Returns
+    -------
+    dict
+        {"runs_recorded": int,
+         "tests": [{"class_name", "test_name", "runs", "passes", "fails", "flips",
+                    "last_failed_run", "failure_signatures"}, ...]}
+    """
+    root = Path(project_root).expanduser().resolve()
+    return {
+        "runs_recorded": _history_runs_recorded(root),
+        "tests": _flaky_tests_internal(root, last_runs=last_runs, min_flips=min_flips),
+    }
+
+@mcp.tool()
+def test_duration_regressions(
+    project_root: str,
+    recent_runs: int = 3,
+    baseline_runs: int = 20,
+    min_ratio: float = 1.5,
+    min_seconds: float = 0.1,
+) -> Dict[str, Any]:
+    """
+    Passing tests that got slower: average duration over the latest runs
+    compared with the runs before them.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    recent_runs : int, default 3
+        Latest runs forming the "now" window.
+    baseline_runs : int, default 20
+        Runs before that forming the baseline window.
+    min_ratio : float, default 1.5
+        Minimum recent / baseline duration ratio.
+    min_seconds : float, default 0.1
+        Minimum absolute slowdown in seconds, to ignore noise on fast tests.
+
+    Returns
+    -------
+    dict
+        {"runs_recorded": int,
+         "tests": [{"class_name", "test_name", "baseline_seconds", "recent_seconds", "ratio"}, ...]}
+    """
+    root = Path(project_root).expanduser().resolve()
+    return {
+        "runs_recorded": _history_runs_recorded(root),
+        "tests": _duration_regressions_internal(
+            root, recent_runs=recent_runs, baseline_runs=baseline_runs, min_ratio=min_ratio, min_seconds=min_seconds
+        ),
+    }
+
+@mcp.tool()
+def test_class_trend(project_root: str, class_name: str, last_runs: int = 20) -> Dict[str, Any]:
+    """
+    Per-run results of one test class: test count, failures, errors,
+    skipped and total duration, oldest run first.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    class_name : str
+        Test class, fully qualified or simple name (e.g. "PriceTest").
+    last_runs : int, default 20
+        How many of the latest recorded runs to consider.
 
-    return _analyze_coverage_internal(xml_path, min_coverage=min_coverage)
+    Returns
+    -------
+    dict
+        {"runs_recorded": int,
+         "trend": [{"run_id", "started_at", "git_commit", "class_name", "tests",
+                    "failures", "errors", "skipped", "seconds"}, ...]}
+    """
+    root = Path(project_root).expanduser().resolve()
+    return {
+        "runs_recorded": _history_runs_recorded(root),
+        "trend": _class_trend_internal(root, class_name, last_runs=last_runs),
+    }
 
 ########### Git Tools #############
 @mcp.tool()
@@ -1775,6 +5761,8 @@ def auto_test_and_commit(
     message: str,
     coverage_threshold: float = 0.8,
     maven_goal: str = "test",
+    backend: str = "",
+    fail_fast: bool = False,
 ) -> Dict[str, Any]:
     """
     Run Maven tests, ensure coverage meets a threshold, and if so
@@ -1783,9 +5771,178 @@ def auto_test_and_commit(
     If the current branch is protected (main/master), a new
     test-improvement/<timestamp> branch is created and checked out
     before committing, so branch protection rules are respected.
+
+    `backend` selects the Maven execution backend ("cold" or "mvnd"),
+    as for run_maven_tests.
+
+    With `fail_fast`, the tests that failed last time and the tests affected
+    by uncommitted changes run first and a failure there ends the pipeline
+    before the full suite runs; every run stops at its first failing test.
+    The test result then carries "fail_fast" with the phase that produced
+    it ("priority" or "full") and the prioritized tests.
+    """
+    root = Path(repository_path).expanduser().resolve()
+    return _auto_test_and_commit_internal(root, message, coverage_threshold, maven_goal, backend, fail_fast=fail_fast)
+
+
+########### Background Job Tools #############
+@mcp.tool()
+async def start_maven_tests(
+    project_root: str,
+    goal: str = "test",
+    tests: Optional[List[str]] = None,
+    modules: Optional[List[str]] = None,
+    affected_only: bool = False,
+    base_ref: str = "",
+    backend: str = "",
+) -> Dict[str, Any]:
+    """
+    Start run_maven_tests as a background job and return immediately.
+
+    Takes the same parameters as run_maven_tests. Use job_status / job_output
+    to follow the build and cancel_job to stop it; the server keeps answering
+    other tool calls while the build runs.
+
+    Returns
+    -------
+    dict
+        { "job_id": str, "status": "running", ... }
+    """
+    root = Path(project_root).expanduser().resolve()
+    job = _start_job(
+        "maven_tests",
+        root,
+        lambda j: _maven_job_work(j, root, goal, tests, modules, affected_only, base_ref, backend),
+    )
+    return job.summary()
+
+
+@mcp.tool()
+async def start_auto_test_and_commit(
+    repository_path: str,
+    message: str,
+    coverage_threshold: float = 0.8,
+    maven_goal: str = "test",
+    backend: str = "",
+    fail_fast: bool = False,
+) -> Dict[str, Any]:
+    """
+    Start auto_test_and_commit as a background job and return its job ID.
+
+    The Maven build runs as a non-blocking subprocess; coverage checks,
+    staging and commit follow once it finishes. The job result has the same
+    shape as auto_test_and_commit's return value, and `fail_fast` works the
+    same way.
     """
     root = Path(repository_path).expanduser().resolve()
-    return _auto_test_and_commit_internal(root, message, coverage_threshold, maven_goal)
+    job = _start_job(
+        "auto_test_and_commit",
+        root,
+        lambda j: _auto_test_job_work(j, root, message, coverage_threshold, maven_goal, backend, fail_fast),
+    )
+    return job.summary()
+
+
+@mcp.tool()
+def job_status(job_id: str) -> Dict[str, Any]:
+    """
+    Return the state of a background job, plus its result once finished.
+
+    Returns
+    -------
+    dict
+        {
+          "job_id": str,
+          "kind": str,
+          "status": "running" | "succeeded" | "failed" | "cancelled",
+          "elapsed_seconds": float,
+          "output_lines": int,
+          "result": Optional[dict]
+        }
+    """
+    job = _JOBS.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'."}
+    status = job.summary()
+    status["result"] = job.result
+    return status
+
+
+@mcp.tool()
+def job_output(job_id: str, offset: int = 0, max_lines: int = _JOB_OUTPUT_LIMIT) -> Dict[str, Any]:
+    """
+    Stream a background job's build output incrementally.
+
+    Parameters
+    ----------
+    job_id : str
+        ID returned by a start_* tool.
+    offset : int, default 0
+        Index of the first line to return; pass back `next_offset` to continue.
+    max_lines : int, default 200
+        Maximum number of lines returned per call.
+
+    Only the most recent lines are buffered in memory; if `offset` points at
+    lines that were already dropped, `truncated` is true and the full output
+    is in `log_file`.
+
+    Returns
+    -------
+    dict
+        {
+          "lines": [ str, ... ],
+          "next_offset": int,
+          "truncated": bool,
+          "log_file": Optional[str],
+          "status": str,
+          "done": bool
+        }
+    """
+    job = _JOBS.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'."}
+    if job.collector is None:
+        lines, next_offset, truncated = [], max(0, offset), False
+    else:
+        lines, next_offset, truncated = job.collector.lines_since(max(0, offset), max_lines)
+    return {
+        "job_id": job_id,
+        "lines": lines,
+        "next_offset": next_offset,
+        "truncated": truncated,
+        "log_file": str(job.collector.log_path) if job.collector is not None else None,
+        "status": job.status,
+        "done": job.status != "running",
+    }
+
+
+@mcp.tool()
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """
+    Cancel a running background job, killing its Maven process. An
+    auto-test-and-commit job that already started creating the branch,
+    staging or committing is not cancelled (the result says so).
+    """
+    job = _JOBS.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'."}
+    if job.status == "running" and job.task is not None:
+        if not job.request_cancel():
+            return dict(job.summary(), error="The job is already staging and committing; it was not cancelled.")
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+    return job.summary()
+
+
+@mcp.tool()
+def list_jobs() -> Dict[str, Any]:
+    """
+    List all background jobs started in this server session.
+    """
+    return {"jobs": [job.summary() for job in _JOBS.values()]}
 
 
 @mcp.tool()
@@ -1795,6 +5952,8 @@ def generate_spec_based_tests(
     method_name: str,
     parameter_specs_json: str = "",
     max_cases: int = 20,
+    combination_strategy: str = "nwise",
+    strength: int = 2,
 ) -> Dict[str, Any]:
     """
     Specification-Based Testing Generator (extension tool).
@@ -1837,6 +5996,14 @@ def generate_spec_based_tests(
         If omitted or invalid, generic equivalence classes are used.
     max_cases : int, default 20
         Maximum number of combined test cases to generate.
+    combination_strategy : str, default "nwise"
+        How per-parameter values are combined into cases:
+        "nwise" builds a covering array in which every combination of values
+        of any `strength` parameters appears in some case (pairwise by
+        default), with far fewer cases than the full product;
+        "cartesian" enumerates the full product in order, truncated at max_cases.
+    strength : int, default 2
+        Interaction strength t for "nwise" (2 = pairwise, 3 = all triples, ...).
 
     Returns
     -------
@@ -1845,7 +6012,8 @@ def generate_spec_based_tests(
           "target": {
             "class_fqn": str,
             "method_name": str,
-            "parameters": [ { "name": str, "type": str }, ... ]
+            "parameters": [ { "name": str, "type": str }, ... ],
+            "resolved_via": "symbol_table" | "direct" | "full_analysis"
           },
           "test_cases": [
             {
@@ -1857,6 +6025,13 @@ def generate_spec_based_tests(
             },
             ...
           ],
+          "combination": {
+            "strategy": str,
+            "cases": int,
+            "strength": int,         # nwise only
+            "tuples_total": int,     # nwise only
+            "tuples_covered": int    # nwise only; < tuples_total if max_cases was too small
+          },
           "junit_snippet": str,
           "example_usage": str
         }
@@ -1900,11 +6075,14 @@ def generate_spec_based_tests(
     else:
         parse_error = None
 
+    if combination_strategy not in _COMBINATION_STRATEGIES:
+        return {"error": f"Unknown combination_strategy '{combination_strategy}'. Use one of: {', '.join(_COMBINATION_STRATEGIES)}."}
+
     # Generate value sets per parameter
     param_sets = _generate_param_value_sets(method_info, param_specs)
 
-    # Cartesian combinations -> candidate test cases
-    combos = _cartesian_combinations(param_sets, max_cases=max_cases)
+    # Combine them into candidate test cases
+    combos, combination = _combine_param_sets(param_sets, combination_strategy, strength, max_cases)
 
     test_cases: List[Dict[str, Any]] = []
     for idx, combo in enumerate(combos):
@@ -1933,14 +6111,114 @@ def generate_spec_based_tests(
         "target": {
             "class_fqn": class_fqn,
             "method_name": method_name,
-            "parameters": method_info.parameters,
+            "parameters": [{"name": p.name, "type": p.type} for p in method_info.parameters],
+            "resolved_via": resolved["resolved_via"],
         },
         "test_cases": test_cases,
+        "combination": combination,
         "junit_snippet": junit_snippet,
         "example_usage": example_usage,
         "parameter_specs_parse_error": parse_error,
     }
 
 
+@mcp.tool()
+def generate_spec_based_tests_batch(
+    project_root: str,
+    targets: Optional[List[str]] = None,
+    below_coverage: Optional[float] = None,
+    parameter_specs_json: str = "",
+    max_cases: int = 20,
+    max_methods: int = 50,
+    combination_strategy: str = "nwise",
+    strength: int = 2,
+) -> Dict[str, Any]:
+    """
+    Batch version of generate_spec_based_tests: BVA/equivalence-class test
+    cases for many methods in one call, grouped into one *SpecTests class per
+    target class.
+
+    Parameters
+    ----------
+    project_root : str
+        Path to the Java project root.
+    targets : list of str, optional
+        Methods as "<class_fqn>#<method_name>", e.g. "main.price.Price#applyDiscount".
+    below_coverage : float, optional
+        Instead of (or in addition to) `targets`, select every method whose
+        instruction coverage in the JaCoCo report is below this ratio
+        (e.g. 0.5), most missed instructions first.
+    parameter_specs_json : str, optional
+        JSON object mapping "<class_fqn>#<method_name>" to that method's
+        parameter specs (same format as generate_spec_based_tests).
+    max_cases : int, default 20
+        Maximum number of combined test cases per method.
+    max_methods : int, default 50
+        Maximum number of methods taken from the coverage report.
+    combination_strategy : str, default "nwise"
+        How parameter values are combined, as in generate_spec_based_tests.
+    strength : int, default 2
+        Interaction strength t for "nwise".
+
+    Returns
+    -------
+    dict
+        {
+          "classes": [
+            {
+              "class_fqn": str,
+              "test_class_name": str,       # "<Class>SpecTests"
+              "test_file": str,             # suggested path, not written
+              "methods": [
+                {
+                  "method_name": str,
+                  "parameters": [ { "name": str, "type": str }, ... ],
+                  "test_cases": [ { "name": str, "inputs": {...}, "parameter_classes": {...} }, ... ],
+                  "combination": { "strategy": str, "cases": int, ... },
+                  "instruction_coverage": float,   # coverage-selected targets only
+                  "missed_instructions": int
+                },
+                ...
+              ],
+              "junit_class": str            # complete test class source
+            },
+            ...
+          ],
+          "unresolved": [ { "class_fqn": str, "method_name": str }, ... ],
+          "num_methods": int
+        }
+    """
+    root = Path(project_root).expanduser().resolve()
+
+    selected: List[Dict[str, Any]] = []
+    for t in targets or []:
+        fqn, sep, name = t.partition("#")
+        if not sep or not fqn or not name:
+            return {"error": f"Invalid target '{t}'; expected '<class_fqn>#<method_name>'."}
+        selected.append({"class_fqn": fqn, "method_name": name})
+
+    if below_coverage is not None:
+        low, error = _low_coverage_targets(root, below_coverage, max_methods)
+        if error is not None:
+            return {"error": error}
+        selected.extend(low)
+
+    if not selected:
+        return {"error": "No targets: pass `targets` and/or `below_coverage`."}
+    if combination_strategy not in _COMBINATION_STRATEGIES:
+        return {"error": f"Unknown combination_strategy '{combination_strategy}'. Use one of: {', '.join(_COMBINATION_STRATEGIES)}."}
+
+    param_specs: Dict[str, Any] = {}
+    if parameter_specs_json.strip():
+        try:
+            param_specs = json.loads(parameter_specs_json)
+        except ValueError as e:
+            return {"error": f"Invalid parameter_specs_json: {e}"}
+        if not isinstance(param_specs, dict):
+            return {"error": "parameter_specs_json must be a JSON object keyed by '<class_fqn>#<method_name>'."}
+
+    return _generate_spec_batch_internal(root, selected, param_specs, max_cases, combination_strategy, strength)
+
+
 if __name__ == "__main__":
     mcp.run(transport="sse")
\ No newline at end of file